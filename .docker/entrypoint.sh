@@ -18,5 +18,11 @@ if [ ! -f '/var/ksi-be/db.sqlite' ]; then
   echo "Database created" || { echo "ERR: Cannot start the DB"; exit 1; }
 fi
 
+# start the evaluation queue worker
+sudo -Hu ksi bash -c 'source ksi-py3-venv/bin/activate && python eval_worker.py' &
+
+# start the e-mail sender
+sudo -Hu ksi bash -c 'source ksi-py3-venv/bin/activate && python mail_sender.py' &
+
 # start the server
 sudo -Hu ksi bash -c 'source ksi-py3-venv/bin/activate && gunicorn -c gunicorn_cfg.py app:api'
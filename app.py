@@ -1,16 +1,13 @@
 import copy
 import falcon
-import json
 import os
-import shutil
 import subprocess
 import sys
+import time
 import traceback
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import func
 
-import model
 import endpoint
 import util
 from db import engine, session
@@ -19,10 +16,6 @@ from util import UserInfo
 # sets CORS header to *, applied when running in a docker container
 DISABLE_CORS = False
 
-# Cache of the current year.
-c_year = None
-c_year_update = None
-
 
 class JSONTranslator(object):
 
@@ -33,12 +26,70 @@ class JSONTranslator(object):
         if 'result' not in req.context:
             return
 
-        resp.body = json.dumps(
+        resp.data = util.serializer.dumps(
             req.context['result'],
-            sort_keys=True,
-            indent=4,
-            ensure_ascii=False,
+            pretty=req.get_param('pretty') in ('true', '1'),
         )
+        resp.body = None
+
+
+class Compressor(object):
+
+    # Compresses in-memory response bodies, see util/compression.py
+    def process_response(self, req, resp, resource):
+        if resp.stream is not None or resp.get_header('Content-Encoding'):
+            return
+
+        data = resp.data
+        if data is None and resp.body is not None:
+            data = resp.body.encode('utf-8')
+        if data is None or len(data) < util.compression.MIN_SIZE:
+            return
+
+        resp.append_header('Vary', 'Accept-Encoding')
+        encoding = util.compression.choose_encoding(
+            req.get_header('Accept-Encoding'))
+        if encoding is None:
+            return
+
+        resp.data = util.compression.compress(data, encoding)
+        resp.body = None
+        resp.set_header('Content-Encoding', encoding)
+
+
+class DBSession(object):
+
+    # Session of the request is thrown away at the end of every request
+    # (db.session is a scoped_session), connection returns to the pool.
+    def process_request(self, req, resp):
+        return
+
+    def process_response(self, req, resp, resource):
+        session.remove()
+
+
+class SQLProfiler(object):
+
+    # Counts SQL queries of the request, see util/sql_profiler.py
+    def process_request(self, req, resp):
+        util.sql_profiler.start()
+
+    def process_response(self, req, resp, resource):
+        stats = util.sql_profiler.stop()
+        if stats is None:
+            return
+
+        total_time = time.monotonic() - stats.started
+        resp.set_header('X-DB-Queries', str(stats.queries))
+        resp.set_header('Server-Timing',
+                        'db;dur=%.1f, total;dur=%.1f' %
+                        (stats.db_time * 1000, total_time * 1000))
+
+        route = '%s %s' % (req.method, type(resource).__name__
+                           if resource is not None else 'sink')
+        util.sql_profiler.record(route, stats, total_time)
+        if util.sql_profiler.is_slow(stats):
+            util.sql_profiler.log_slow(req.method, req.relative_uri, stats)
 
 
 class Authorizer(object):
@@ -47,7 +98,7 @@ class Authorizer(object):
         if req.auth:
             token_str = req.auth.split(' ')[-1]
             try:
-                token = session.query(model.Token).get(token_str)
+                token = util.auth.lookup_token(token_str)
 
                 if token is not None:
                     if (req.relative_uri != '/auth' and
@@ -56,14 +107,10 @@ class Authorizer(object):
                         req.context['user'] = UserInfo()
                         return
 
-                    try:
-                        req.context['user'] = UserInfo(
-                            session.query(model.User).get(token.user),
-                            token_str
-                        )
-                        return
-                    except AttributeError:
-                        pass
+                    req.context['user'] = UserInfo(user_id=token.user_id,
+                                                   role=token.role,
+                                                   token=token_str)
+                    return
             except:
                 session.rollback()
 
@@ -72,37 +119,19 @@ class Authorizer(object):
 
 class Year_fill(object):
 
-    # This middleware has 2 purposes:
-    #  1) Get current year.
-    #  2) Test connection with db. (this is very important!)
+    # Get current year (cached in util.year). Stale connections are detected
+    # by pool pre-ping (see db.py).
     def process_request(self, req, resp):
         if req.method == 'OPTIONS':
             return
-        try:
-            if ('YEAR' in req.headers):
-                req.context['year'] = req.headers['YEAR']
-                req.context['year_obj'] = session.query(model.Year).\
-                                          get(req.context['year'])
-            else:
-                year_obj = session.query(model.Year).\
-                           order_by(desc(model.Year.id)).first()
-                req.context['year_obj'] = year_obj
-                req.context['year'] = year_obj.id
-        except SQLAlchemyError:
-            session.rollback()
-            try:
-                if ('YEAR' in req.headers):
-                    req.context['year'] = req.headers['YEAR']
-                    req.context['year_obj'] = session.query(model.Year).\
-                                              get(req.context['year'])
-                else:
-                    year_obj = session.query(model.Year).\
-                               order_by(desc(model.Year.id)).first()
-                    req.context['year_obj'] = year_obj
-                    req.context['year'] = year_obj.id
-            except:
-                session.rollback()
-                raise
+
+        if ('YEAR' in req.headers):
+            req.context['year'] = req.headers['YEAR']
+            req.context['year_obj'] = util.year.get(req.context['year'])
+        else:
+            year_obj = util.year.current()
+            req.context['year_obj'] = year_obj
+            req.context['year'] = year_obj.id
 
 
 class AddCORS:
@@ -178,8 +207,10 @@ def error_handler(ex, req, resp, params):
 
 
 # Add Logger() to middleware for logging
-api = falcon.API(middleware=[JSONTranslator(), Authorizer(), Year_fill(),
-                 Corser(), AddCORS()])
+util.sql_profiler.install(engine)
+api = falcon.API(middleware=[DBSession(), SQLProfiler(), Compressor(),
+                 JSONTranslator(), Authorizer(), Year_fill(), Corser(),
+                 AddCORS()])
 api.add_error_handler(Exception, handler=error_handler)
 api.req_options.auto_parse_form_urlencoded = True
 
@@ -187,9 +218,6 @@ api.req_options.auto_parse_form_urlencoded = True
 # model.Base.metadata.create_all(engine)
 
 # Create /tmp/box with proper permissions (for sandbox)
-if os.path.isdir(util.programming.EXEC_PATH):
-    shutil.rmtree(util.programming.EXEC_PATH, ignore_errors=True)
-
 try:
     os.makedirs(util.programming.EXEC_PATH)
 except FileExistsError:
@@ -202,6 +230,9 @@ if p.returncode != 0:
     raise Exception("Cannot change umask to %s!" %
                     (util.programming.EXEC_PATH))
 
+# Initialize free sandboxes ahead of time, boxes of running workers are kept
+util.sandbox_pool.prepare()
+
 api.add_route('/robots.txt', endpoint.Robots())
 api.add_route('/csp', endpoint.CSP())
 api.add_route('/articles', endpoint.Articles())
@@ -218,6 +249,7 @@ api.add_route('/modules/{id}', endpoint.Module())
 api.add_route('/modules/{id}/submit', endpoint.ModuleSubmit())
 api.add_route('/modules/{id}/submitFiles', endpoint.ModuleSubmit())  # alias required for swagger
 api.add_route('/submFiles/{id}', endpoint.ModuleSubmittedFile())
+api.add_route('/evalJobs/{id}', endpoint.EvalJob())
 api.add_route('/threads', endpoint.Threads())
 api.add_route('/threads/{id}', endpoint.Thread())
 api.add_route('/threadDetails/{id}', endpoint.ThreadDetails())
@@ -262,6 +294,7 @@ api.add_route('/admin/corrections/{id}', endpoint.admin.Correction())
 api.add_route('/admin/correctionsInfos', endpoint.admin.CorrectionsInfo())
 api.add_route('/admin/correctionsInfos/{id}', endpoint.admin.CorrectionInfo())
 api.add_route('/admin/correctionsEmail/{id}', endpoint.admin.CorrectionsEmail())
+api.add_route('/admin/mailJobs/{id}', endpoint.admin.MailJob())
 api.add_route('/admin/corrections/{id}/publish', endpoint.admin.CorrectionsPublish())
 api.add_route('/admin/subm/eval/{eval_id}/', endpoint.admin.SubmFilesEval())
 api.add_route('/admin/subm/task/{task_id}/', endpoint.admin.SubmFilesTask())
@@ -271,12 +304,16 @@ api.add_route('/admin/atasks/{id}', endpoint.admin.Task())
 api.add_route('/admin/atasks/{id}/deploy', endpoint.admin.TaskDeploy())
 api.add_route('/admin/atasks/{id}/merge', endpoint.admin.TaskMerge())
 api.add_route('/admin/waves/{id}/diff', endpoint.admin.WaveDiff())
+api.add_route('/admin/waves/{id}/deploy', endpoint.admin.WaveDeploy())
 api.add_route('/admin/achievements/grant', endpoint.admin.AchievementGrant())
 api.add_route('/admin/user-export', endpoint.admin.UserExport())
 api.add_route('/admin/evalCodes/{id}', endpoint.admin.EvalCode())
 api.add_route('/admin/execs', endpoint.admin.Execs())
 api.add_route('/admin/execs/{id}', endpoint.admin.Exec())
 api.add_route('/admin/monitoring-dashboard', endpoint.admin.MonitoringDashboard())
+api.add_route('/admin/cache-stats', endpoint.admin.CacheStats())
+api.add_route('/admin/sql-stats', endpoint.admin.SqlStats())
+api.add_route('/admin/mail-stats', endpoint.admin.MailStats())
 api.add_route('/admin/diploma/{id}/grant', endpoint.admin.DiplomaGrant())
 
 api.add_route('/unsubscribe/{id}', endpoint.Unsubscribe())
@@ -1,24 +1,94 @@
+import threading
+import time
+
 import sqlalchemy
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.interfaces import ConnectionProxy
-import sys
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 
 import config
 
+# SQL queries are counted and profiled per request by engine event listeners,
+# see util/sql_profiler.py.
+
+# Connection pool can be tuned in config.py (ignored for sqlite)
+POOL_SIZE = getattr(config, 'SQL_POOL_SIZE', 5)
+POOL_MAX_OVERFLOW = getattr(config, 'SQL_POOL_MAX_OVERFLOW', 10)
+POOL_TIMEOUT = getattr(config, 'SQL_POOL_TIMEOUT', 30)
+POOL_PRE_PING = getattr(config, 'SQL_POOL_PRE_PING', True)
+
+
+class PoolStats(object):
+    """Time spent waiting for a free connection of the pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timeout: bool = False) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+            if timeout:
+                self.timeouts += 1
+
+    def to_json(self) -> dict:
+        pool = engine.pool
+        data = {
+            'checkouts': self.checkouts,
+            'wait_time': self.wait_time,
+            'avg_wait': (self.wait_time / self.checkouts
+                         if self.checkouts else None),
+            'max_wait': self.max_wait,
+            'timeouts': self.timeouts,
+        }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        return data
 
-# When `proxy=MyProxy()` is added to create_angine parameters
-# this proxy shows mysql requests. This could be used to
-# measure amount of SQL requests.
-class MyProxy(ConnectionProxy):
-    def cursor_execute(self, execute, cursor, statement, parameters, context,
-                       executemany):
-        print("EXECUTING " + statement[:70] + str(parameters))
-        sys.stdout.flush()
-        return execute(cursor, statement, parameters, context)
 
+pool_stats = PoolStats()
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool measuring how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record(time.monotonic() - started, timeout=True)
+            raise
+        pool_stats.record(time.monotonic() - started)
+        return conn
+
+
+_pool_args = {}
+if not config.SQL_ALCHEMY_URI.startswith('sqlite'):
+    _pool_args = {
+        'poolclass': _TimedQueuePool,
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+    }
 
 engine = sqlalchemy.create_engine(config.SQL_ALCHEMY_URI,
                                   isolation_level="READ COMMITTED",
-                                  pool_recycle=3600)
+                                  pool_recycle=3600,
+                                  pool_pre_ping=POOL_PRE_PING,
+                                  **_pool_args)
 _session = sessionmaker(bind=engine)
-session = _session()
+
+# Every thread gets its own session, DBSession middleware (app.py) removes it
+# at the end of each request, so no request inherits state (or a failed
+# transaction) of the previous one.
+session = scoped_session(_session)
@@ -3,6 +3,7 @@ from endpoint.achievement import Achievement, Achievements, AchievementSuccessfu
 from endpoint.post import Post, Posts
 from endpoint.task import Task, Tasks, TaskDetails
 from endpoint.module import Module, ModuleSubmit, ModuleSubmittedFile
+from endpoint.eval_job import EvalJob
 from endpoint.thread import Thread, Threads, ThreadDetails
 from endpoint.user import User, Users, ChangePassword, ForgottenPassword, DiscordInviteLink
 from endpoint.registration import Registration
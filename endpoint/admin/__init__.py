@@ -13,10 +13,15 @@ from endpoint.admin.task import Tasks
 from endpoint.admin.taskDeploy import TaskDeploy
 from endpoint.admin.taskMerge import TaskMerge
 from endpoint.admin.waveDiff import WaveDiff
+from endpoint.admin.waveDeploy import WaveDeploy
 from endpoint.admin.achievementGrant import AchievementGrant
 from endpoint.admin.userExport import UserExport
 from endpoint.admin.evalCode import EvalCode
 from endpoint.admin.execs import Execs
 from endpoint.admin.execs import Exec
 from endpoint.admin.monitoringDashboard import MonitoringDashboard
+from endpoint.admin.cacheStats import CacheStats
+from endpoint.admin.sqlStats import SqlStats
+from endpoint.admin.mailStats import MailStats
+from endpoint.admin.mailJob import MailJob
 from endpoint.admin.diploma import DiplomaGrant
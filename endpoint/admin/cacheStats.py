@@ -0,0 +1,25 @@
+import os
+
+import falcon
+
+import util
+
+
+class CacheStats(object):
+    """
+    Vraci statistiky in-process cache workeru, ktery pozadavek obslouzil.
+    Kazdy gunicorn worker ma vlastni cache, proto je soucasti odpovedi pid.
+    """
+
+    def on_get(self, req, resp):
+        user = req.context['user']
+
+        if (not user.is_logged_in()) or (not user.is_org()):
+            req.context['result'] = 'Nedostatecna opravneni'
+            resp.status = falcon.HTTP_400
+            return
+
+        req.context['result'] = {
+            'pid': os.getpid(),
+            'caches': util.cache.stats(),
+        }
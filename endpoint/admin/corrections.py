@@ -164,6 +164,7 @@ class Correction(object):
             evaluation.cheat = data_eval['cheat'] \
                                if 'cheat' in data_eval else False
             session.commit()
+            util.scoreboard.update_module(evaluation.user, evaluation.module)
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -388,66 +389,61 @@ class Corrections(object):
             corrections = []
             threads = []
             thr_details = []
+
+            # Vysledky dotazu rozdelime po opravenich (task, user) jednim
+            # pruchodem, aby sestaveni vystupu nebylo kvadraticke.
+            evals_by_corr = util.grouping.group_by_key(
+                corrs_evals, lambda x: (x.Task.id, x.Evaluation.user))
+            modules_by_corr = util.grouping.group_by_key(
+                corrs_modules, lambda x: (x.Task.id, x.Evaluation.user))
+            achs_by_corr = util.grouping.group_by_key(
+                corrs_achs, lambda x: (x[0], x[1]), lambda x: x[2])
+            files_by_eval = util.grouping.group_by_key(
+                files, lambda f: f.evaluation)
+            root_posts_by_thread = util.grouping.group_by_key(
+                root_posts, lambda x: x[1].id, lambda x: x[0].id)
+
             for corr in corrs_tasks:
-                evals = [
-                    x for x in corrs_evals
-                    if (x.Task.id == corr.Task.id and
-                        x.Evaluation.user == corr.Evaluation.user)
-                ]
+                corr_key = (corr.Task.id, corr.Evaluation.user)
+                evals = evals_by_corr[corr_key]
 
                 corrections.append(util.correction.to_json(
                     [
                         (evl, mod, None)
-                        for (evl, tsk, mod, thr, iscor) in [
-                            x for x in corrs_modules
-                            if (x.Task.id == corr.Task.id and
-                                x.Evaluation.user == corr.Evaluation.user)
-                        ]
+                        for (evl, tsk, mod, thr, iscor)
+                        in modules_by_corr.get(corr_key, [])
                     ],
                     [evl for (evl, tsk, mod, thr, iscor) in evals],
                     evals[0].Task.id,
                     corr.Thread.id if corr.Thread else None,
-                    [
-                        r
-                        for (a, b, r) in [
-                            task_id_user_id_a_id
-                            for task_id_user_id_a_id in corrs_achs
-                            if (task_id_user_id_a_id[0] == corr.Task.id and
-                                task_id_user_id_a_id[1] ==
-                                corr.Evaluation.user)
-                        ]
-                    ],
+                    achs_by_corr.get(corr_key, []),
                     (corr.is_corrected
                         if corr.is_corrected is not None else False),
-                    files
+                    [
+                        f
+                        for (evl, tsk, mod, thr, iscor) in evals
+                        for f in files_by_eval.get(evl.id, [])
+                    ]
                 ))
 
                 if corr.Thread:
                     threads.append(util.thread.to_json(corr.Thread, user.id))
-                    r_posts = [
-                        pst.id
-                        for (pst, thrd) in [
-                            post_thr
-                            for post_thr in root_posts
-                            if post_thr[1].id == corr.Thread.id
-                        ]
-                    ]
-
-                    thr_details.append(
-                        util.thread.details_to_json(corr.Thread, r_posts)
-                    )
+                    thr_details.append(util.thread.details_to_json(
+                        corr.Thread,
+                        root_posts_by_thread.get(corr.Thread.id, [])
+                    ))
 
             # Ziskavame last_visit jednotlivych vlaken (opet na jeden SQL
             # pozadavek).
-            last_visit = util.thread.get_user_visit(user.id, year)
-            posts = []
-            for (post, thread) in db_posts:
-                lastv = None
-                for lv in last_visit:
-                    if lv.thread == post.thread:
-                        lastv = lv
-                        break
-                posts.append(util.post.to_json(post, user.id, lastv, True))
+            last_visit = {
+                lv.thread: lv
+                for lv in util.thread.get_user_visit(user.id, year)
+            }
+            posts = [
+                util.post.to_json(post, user.id, last_visit.get(post.thread),
+                                  True)
+                for (post, thread) in db_posts
+            ]
 
             # A konecne vratime vysledek.
             req.context['result'] = {
@@ -1,3 +1,7 @@
+import functools
+from collections import namedtuple
+from typing import List
+
 import falcon
 from sqlalchemy import func, or_, and_
 from sqlalchemy.orm import aliased
@@ -8,27 +12,38 @@ import model
 import util
 
 
+# Data pro vlakna odesilajici e-maily, nesmi byt vazana na session requestu
+TaskInfo = namedtuple('TaskInfo', ['id', 'title', 'eval_comment'])
+Recipient = namedtuple('Recipient', [
+    'id', 'email', 'sex', 'points', 'post_body', 'commenter_id',
+    'commenter_name', 'solution_comment'
+])
+MailContext = namedtuple('MailContext', [
+    'ksi_web', 'backend_url', 'mail_sign', 'ksi_conf', 'author_name',
+    'author_sex'
+])
+
+
 class CorrectionsEmail(object):
 
-    def _send_single_email(self, task, participant, notify, points, post,
-                           commenter, solution_comment):
+    def _send_single_email(self, task: TaskInfo, ctx: MailContext,
+                           participant: Recipient, notify):
         body = ("<p>Ahoj,<br>opravili jsme tvé řešení úlohy " +
                 task.title + ".</p>")
 
         if participant.sex == 'female':
             body += ("<a>Získala jsi <strong>%.1f bodů</strong>."
-                     "</p>" % points)
+                     "</p>" % participant.points)
         else:
             body += ("<a>Získal jsi <strong>%.1f bodů</strong>."
-                     "</p>" % points)
+                     "</p>" % participant.points)
 
-        if post:
+        if participant.post_body is not None:
             body += ("<p><a href=\"%s\"><i>%s</i></a> komentuje "
                      "tvé řešení:</p> %s") % (
-                util.config.ksi_web() + "/profil/" +
-                str(commenter.id),
-                commenter.first_name + " " + commenter.last_name,
-                post.body
+                ctx.ksi_web + "/profil/" + str(participant.commenter_id),
+                participant.commenter_name,
+                participant.post_body
             )
         else:
             body += ("<p>K tvému řešení nebyl přidán žádný komentář.</p>")
@@ -39,34 +54,31 @@ class CorrectionsEmail(object):
             )
 
         body += ("<p>Můžeš si prohlédnout <a href=\"%s\">výsledkovku</a>, ") % (
-            util.config.ksi_web() + "#vysledky"
+            ctx.ksi_web + "#vysledky"
         )
 
-        if solution_comment:
+        if participant.solution_comment:
             body += ("podívat se na <a href=\"%s\">"
                      "vzorové řešení úlohy</a>, nebo <a href=\"%s\">"
                      "odpovědět na komentář opravujícího</a>.</p>") % (
-                util.config.ksi_web() + "/ulohy/" +
-                str(task.id) + "/reseni",
-                util.config.ksi_web() + "/ulohy/" +
-                str(task.id) + "#hodnoceni"
+                ctx.ksi_web + "/ulohy/" + str(task.id) + "/reseni",
+                ctx.ksi_web + "/ulohy/" + str(task.id) + "#hodnoceni"
             )
         else:
             body += ("nebo se podívat na <a href=\"%s\">"
                      "vzorové řešení úlohy</a>.</p>") % (
-                util.config.ksi_web() + "/ulohy/" +
-                str(task.id) + "#reseni"
+                ctx.ksi_web + "/ulohy/" + str(task.id) + "#reseni"
             )
 
-        body += util.config.mail_sign()
+        body += ctx.mail_sign
 
         unsubscribe = util.mail.Unsubscribe(
             util.mail.EMailType.EVAL,
             notify,
             participant.id,
-            commit=False, # we will commit new entries only once
-            backend_url=util.config.backend_url(),
-            ksi_web=util.config.ksi_web(),
+            commit=False,
+            backend_url=ctx.backend_url,
+            ksi_web=ctx.ksi_web,
         )
 
         util.mail.send(
@@ -77,6 +89,58 @@ class CorrectionsEmail(object):
             plaintext='' # No plaintext (pandoc is too slow for the bulk)
         )
 
+    def _send_batch(self, task: TaskInfo, ctx: MailContext,
+                    participants: List[Recipient]) -> List[str]:
+        """Odeslani davky e-mailu, bezi ve vlakne util.mail_job."""
+        ids = [participant.id for participant in participants]
+        notifies = {
+            notify.user: notify
+            for notify in session.query(model.UserNotify).
+            filter(model.UserNotify.user.in_(ids)).all()
+        }
+
+        # Nove tokeny pro odhlaseni musi byt ulozeny pred odeslanim odkazu
+        missing = [user_id for user_id in ids if user_id not in notifies]
+        for user_id in missing:
+            notifies[user_id] = util.user_notify.normalize(None, user_id)
+            session.add(notifies[user_id])
+        if missing:
+            session.commit()
+
+        errors = []
+        for participant in participants:
+            try:
+                self._send_single_email(task, ctx, participant,
+                                        notifies[participant.id])
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+    def _send_summary(self, task: TaskInfo, ctx: MailContext,
+                      job: model.MailJob) -> None:
+        """Odeslani informacniho emailu do konference."""
+        body = "<p>Úloha <a href=\"%s\">%s</a> je opravena. \
+            %s právě odeslal" \
+            % (ctx.ksi_web + "/ulohy/" + str(task.id),
+               task.title,
+               ctx.author_name)
+
+        if ctx.author_sex == "female":
+            body += "a"
+
+        body += " informační e-mail %s řešitelům.</p>" % job.sent
+
+        if task.eval_comment:
+            body += "<p>Společný komentář ke všem opravením:</p> %s" % (
+                task.eval_comment
+            )
+
+        util.mail.send(
+            ctx.ksi_conf,
+            "[Naskoc na FI] Úloha %s opravena" % task.title,
+            body
+        )
+
     def on_put(self, req, resp, id):
         """
         1) Odeslani informacniho emailu resitelum, ve kterem se pise
@@ -84,6 +148,11 @@ class CorrectionsEmail(object):
         2) Odeslani informacniho emailu do ksi konference.
         ID je id ulohy
 
+        E-maily se odesilaji na pozadi (util/mail_job.py), vraci se
+        {'count': pocet prijemcu, 'job': stav odesilani}, prubeh je na
+        /admin/mailJobs/{job.id}. Pokud se e-maily k uloze prave odesilaji,
+        vrati se probihajici odesilani a nic dalsiho se neodesle.
+
         """
         user = req.context['user']
         user_obj = user.user
@@ -111,6 +180,15 @@ class CorrectionsEmail(object):
                     }]
                 }
                 resp.status = falcon.HTTP_400
+                return
+
+            running = util.mail_job.active(task.id)
+            if running is not None:
+                req.context['result'] = {
+                    'count': running.total,
+                    'job': util.mail_job.to_json(running),
+                }
+                return
 
             points_per_module = session.query(
                 model.User.id.label('user'),
@@ -126,7 +204,6 @@ class CorrectionsEmail(object):
             commenter = aliased(model.User)
             tos = session.query(
                 participant,
-                model.UserNotify,
                 func.sum(points_per_module.c.points).label('points'),
                 model.Post,
                 commenter,
@@ -145,45 +222,42 @@ class CorrectionsEmail(object):
                 group_by(participant).\
                 all()
 
-            errors = []
-            for to in tos:
-                try:
-                    self._send_single_email(task, *to)
-                except Exception as e:
-                    errors.append(str(e))
-
-
-            session.commit()
-
-            # Odeslani informacniho emailu do konference
-            try:
-                body = "<p>Úloha <a href=\"%s\">%s</a> je opravena. \
-                    %s právě odeslal" \
-                    % (util.config.ksi_web() + "/ulohy/" + str(task.id),
-                       task.title,
-                       user_obj.first_name + " " + user_obj.last_name)
-
-                if user_obj.sex == "female":
-                    body += "a"
-
-                body += " informační e-mail %s řešitelům.</p>" % len(tos)
-
-                if task.eval_comment:
-                    body += "<p>Společný komentář ke všem opravením:</p> %s" % (
-                        task.eval_comment
-                    )
-
-                util.mail.send(
-                    util.config.ksi_conf(),
-                    "[Naskoc na FI] Úloha %s opravena" % task.title,
-                    body
+            recipients = [
+                Recipient(
+                    to_user.id, to_user.email, to_user.sex, points,
+                    post.body if post else None,
+                    to_commenter.id if to_commenter else None,
+                    (to_commenter.first_name + " " + to_commenter.last_name)
+                    if to_commenter else None,
+                    solution_comment is not None,
                 )
-            except Exception as e:
-                errors.append(str(e))
+                for to_user, points, post, to_commenter, solution_comment
+                in tos
+            ]
+            task_info = TaskInfo(task.id, task.title, task.eval_comment)
+            ctx = MailContext(
+                util.config.ksi_web(),
+                util.config.backend_url(),
+                util.config.mail_sign(),
+                util.config.ksi_conf(),
+                user_obj.first_name + " " + user_obj.last_name,
+                user_obj.sex,
+            )
 
-            req.context['result'] = {'count': len(tos)}
-            if len(errors) > 0:
-                req.context['result']['errors'] = errors
+            job, started = util.mail_job.start(
+                task.id,
+                user.id,
+                recipients,
+                functools.partial(self._send_batch, task_info, ctx),
+                functools.partial(self._send_summary, task_info, ctx),
+            )
+
+            req.context['result'] = {
+                'count': job.total,
+                'job': util.mail_job.to_json(job),
+            }
+            if started:
+                resp.status = falcon.HTTP_202
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -34,6 +34,7 @@ class CorrectionsPublish(object):
                 return
             task.evaluation_public = public
             session.commit()
+            util.scoreboard.update_task(task.id)
             req.context['result'] = {}
         except SQLAlchemyError:
             session.rollback()
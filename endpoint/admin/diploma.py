@@ -1,13 +1,13 @@
 import tempfile
 
 import falcon
-import magic
 import multipart
 from pathlib import Path
 
 from sqlalchemy.exc import SQLAlchemyError
 
 import model
+import util
 from db import session
 from shutil import move
 
@@ -73,7 +73,7 @@ class DiplomaGrant:
 
             file.save_as(tmpfile.name)
 
-            mime = magic.Magic(mime=True).from_file(tmpfile.name)
+            mime = util.mime.sniff(tmpfile.name)
 
             if mime not in ALLOWED_MIME_TYPES:
                 resp.status = falcon.HTTP_400
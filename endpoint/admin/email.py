@@ -30,7 +30,8 @@ class Email(object):
 
         Backend edpovida:
         {
-            count: Integer
+            count: Integer,
+            per_second: Float (prijemcu zarazenych do fronty za sekundu)
         }
 
         """
@@ -151,14 +152,17 @@ class Email(object):
             logger.get_log().warning(f"User #{user.id} has sent an email")
 
             try:
-                util.mail.send_multiple(
+                stats = util.mail.send_multiple(
                     recipients,
                     data['Subject'],
                     body,
                     params,
                     data['Bcc'],
                 )
-                req.context['result'] = {'count': len(tos)}
+                req.context['result'] = {
+                    'count': len(tos),
+                    'per_second': stats['per_second'],
+                }
                 session.commit()
             except Exception as e:
                 req.context['result'] = {'error': str(e)}
@@ -0,0 +1,35 @@
+import falcon
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import session
+import model
+import util
+
+
+class MailJob(object):
+
+    def on_get(self, req, resp, id):
+        """
+        Prubeh odesilani e-mailu na pozadi (viz util/mail_job.py):
+        pocet odeslanych, neuspesnych a zbyvajicich e-mailu.
+        """
+
+        try:
+            user = req.context['user']
+
+            if (not user.is_logged_in()) or (not user.is_org()):
+                req.context['result'] = 'Nedostatecna opravneni'
+                resp.status = falcon.HTTP_400
+                return
+
+            job = session.query(model.MailJob).get(id)
+            if job is None:
+                resp.status = falcon.HTTP_404
+                return
+
+            req.context['result'] = {'job': util.mail_job.to_json(job)}
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,23 @@
+import falcon
+
+import util
+
+
+class MailStats(object):
+    """
+    Stav fronty e-mailu a metriky procesu mail_sender.py
+    (viz util/mail_outbox.py).
+    """
+
+    def on_get(self, req, resp):
+        user = req.context['user']
+
+        if (not user.is_logged_in()) or (not user.is_org()):
+            req.context['result'] = 'Nedostatecna opravneni'
+            resp.status = falcon.HTTP_400
+            return
+
+        req.context['result'] = {
+            'queue': util.mail_outbox.depth(),
+            'sender': util.mail_outbox.stats(),
+        }
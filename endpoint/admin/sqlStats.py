@@ -0,0 +1,43 @@
+import os
+
+import falcon
+
+import db
+import util
+
+
+class SqlStats(object):
+    """
+    Statistiky SQL dotazu per route (viz util/sql_profiler.py) a cekani na
+    spojeni z poolu workeru, ktery pozadavek obslouzil. Kazdy gunicorn worker
+    sbira vlastni statistiky, proto je soucasti odpovedi pid.
+    """
+
+    def on_get(self, req, resp):
+        user = req.context['user']
+
+        if (not user.is_logged_in()) or (not user.is_org()):
+            req.context['result'] = 'Nedostatecna opravneni'
+            resp.status = falcon.HTTP_400
+            return
+
+        req.context['result'] = {
+            'pid': os.getpid(),
+            'thresholds': {
+                'queries': util.sql_profiler.MAX_QUERIES,
+                'db_time': util.sql_profiler.MAX_TIME,
+            },
+            'routes': util.sql_profiler.route_stats(),
+            'pool': db.pool_stats.to_json(),
+        }
+
+    def on_delete(self, req, resp):
+        user = req.context['user']
+
+        if (not user.is_logged_in()) or (not user.is_admin()):
+            req.context['result'] = 'Nedostatecna opravneni'
+            resp.status = falcon.HTTP_400
+            return
+
+        util.sql_profiler.reset()
+        req.context['result'] = {}
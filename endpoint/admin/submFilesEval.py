@@ -1,7 +1,5 @@
 import falcon
 from sqlalchemy.exc import SQLAlchemyError
-from zipfile import ZipFile
-from io import BytesIO
 import os
 
 from db import session
@@ -21,9 +19,6 @@ class SubmFilesEval(object):
                 resp.status = falcon.HTTP_400
                 return
 
-            inMemoryOutputFile = BytesIO()
-            zipFile = ZipFile(inMemoryOutputFile, 'w')
-
             files = [
                 r for (r, ) in
                 session.query(model.SubmittedFile.path).
@@ -31,19 +26,12 @@ class SubmFilesEval(object):
                 distinct()
             ]
 
-            for fname in files:
-                if os.path.isfile(fname):
-                    zipFile.write(fname, os.path.basename(fname))
-
-            zipFile.close()
-
             resp.set_header('Content-Disposition',
                             'inline; filename="eval_' + str(eval_id) + '.zip"')
             resp.content_type = "application/zip"
-            resp.body = inMemoryOutputFile.getvalue()
-            resp.stream_len = len(resp.body)
-
-            inMemoryOutputFile.close()
+            resp.stream = util.zipstream.stream(
+                [(fname, os.path.basename(fname)) for fname in files]
+            )
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -1,7 +1,5 @@
 import falcon
 from sqlalchemy.exc import SQLAlchemyError
-from io import BytesIO
-from zipfile import ZipFile
 import os
 
 from db import session
@@ -20,56 +18,40 @@ class SubmFilesTask(object):
                 resp.status = falcon.HTTP_400
                 return
 
-            inMemoryOutputFile = BytesIO()
-            zipFile = ZipFile(inMemoryOutputFile, 'w')
-
-            modules = session.query(model.Module).\
-                filter(model.Module.task == task_id).all()
-
-            for module in modules:
-                users = session.query(model.User).\
-                    join(model.Evaluation,
-                         model.Evaluation.user == model.User.id).\
-                    filter(model.Evaluation.module == module.id).all()
-
-                for user in users:
-                    files = [
-                        r for (r, ) in
-                        session.query(model.SubmittedFile.path).
-                        join(model.Evaluation,
-                             model.Evaluation.id ==
-                             model.SubmittedFile.evaluation).
-                        filter(model.Evaluation.user == user.id,
-                               model.Evaluation.module == module.id).
-                        distinct()
-                    ]
-                    userdir = (
-                        os.path.join(
-                            "module_" + str(module.id),
-                            util.submissions.strip_accents(user.first_name) +
-                            "_" +
-                            util.submissions.strip_accents(user.last_name)
-                        )
-                    ).replace(' ', '_')
-
-                    for fname in files:
-                        if os.path.isfile(fname):
-                            zipFile.write(
-                                fname,
-                                os.path.join(userdir, os.path.basename(fname))
-                            )
-
-            zipFile.close()
+            files = session.query(model.Module.id, model.User.id,
+                                  model.User.first_name, model.User.last_name,
+                                  model.SubmittedFile.path).\
+                join(model.Evaluation,
+                     model.Evaluation.id == model.SubmittedFile.evaluation).\
+                join(model.Module,
+                     model.Module.id == model.Evaluation.module).\
+                join(model.User, model.User.id == model.Evaluation.user).\
+                filter(model.Module.task == task_id).\
+                distinct().\
+                order_by(model.Module.id, model.User.id).\
+                all()
+
+            entries = []
+            for module_id, _, first_name, last_name, fname in files:
+                userdir = (
+                    os.path.join(
+                        "module_" + str(module_id),
+                        util.submissions.strip_accents(first_name) +
+                        "_" +
+                        util.submissions.strip_accents(last_name)
+                    )
+                ).replace(' ', '_')
+                entries.append(
+                    (fname, os.path.join(userdir, os.path.basename(fname)))
+                )
 
             resp.set_header(
                 'Content-Disposition',
                 'inline; filename="task_' + str(task_id) + '.zip"'
             )
             resp.content_type = "application/zip"
-            resp.body = inMemoryOutputFile.getvalue()
-            resp.stream_len = len(resp.body)
-
-            inMemoryOutputFile.close()
+            # Archiv se generuje az pri odesilani, bez pristupu do databaze
+            resp.stream = util.zipstream.stream(entries)
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -127,6 +127,7 @@ class Task(object):
             evals = session.query(model.Evaluation).\
                 join(model.Module, model.Module.id == model.Evaluation.module).\
                 filter(model.Module.task == id).all()
+            evals_users = set(_eval.user for _eval in evals)
             for _eval in evals:
                 session.delete(_eval)
 
@@ -146,6 +147,8 @@ class Task(object):
 
             session.commit()
 
+            util.scoreboard.update_users(wave.year, evals_users, session)
+
             req.context['result'] = {}
         except SQLAlchemyError:
             session.rollback()
@@ -0,0 +1,113 @@
+import falcon
+import datetime
+import threading
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import scoped_session
+
+from db import session, _session
+import model
+import util
+
+
+class WaveDeploy(object):
+
+    def on_post(self, req, resp, id):
+        """
+        Deploy vsech uloh vlny, ktere maji zadanou vetev a adresar.
+
+        Vraci JSON:
+        {
+            "tasks": [task_id]
+        }
+
+        """
+
+        try:
+            user = req.context['user']
+            year_id: int = req.context['year']
+
+            # Kontrola opravneni
+            if (not user.is_logged_in()) or (not user.is_org()):
+                req.context['result'] = 'Nedostatecna opravneni'
+                resp.status = falcon.HTTP_400
+                return
+
+            wave = session.query(model.Wave).get(id)
+            if wave is None:
+                req.context['result'] = 'Neexistujici vlna'
+                resp.status = falcon.HTTP_404
+                return
+
+            # Zverejnenou vlnu mohou deployovat pouze admini a garant vlny
+            if (datetime.datetime.utcnow() > wave.time_published and
+                    not user.is_admin() and user.id != wave.garant):
+                req.context['result'] = ('Po zverejneni vlny muze deploy '
+                                         'provest pouze administrator nebo '
+                                         'garant vlny.')
+                resp.status = falcon.HTTP_400
+                return
+
+            # Kontrola zamku
+            lock = util.lock.git_locked()
+            if lock:
+                req.context['result'] = ('GIT uzamcen zamkem ' + lock +
+                                         '\nNekdo momentalne provadi akci s '
+                                         'gitem, opakujte prosim akci za 20 '
+                                         'sekund.')
+                resp.status = falcon.HTTP_409
+                return
+
+            tasks = session.query(model.Task).\
+                filter(model.Task.wave == wave.id,
+                       model.Task.git_branch != None,
+                       model.Task.git_path != None).\
+                all()
+            if not tasks:
+                req.context['result'] = ('Zadna uloha vlny nema zadanou '
+                                         'gitovskou vetev a adresar')
+                resp.status = falcon.HTTP_400
+                return
+
+            # Stav na deploying je potreba nastavit v tomto vlakne
+            for task in tasks:
+                task.deploy_status = 'deploying'
+            session.commit()
+
+            task_ids = [task.id for task in tasks]
+            threading.Thread(
+                target=util.admin.waveDeploy.deploy,
+                args=(wave.id, year_id, task_ids, scoped_session(_session)),
+                daemon=True,
+            ).start()
+
+            req.context['result'] = {'tasks': task_ids}
+            resp.status = falcon.HTTP_202
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def on_get(self, req, resp, id):
+        """
+        Vraci JSON stavu posledniho deploye vlny (viz util.admin.waveDeploy)
+        doplneny o logy deploye jednotlivych uloh.
+
+        """
+
+        user = req.context['user']
+
+        # Kontrola opravneni
+        if (not user.is_logged_in()) or (not user.is_org()):
+            resp.status = falcon.HTTP_400
+            return
+
+        status = util.admin.waveDeploy.load_status(int(id))
+        if status is None:
+            resp.status = falcon.HTTP_404
+            return
+
+        for task_id, result in status['tasks'].items():
+            result['log'] = util.admin.waveDeploy.task_log(int(id),
+                                                           int(task_id))
+        req.context['result'] = status
@@ -1,6 +1,5 @@
 import falcon
 import git
-import os
 from sqlalchemy.exc import SQLAlchemyError
 from lockfile import LockFile
 
@@ -29,43 +28,34 @@ class WaveDiff(object):
                 resp.status = falcon.HTTP_409
                 return
 
+            # Fetch je jedina operace, ktera meni repozitar
             pullLock = LockFile(util.admin.waveDiff.LOCKFILE)
             pullLock.acquire(60)  # Timeout zamku je 1 minuta
-
-            # Fetch
-            repo = git.Repo(util.git.GIT_SEMINAR_PATH)
-            repo.remotes.origin.fetch()
+            try:
+                repo = git.Repo(util.git.GIT_SEMINAR_PATH)
+                repo.remotes.origin.fetch()
+            finally:
+                pullLock.release()
 
             # Ulohy ve vlne
             tasks = session.query(model.Task).\
                 filter(model.Task.wave == id).all()
 
-            # Diffujeme adresare uloh task.git_commit oproti HEAD
+            # Porovnavame stromy adresaru uloh v task.git_commit
+            # a origin/<vetev>, pracovni adresar se nemeni
+            diffs = util.admin.waveDiff.diff_tasks(repo, tasks)
             for task in tasks:
-                if ((not task.git_branch) or (not task.git_path) or
-                        (not task.git_commit)):
-                    task.deploy_status = 'default'
-                    continue
-
-                # Checkout && pull vetve ve ktere je uloha
-                repo.git.checkout(task.git_branch)
-                repo.remotes.origin.pull()
-
-                # Kontrola existence adresare ulohy
-                if os.path.isdir(util.git.GIT_SEMINAR_PATH + task.git_path):
-                    hcommit = repo.head.commit
-                    diff = hcommit.diff(task.git_commit, paths=[task.git_path])
-                    if len(diff) > 0:
-                        task.deploy_status = 'diff'
-                else:
-                    task.deploy_status = 'default'
+                status = diffs[task.id]['status']
+                if status != 'same':
+                    task.deploy_status = status
 
             session.commit()
-            req.context['result'] = {}
+            req.context['result'] = {
+                'tasks': [diffs[task.id] for task in tasks]
+            }
         except SQLAlchemyError:
             session.rollback()
             req.context['result'] = 'Nastala vyjimka backendu'
             raise
         finally:
-            pullLock.release()
             session.close()
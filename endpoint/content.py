@@ -1,5 +1,4 @@
 import os
-import magic
 import multipart
 import falcon
 
@@ -35,15 +34,14 @@ class Content(object):
             }
             return
 
-        if not os.path.isfile(filePath):
+        if not os.path.isfile(filePath) or \
+                util.mime.is_index(os.path.basename(filePath)):
             req.context['result'] = {
                 'content': util.content.empty_content(shortPath)
             }
             return
 
-        resp.content_type = magic.Magic(mime=True).from_file(filePath)
-        resp.stream_len = os.path.getsize(filePath)
-        resp.stream = open(filePath, 'rb')
+        util.file_response.send_file(req, resp, filePath)
 
     def on_post(self, req, resp):
         user = req.context['user']
@@ -86,15 +84,36 @@ class Content(object):
             if not os.path.isdir(dirPath):
                 os.makedirs(dirPath)
 
+            names = []
+            rejected = []
             for part in multipart.MultipartParser(
                     req.stream, boundary, req.content_length,
                     2**30, 2**20, 2**18, 2**16, 'utf-8'):
+                # Soubor by prepsal index MIME typu adresare
+                if util.mime.is_index(part.filename):
+                    rejected.append(part.filename)
+                    continue
                 path = '%s/%s' % (dirPath, part.filename)
                 part.save_as(path)
+                names.append(part.filename)
+
+            util.mime.update_index(dirPath, names)
         except:
             resp.status = falcon.HTTP_500
             raise
 
+        if rejected:
+            req.context['result'] = {
+                'errors': [{
+                    'status': '400',
+                    'title': 'Bad Request',
+                    'detail': 'Nepovolený název souboru: ' +
+                              ', '.join(rejected)
+                }]
+            }
+            resp.status = falcon.HTTP_400
+            return
+
         req.context['result'] = {}
         resp.status = falcon.HTTP_200
 
@@ -111,12 +130,15 @@ class Content(object):
             shortPath = "."
         filePath = 'data/content/' + shortPath
 
-        if not os.path.isfile(filePath):
+        if not os.path.isfile(filePath) or \
+                util.mime.is_index(os.path.basename(filePath)):
             resp.status = falcon.HTTP_404
             return
 
         try:
             os.remove(filePath)
+            util.mime.remove_from_index(os.path.dirname(filePath),
+                                        [os.path.basename(filePath)])
             self._delete_tree(os.path.dirname(filePath))
         except:
             resp.status = falcon.HTTP_500
@@ -144,10 +166,14 @@ class TaskContent(object):
         filePath = 'data/task-content/' + id + '/' + view + '/' + \
                    path_param.replace('..', '')
 
-        if not os.path.isfile(filePath):
+        if not os.path.isfile(filePath) or \
+                util.mime.is_index(os.path.basename(filePath)):
             resp.status = falcon.HTTP_404
             return
 
-        resp.content_type = magic.Magic(mime=True).from_file(filePath)
-        resp.stream_len = os.path.getsize(filePath)
-        resp.stream = open(filePath, 'rb')
+        if view == 'icon' or view.startswith('zadani_') or \
+                view.startswith('reseni_'):
+            cache_control = util.file_response.CACHE_TASK_DATA
+        else:
+            cache_control = util.file_response.CACHE_REVALIDATE
+        util.file_response.send_file(req, resp, filePath, cache_control)
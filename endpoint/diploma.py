@@ -1,9 +1,7 @@
-import os
-
 import falcon
-import magic
 
 import model
+import util
 from db import session
 from endpoint.admin.diploma import get_diploma_path
 from util.config import backend_url
@@ -43,6 +41,5 @@ class DiplomaDownload:
             return
 
         path = get_diploma_path(year_id, user_id)
-        resp.content_type = magic.Magic(mime=True).from_file(f"{path}")
-        resp.stream_len = os.path.getsize(path)
-        resp.stream = open(path, 'rb')
+        util.file_response.send_file(req, resp, path,
+                                     util.file_response.CACHE_PRIVATE)
@@ -0,0 +1,36 @@
+import falcon
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import session
+import model
+import util
+
+
+class EvalJob(object):
+
+    def on_get(self, req, resp, id):
+        """
+        Vraci stav opravovani ve fronte. Odpoved se vraci hned, klient se
+        dotazuje opakovane (cekani by blokovalo synchronni worker gunicornu).
+        """
+
+        try:
+            user = req.context['user']
+
+            if not user.is_logged_in():
+                resp.status = falcon.HTTP_401
+                return
+
+            job = session.query(model.EvalJob).get(id)
+            if job is None or (job.user != user.id and not user.is_org()):
+                resp.status = falcon.HTTP_404
+                return
+
+            req.context['result'] = {
+                'job': util.eval_queue.to_json(job, user.is_org())
+            }
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -1,5 +1,4 @@
 import os
-import magic
 import falcon
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -26,6 +25,7 @@ class Image(object):
                 return
 
             image = user.profile_picture
+            cache_control = util.file_response.CACHE_PUBLIC_SHORT
         elif context == 'codeExecution':
             try:
                 execution = session.query(model.CodeExecution).get(id)
@@ -44,6 +44,7 @@ class Image(object):
             image = os.path.join(
                 util.programming.code_execution_dir(execution.user, execution.module),
                 os.path.basename(req.get_param('file')))
+            cache_control = util.file_response.CACHE_PRIVATE
 
         elif context == 'codeModule':
             if not req.get_param('file') or not req.get_param('module') or not req.get_param('user'):
@@ -62,8 +63,7 @@ class Image(object):
                 util.programming.code_execution_dir(user_id, module_id),
                 filename
                 )
-            
-            resp.cache_control = ('no-cache', )
+            cache_control = util.file_response.CACHE_PRIVATE
 
         else:
             resp.status = falcon.HTTP_400
@@ -73,6 +73,4 @@ class Image(object):
             resp.status = falcon.HTTP_400
             return
 
-        resp.content_type = magic.Magic(mime=True).from_file(image)
-        resp.stream_len = os.path.getsize(image)
-        resp.stream = open(image, 'rb')
+        util.file_response.send_file(req, resp, image, cache_control)
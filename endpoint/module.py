@@ -1,12 +1,10 @@
 import json
 import falcon
 import os
-import magic
 import multipart
 from sqlalchemy import func, exc
 from sqlalchemy.exc import SQLAlchemyError
 import datetime
-import traceback
 
 from db import session
 from model import ModuleType
@@ -35,8 +33,12 @@ class Module(object):
             if module is None:
                 resp.status = falcon.HTTP_404
             else:
-                task = session.query(model.Task).get(module.task)
-                if util.task.status(task, user) != util.TaskStatus.LOCKED:
+                year_id = session.query(model.Wave.year).\
+                    join(model.Task, model.Task.wave == model.Wave.id).\
+                    filter(model.Task.id == module.task).\
+                    scalar()
+                engine = util.task_status.TaskStatusEngine(user, year_id)
+                if engine.status(module.task) != util.TaskStatus.LOCKED:
                     req.context['result'] = {
                         'module': util.module.to_json(module, user.id)
                     }
@@ -130,7 +132,7 @@ class ModuleSubmit(object):
                                               2**18, 2**16, 'utf-8'):
             path = '%s/%s' % (dir, part.filename)
             part.save_as(path)
-            mime = magic.Magic(mime=True).from_file(path)
+            mime = util.mime.sniff(path)
 
             report += (str(datetime.datetime.now()) +
                        ' :  [y] uploaded file: \'%s\' (mime: %s) to '
@@ -156,6 +158,7 @@ class ModuleSubmit(object):
         try:
             session.add(evaluation)
             session.commit()
+            util.scoreboard.update_module(user_id, module.id)
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -186,43 +189,24 @@ class ModuleSubmit(object):
 
             if not module.autocorrect:
                 session.commit()
+                util.scoreboard.update_module(user.id, module.id)
                 req.context['result'] = {'result': 'ok'}
                 return
 
-            reporter = util.programming.Reporter(max_size=50*1000)  # prevent database overflow
-
-            try:
-                result = util.programming.evaluate(
-                    module.task, module, user.id, data, evaluation.id, reporter
-                )
-            except util.programming.ENoFreeBox as e:
-                result = {
-                    'result': 'error',
-                    'message': ('Přesáhnut maximální počet souběžně běžících '
-                                'opravení, zkuste to za chvíli.')
-                }
-            except Exception:
-                reporter += 'Zachycena chyba:\n'
-                reporter += traceback.format_exc()
-                result = {
-                    'result': 'error',
-                    'message': ('Nastala chyba při vykonávání kódu, zkus to prosím znovu později'
-                                ' a v případě přetrvávající chyby kontaktuj organizátora')
+            if util.config.eval_queue_enabled():
+                # Opraveni probehne v eval_worker.py, klient se dotazuje
+                # na stav ulohy na /evalJobs/{id}
+                job = util.eval_queue.enqueue(evaluation)
+                util.scoreboard.update_module(user.id, module.id)
+                req.context['result'] = {
+                    'result': 'queued',
+                    'job': util.eval_queue.to_json(job, user.is_org()),
                 }
+                resp.status = falcon.HTTP_202
+                return
 
-            evaluation.points = result['score'] if 'score' in result else 0
-            evaluation.ok = (result['result'] == 'ok')
-            evaluation.full_report += (str(datetime.datetime.now()) + " : " +
-                                       reporter.report_truncated + '\n')
-            session.commit()
-
-            if 'actions' in result:
-                for action in result['actions']:
-                    reporter += "Performing %s...\n" % (action)
-                    util.module.perform_action(module, user, action)
-
-            if user.is_org():
-                result['report'] = reporter.report_truncated
+            result = util.eval_queue.evaluate_code(module, user, evaluation,
+                                                   data)
 
             req.context['result'] = result
         except SQLAlchemyError:
@@ -343,6 +327,7 @@ class ModuleSubmit(object):
 
             session.add(evaluation)
             session.commit()
+            util.scoreboard.update_module(user.id, module.id)
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -383,9 +368,10 @@ class ModuleSubmittedFile(object):
                     resp.status = falcon.HTTP_404
                     return
 
-                resp.content_type = magic.Magic(mime=True).from_file(path)
-                resp.stream_len = os.path.getsize(path)
-                resp.stream = open(path, 'rb')
+                util.file_response.send_file(
+                    req, resp, path, util.file_response.CACHE_PRIVATE,
+                    submittedFile.mime
+                )
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -432,8 +418,11 @@ class ModuleSubmittedFile(object):
                             filter(model.SubmittedFile.evaluation == eval_id).\
                             count()
                         if files_cnt == 0:
+                            user_id, module_id = (evaluation.user,
+                                                  evaluation.module)
                             session.delete(evaluation)
                             session.commit()
+                            util.scoreboard.update_module(user_id, module_id)
 
                     req.context['result'] = {'status': 'ok'}
 
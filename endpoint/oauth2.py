@@ -54,6 +54,7 @@ class Authorize(object):
 
             if token:
                 session.delete(token)
+                util.auth.invalidate_token(token.access_token)
                 req.context['result'] = auth.OAuth2Token(token.user).data
             else:
                 req.context['result'] = {'error': Error.UNAUTHORIZED_CLIENT}
@@ -65,7 +66,7 @@ class Authorize(object):
     def on_post(self, req, resp):
         try:
             grant_type = req.get_param('grant_type')
-            util.auth.update_tokens()
+            util.auth.start_token_sweeper()
 
             if grant_type == 'password':
                 self._auth(req, resp)
@@ -97,6 +98,7 @@ class Logout(object):
 
             session.delete(token)
             session.commit()
+            util.auth.invalidate_token(req.context['user'].token)
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -1,18 +1,14 @@
 import json
 import falcon
-import sys
-from sqlalchemy import text, distinct
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
-import traceback
 
 from db import session
 import model
 import util
 from .thread import Thread
-from util import config
 
 MAX_POST_LEN = 8000
-TMP_ADMIN_URL = "https://naskoc_admin.iamroot.eu/"  # TODO remove after deploying new admin
 
 
 class Post(object):
@@ -107,7 +103,10 @@ class Post(object):
                 resp.status = falcon.HTTP_404
                 return
 
+            thread_id = post.thread
             session.delete(post)
+            session.flush()
+            util.thread.update_counters(thread_id)
             session.commit()
             req.context['result'] = {}
         except SQLAlchemyError:
@@ -166,12 +165,6 @@ class Posts(object):
                        model.SolutionComment.user == user.id).\
                 first()
 
-            if task_thread:
-                prog_modules = session.query(model.Module).\
-                    filter(model.Module.task == task_thread.id,
-                           model.Module.type == model.ModuleType.PROGRAMMING).\
-                    all()
-
             # Podminky pristupu:
             #  1) Do vlakna ulohy neni mozne pristoupit, pokud je uloha pro
             #     uzivatele uzavrena.
@@ -186,8 +179,6 @@ class Posts(object):
                 resp.status = falcon.HTTP_400
                 return
 
-            user_class = session.query(model.User).get(user.id)
-
             # Kontrola existence rodicovskeho vlakna
             parent = session.query(model.Post).\
                 filter(model.Post.id == data['parent'],
@@ -209,179 +200,17 @@ class Posts(object):
                                           last_visit=time,
                                           last_last_visit=time)
                 session.add(visit)
-            session.commit()
-
-            # Tady si pamatujeme, komu jsme email jiz odeslali
-            sent_emails = set()
 
             # ------------------------------------------
-            # Odesilani emailu orgum
-            if user.role == 'participant' or user.role == 'participant_hidden':
-
-                if task_thread:
-                    # Vlakno k uloze -> posilame email autoru ulohy,
-                    # spoluautoru ulohy a garantovi vlny.
-                    task_author_email = session.query(model.User.email).\
-                        filter(model.User.id == task_thread.author).\
-                        scalar()
-                    recipients = [task_author_email]
-                    wave_garant_email = session.query(model.User.email).\
-                        join(model.Wave, model.Wave.garant == model.User.id).\
-                        join(model.Task, model.Task.wave == model.Wave.id).\
-                        filter(model.Task.id == task_thread.id).scalar()
-                    sent_emails.add(task_author_email)
-                    sent_emails.add(wave_garant_email)
-                    if task_thread.co_author:
-                        task_co_author_email = session.query(model.User.email).\
-                            filter(model.User.id == task_thread.co_author).\
-                            scalar()
-                        sent_emails.add(task_co_author_email)
-                        recipients.append(task_co_author_email)
-                    try:
-                        body = (
-                            '<p>Ahoj,<br/>k tvé úloze <a href="' +
-                            config.ksi_web() + '/ulohy/' + str(task_thread.id) +
-                            '">' + task_thread.title + '</a> na <a href="' +
-                            config.ksi_web() + '/">' + config.ksi_web() +
-                            '</a> byl přidán nový komentář:</p><p><i>' +
-                            user_class.first_name + ' ' + user_class.last_name +
-                            ':</i></p>' + data['body'] + '<p><a href="' +
-                            config.ksi_web() + '/ulohy/' + str(task_thread.id) +
-                            '#diskuze">Přejít do diskuze.</a> ' + '<a href="' +
-                            TMP_ADMIN_URL + '/admin/opravovani?participant_=' +
-                            str(user_class.id) + '&task_=' + str(task_thread.id) +
-                            '">Přejít na opravení.</a>'
-                        )
-
-                        if len(prog_modules) > 0:
-                            body += (' <a href="' + TMP_ADMIN_URL +
-                                     '/admin/execs?user=' + str(user_class.id))
-                            if len(prog_modules) == 1:
-                                body += '&module=' + str(prog_modules[0].id)
-
-                            body += '">Přejít na spuštění.</a></p>'
-
-                        body += '</p>'
-                        body += config.mail_sign()
-
-                        util.mail.send(
-                            recipients,
-                            '[Naskoc na FI] Nový příspěvek k úloze ' + task_thread.title,
-                            body,
-                            cc=wave_garant_email
-                        )
-                    except BaseException:
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        traceback.print_exception(
-                            exc_type, exc_value, exc_traceback,
-                            file=sys.stderr
-                        )
-
-                elif solution_thread:
-                    # Vlakno k oprave -> posilame email autoru opravy
-                    correctors = [
-                        r for r, in
-                        session.query(distinct(model.User.email)).
-                        join(model.Evaluation,
-                             model.Evaluation.evaluator == model.User.id).
-                        join(model.Module,
-                             model.Evaluation.module == model.Module.id).
-                        join(model.Task, model.Task.id == model.Module.task).
-                        filter(model.Task.id == solution_thread.task).all()
-                    ]
-
-                    for corr_email in correctors:
-                        sent_emails.add(corr_email)
-
-                    if correctors:
-                        task = session.query(model.Task).\
-                            get(solution_thread.task)
-                        try:
-                            util.mail.send(
-                                correctors,
-                                '[Naskoc na FI] Nový komentář k tvé korektuře úlohy ' + task.title,
-                                '<p>Ahoj,<br/>k tvé <a href="' +
-                                TMP_ADMIN_URL + '/admin/opravovani?task_=' +
-                                str(task.id) + '&participant_='+str(user_class.id) +
-                                '">korektuře</a> úlohy <a href="' + config.ksi_web() +
-                                '/ulohy/' + str(task.id) + '">' + task.title +
-                                '</a> na <a href="' + config.ksi_web() + '/">' +
-                                config.ksi_web() +
-                                '</a> byl přidán nový komentář:<p><p><i>' +
-                                user_class.first_name + ' ' +
-                                user_class.last_name + ':</i></p><p>' +
-                                data['body'] + config.mail_sign())
-                        except BaseException:
-                            exc_type, exc_value, exc_traceback = sys.exc_info()
-                            traceback.print_exception(exc_type, exc_value,
-                                                      exc_traceback,
-                                                      file=sys.stderr)
-                else:
-                    # Obecna diskuze -> email na ksi@fi.muni.cz
-                    try:
-                        sent_emails.add(config.ksi_conf())
-                        util.mail.send(
-                            config.ksi_conf(),
-                            '[Naskoc na FI] Nový příspěvek v obecné diskuzi',
-                            '<p>Ahoj,<br/>do obecné diskuze na <a href="' +
-                            config.ksi_web() + '/">' + config.ksi_web() +
-                            '</a> byl přidán nový příspěvek:</p><p><i>' +
-                            user_class.first_name + ' ' +
-                            user_class.last_name + ':</i></p>' + data['body'] +
-                            '<p><a href=' + config.ksi_web() + '/forum/' +
-                            str(thread.id) + '>Přejít do diskuze.</a></p>' +
-                            config.mail_sign()
-                        )
-                    except BaseException:
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        traceback.print_exception(exc_type, exc_value,
-                                                  exc_traceback,
-                                                  file=sys.stderr)
-
-            # ------------------------------------------
-            # Pridani prispevku
+            # Pridani prispevku, notifikace rozesle util.post_events
             post = model.Post(thread=thread_id, author=user.id,
                               body=data['body'], parent=data['parent'])
             session.add(post)
+            session.flush()
+            util.thread.update_counters(thread_id)
+            util.post_events.record_created(post)
             session.commit()
-
-            # ------------------------------------------
-            # Odesilani emailu v reakci na muj prispevek:
-
-            if parent:
-                parent_user = session.query(model.User).get(parent.author)
-                parent_notify = util.user_notify.get(parent.author)
-                if (parent_user.email not in sent_emails and
-                        parent_notify.notify_response):
-                    try:
-                        sent_emails.add(parent_user.email)
-
-                        body = (
-                            '<p>Ahoj,<br>do diskuze <a href="%s">%s</a> byl '
-                            'přidán nový příspěvek.</p>' %
-                            (util.config.ksi_web() + "/forum/" +
-                             str(thread.id), thread.title)
-                        )
-                        body += util.post.to_html(parent, parent_user)
-                        body += ("<div style='margin-left: 50px;'>%s</div>" %
-                                 (util.post.to_html(post)))
-                        body += util.config.mail_sign()
-
-                        util.mail.send(
-                            parent_user.email,
-                            ('[Naskoc na FI] Nový příspěvek v diskuzi %s' %
-                             (thread.title)),
-                            body,
-                            unsubscribe=util.mail.Unsubscribe(
-                                email_type=util.mail.EMailType.RESPONSE,
-                                user_id=parent_user.id,
-                            ),
-                        )
-                    except BaseException:
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        traceback.print_exception(exc_type, exc_value,
-                                                  exc_traceback,
-                                                  file=sys.stderr)
+            util.post_events.wake()
 
             req.context['result'] = {'post': util.post.to_json(post, user.id)}
         except SQLAlchemyError:
@@ -1,6 +1,5 @@
 import json
 import falcon
-import magic
 import tempfile
 import os
 from sqlalchemy import func
@@ -261,7 +260,7 @@ class PictureUploader(object):
 
             file.save_as(tmpfile.name)
 
-            mime = magic.Magic(mime=True).from_file(tmpfile.name)
+            mime = util.mime.sniff(tmpfile.name)
 
             if mime not in ALLOWED_MIME_TYPES:
                 resp.status = falcon.HTTP_400
@@ -58,9 +58,7 @@ class Tasks(object):
         try:
             user = req.context['user']
 
-            tasks = session.query(model.Task, model.Wave, model.Prerequisite).\
-                outerjoin(model.Prerequisite,
-                          model.Prerequisite.id == model.Task.prerequisite).\
+            tasks = session.query(model.Task, model.Wave).\
                 join(model.Wave, model.Task.wave == model.Wave.id)
 
             if ((not user.is_logged_in()) or ((not user.is_org()) and
@@ -68,23 +66,20 @@ class Tasks(object):
                 tasks = tasks.filter(model.Wave.public)
             tasks = tasks.filter(model.Wave.year == req.context['year']).all()
 
-            adeadline = util.task.after_deadline()
-            fsubmitted = util.task.fully_submitted(
-                user.id,
+            engine = util.task_status.TaskStatusEngine(
+                user,
                 req.context['year']
             )
-            corrected = util.task.corrected(user.id)
-            autocorrected_full = util.task.autocorrected_full(user.id)
             task_max_points_dict = util.task.max_points_dict()
 
             req.context['result'] = {
                 'tasks': [
                     util.task.to_json(
-                        task, prereq, user, adeadline, fsubmitted, wave,
-                        task.id in corrected, task.id in autocorrected_full,
-                        task_max_points=task_max_points_dict[task.id]
+                        task, engine.prerequisite(task.id), user, wave=wave,
+                        task_max_points=task_max_points_dict[task.id],
+                        tstatus=engine.status(task.id)
                     )
-                    for (task, wave, prereq) in tasks
+                    for (task, wave) in tasks
                 ]
             }
         except SQLAlchemyError:
@@ -133,9 +128,12 @@ class TaskDetails(object):
                 session.query(model.Thread).get(thread_id)
                 for thread_id in thread_ids if thread_id is not None
             ]
+            root_posts = {}
             posts = []
             for thread in threads:
-                posts += thread.posts
+                root_posts[thread.id], thread_posts, _ = \
+                    util.thread.posts_tree(thread, user.id)
+                posts += thread_posts
 
             req.context['result'] = {
                 'taskDetails': util.task.details_to_json(
@@ -163,13 +161,10 @@ class TaskDetails(object):
                     for thread in threads
                 ],
                 'threadDetails': [
-                    util.thread.details_to_json(thread)
+                    util.thread.details_to_json(thread, root_posts[thread.id])
                     for thread in threads
                 ],
-                'posts': [
-                    util.post.to_json(post, user.id)
-                    for post in posts
-                ]
+                'posts': posts
             }
         except SQLAlchemyError:
             session.rollback()
@@ -1,6 +1,6 @@
 import falcon
 import json
-from sqlalchemy import and_, text, desc, func
+from sqlalchemy import and_, text, desc
 from sqlalchemy.orm import load_only
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -77,24 +77,17 @@ class Thread(object):
                 return
 
             # Pocet vsech prispevku
-            posts_cnt = session.query(model.Post).\
-                filter(model.Post.thread == thread.id).\
-                count()
+            posts_cnt = thread.posts_count
 
             # Pocet neprectenych prispevku
             if not user.is_logged_in():
                 unread_cnt = posts_cnt
             else:
-                visit = session.query(model.ThreadVisit).\
-                    filter(model.ThreadVisit.user == user.id,
-                           model.ThreadVisit.thread == thread.id).\
-                    first()
+                visit = util.thread.get_visit(user.id, thread.id)
 
                 if visit:
-                    unread_cnt = session.query(model.Post).\
-                        filter(model.Post.thread == thread.id,
-                               model.Post.published_at > visit.last_visit).\
-                        count()
+                    unread_cnt = util.thread.unread_counts(
+                        [(thread, visit.last_visit)]).get(thread.id, 0)
                 else:
                     unread_cnt = posts_cnt
 
@@ -171,37 +164,13 @@ class Threads(object):
 
             wave = req.get_param_as_int('wave')
 
-            # Pocet vsech prispevku
-            posts_cnt = session.query(model.Thread.id.label('thread'),
-                                      func.count(model.Post.id).
-                                      label('posts_cnt')).\
-                join(model.Post, model.Post.thread == model.Thread.id).\
-                group_by(model.Thread.id).subquery()
-
-            # Pocet neprectenych prispevku
-            unread = session.query(
-                model.Thread.id.label('thread'),
-                model.ThreadVisit.thread.label('thread_visit'),
-                func.count(model.Post.id).label('unread_cnt')
+            threads = session.query(
+                model.Thread, model.Task, model.ThreadVisit.last_visit
             ).\
+                outerjoin(model.Task, model.Task.thread == model.Thread.id).\
                 outerjoin(model.ThreadVisit,
                           and_(model.ThreadVisit.thread == model.Thread.id,
                                model.ThreadVisit.user == user_id)).\
-                outerjoin(model.Post,
-                          and_(model.Post.thread == model.Thread.id,
-                               model.Post.published_at >
-                               model.ThreadVisit.last_visit)).\
-                group_by(model.Thread.id).subquery()
-
-            threads = session.query(
-                model.Thread, model.Task,
-                posts_cnt.c.posts_cnt.label('posts_cnt'),
-                unread.c.unread_cnt.label('unread_cnt'),
-                unread.c.thread_visit.label('thread_visit')
-            ).\
-                outerjoin(model.Task, model.Task.thread == model.Thread.id).\
-                outerjoin(posts_cnt, posts_cnt.c.thread == model.Thread.id).\
-                outerjoin(unread, unread.c.thread == model.Thread.id).\
                 filter(model.Thread.public,
                        model.Thread.year == req.context['year'])
 
@@ -211,21 +180,27 @@ class Threads(object):
             threads = threads.order_by(desc(model.Thread.id)).all()
 
             if not wave:
-                threads = [thr_tsk_p_u_tv
-                           for thr_tsk_p_u_tv in threads
-                           if thr_tsk_p_u_tv[1] is None]
+                threads = [thr_tsk_v
+                           for thr_tsk_v in threads
+                           if thr_tsk_v[1] is None]
+
+            # Pocet neprectenych prispevku: jen vlakna s novymi prispevky
+            unread = util.thread.unread_counts([
+                (thread, last_visit)
+                for (thread, _, last_visit) in threads
+                if user_id and last_visit
+            ])
 
             thr_output = []
-            for (thread, _, posts_cnt, unread_cnt, thread_visit) in threads:
-                if not posts_cnt:
-                    posts_cnt = 0
-                if user_id and thread_visit:
-                    uunread_cnt = unread_cnt if unread_cnt else 0
+            for (thread, _, last_visit) in threads:
+                if user_id and last_visit:
+                    uunread_cnt = unread.get(thread.id, 0)
                 else:
-                    uunread_cnt = posts_cnt
+                    uunread_cnt = thread.posts_count
 
                 thr_output.append(util.thread.to_json(thread, user_id,
-                                                      uunread_cnt, posts_cnt))
+                                                      uunread_cnt,
+                                                      thread.posts_count))
 
             req.context['result'] = {'threads': thr_output}
         except SQLAlchemyError:
@@ -249,21 +224,23 @@ class ThreadDetails(object):
                 resp.status = falcon.HTTP_400
                 return
 
-            last_visit = util.thread.get_visit(user.id, thread.id)
-            posts = session.query(model.Post).\
-                filter(model.Post.thread == thread.id).\
-                all()
+            # Volitelne strankovani korenovych prispevku
+            after = req.get_param_as_int('after')
+            limit = req.get_param_as_int('limit')
+            if limit is not None and limit <= 0:
+                resp.status = falcon.HTTP_400
+                return
+
+            root_posts, posts, next_after = util.thread.posts_tree(
+                thread, user.id, after, limit)
 
             req.context['result'] = {
-                'threadDetails': util.thread.details_to_json(thread),
-                'posts': [util.post.to_json(
-                    post,
-                    user.id,
-                    last_visit,
-                    last_visit_filled=True,
-                    reactions=[pst for pst in posts if pst.parent == post.id])
-                    for post in posts]
+                'threadDetails': util.thread.details_to_json(thread,
+                                                             root_posts),
+                'posts': posts
             }
+            if after is not None or limit is not None:
+                req.context['result']['meta'] = {'next': next_after}
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -4,7 +4,7 @@ import falcon
 import json
 import random
 import string
-from sqlalchemy import func, distinct, desc, text, or_
+from sqlalchemy import desc, or_, and_
 from sqlalchemy.exc import SQLAlchemyError
 import traceback
 
@@ -72,6 +72,7 @@ class User(object):
                 session.delete(profile)
             session.delete(user_db)
             session.commit()
+            util.auth.invalidate_user(int(id))
         except SQLAlchemyError:
             session.rollback()
             raise
@@ -114,53 +115,24 @@ class Users(object):
         """
 
         try:
-            # Skore uzivatele per modul (zahrnuje jen moduly evaluation_public)
-            per_user = session.query(
-                model.Evaluation.user.label('user'),
-                func.max(model.Evaluation.points).label('points'),
-                func.max(model.Evaluation.cheat).label('cheat'),
-            ).\
-                join(model.Module,
-                     model.Evaluation.module == model.Module.id).\
-                join(model.Task, model.Task.id == model.Module.task).\
-                filter(model.Task.evaluation_public).\
-                join(model.Wave, model.Wave.id == model.Task.wave).\
-                filter(model.Wave.year == req.context['year']).\
-                group_by(model.Evaluation.user, model.Evaluation.module).\
-                subquery()
-
-            # Pocet odevzdanych uloh (zahrnuje i module not evaluation_public
-            # i napriklad automaticky opravovane moduly s 0 body)
-            tasks_per_user = session.query(
-                model.Evaluation.user.label('user'),
-                func.count(distinct(model.Task.id)).label('tasks_cnt')
-            ).\
-                join(model.Module,
-                     model.Evaluation.module == model.Module.id).\
-                join(model.Task, model.Task.id == model.Module.task).\
-                join(model.Wave, model.Wave.id == model.Task.wave).\
-                filter(model.Wave.year == req.context['year']).\
-                group_by(model.Evaluation.user).subquery()
-
-            # Ziskame vsechny uzivatele
-            # Tem, kteri maji evaluations, je prirazen pocet bodu a
-            # pocet odevzdanych uloh
+            # Skore, pocet odevzdanych uloh a podvadeni jsou materializovane
+            # v tabulce user_year_score (viz util/scoreboard.py).
             # Vraci n tici:
             # (model.User, total_score, tasks_cnt, model.Profile, cheat)
             # POZOR: outerjoin je dulezity, chceme vracet i uzivatele,
             # kteri nemaji zadna evaluations (napriklad orgove pro seznam orgu)
             users = session.query(
                 model.User,
-                func.sum(per_user.c.points).label("total_score"),
-                tasks_per_user.c.tasks_cnt.label('tasks_cnt'),
+                model.UserYearScore.total_score.label('total_score'),
+                model.UserYearScore.tasks_cnt.label('tasks_cnt'),
                 model.Profile,
-                func.max(per_user.c.cheat).label('cheat'),
+                model.UserYearScore.cheat.label('cheat'),
             ).\
-                outerjoin(per_user, model.User.id == per_user.c.user).\
-                outerjoin(tasks_per_user,
-                          model.User.id == tasks_per_user.c.user).\
-                join(model.Profile, model.User.id == model.Profile.user_id).\
-                group_by(model.User)
+                outerjoin(model.UserYearScore,
+                          and_(model.UserYearScore.user == model.User.id,
+                               model.UserYearScore.year ==
+                               req.context['year'])).\
+                join(model.Profile, model.User.id == model.Profile.user_id)
 
             # Filtrovani skupin uzivatelu
             if filt == 'organisators' or filt == 'orgs':
@@ -178,24 +150,24 @@ class Users(object):
                 # Resitele zobrazujeme jen v aktualnim rocniku
                 # (pro jine neni tasks_cnt definovano).
                 users = users.filter(model.User.role == 'participant').\
-                    having(text("total_score > 0"))
+                    filter(model.UserYearScore.total_score > 0)
                 if year:
                     users = users.filter(model.Profile.school_finish >=
                                          util.year.year_end(year))
 
             elif filt == 'part-other':
                 users = users.filter(model.User.role == 'participant').\
-                    having(text("total_score > 0"))
+                    filter(model.UserYearScore.total_score > 0)
                 if year:
                     users = users.filter(model.Profile.school_finish <
                                          util.year.year_end(year))
 
             elif filt == 'part' or filt == 'participants':
                 users = users.filter(model.User.role == 'participant').\
-                    filter(text("tasks_cnt"), text("tasks_cnt > 0"))
+                    filter(model.UserYearScore.tasks_cnt > 0)
             # Razeni uzivatelu
             if sort == 'score':
-                users = users.order_by(desc("total_score"))
+                users = users.order_by(desc(model.UserYearScore.total_score))
 
             # Polozime SQL dotaz a ziskame vsechny relevantni uzivatele
             users = users.all()
@@ -259,6 +231,18 @@ class Users(object):
             # -> nastavime jim natvrdo 'tasks_cnt' = 0 a total_score = 0,
             # abychom omezili dalsi SQL dotazy v util.user.to_json
 
+            # Radky vysledku vyse rozdelime po uzivatelich jednim pruchodem
+            achs_by_user = util.grouping.group_by_key(
+                achievements, lambda a: a.user_id, lambda a: a.a_id)
+            seasons_by_user = util.grouping.group_by_key(
+                seasons, lambda s: s.user_id, lambda s: s.year_id)
+            org_seasons_by_user = util.grouping.group_by_key(
+                org_seasons, lambda s: s.user_id, lambda s: s.year_id)
+            tasks_by_user = util.grouping.group_by_key(
+                users_tasks, lambda ut: ut[0].id, lambda ut: ut[1])
+            co_tasks_by_user = util.grouping.group_by_key(
+                users_co_tasks, lambda ut: ut[0].id, lambda ut: ut[1])
+
             users_json = [
                 util.user.to_json(
                     user=user.User,
@@ -266,32 +250,14 @@ class Users(object):
                     total_score=user.total_score if user.total_score else 0,
                     tasks_cnt=user.tasks_cnt if user.tasks_cnt else 0,
                     profile=user.Profile,
-                    achs=[item.a_id for item in achievements
-                          if item.user_id == user.User.id],
-                    seasons=[item.year_id for item in seasons
-                             if item.user_id == user.User.id],
-                    users_tasks=[
-                        task for (_, task) in [
-                            usr_task
-                            for usr_task in users_tasks
-                            if usr_task[0].id == user.User.id
-                        ]
-                    ] if users_tasks else None,
+                    achs=achs_by_user.get(user.User.id, []),
+                    seasons=seasons_by_user.get(user.User.id, []),
+                    users_tasks=tasks_by_user.get(user.User.id, []),
                     admin_data=req.context['user'].is_org(),
-                    org_seasons=[
-                        item.year_id
-                        for item in org_seasons if item.user_id == user.User.id
-                    ],
+                    org_seasons=org_seasons_by_user.get(user.User.id, []),
                     max_points=max_points,
-                    users_co_tasks=[
-                        task for (_, task) in [
-                            usr_task1
-                            for usr_task1 in users_co_tasks
-                            if usr_task1[0].id == user.User.id
-                        ]
-                    ]
-                    if users_co_tasks else None,
-                    cheat=user.cheat,
+                    users_co_tasks=co_tasks_by_user.get(user.User.id, []),
+                    cheat=user.cheat if user.cheat is not None else False,
                 )
 
                 for user in users
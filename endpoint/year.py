@@ -64,6 +64,7 @@ class Year(object):
                 session.add(org)
 
             session.commit()
+            util.year.invalidate_cache()
 
         except SQLAlchemyError:
             session.rollback()
@@ -98,6 +99,7 @@ class Year(object):
 
             session.delete(year)
             session.commit()
+            util.year.invalidate_cache()
             req.context['result'] = {}
 
         except SQLAlchemyError:
@@ -153,6 +155,7 @@ class Years(object):
 
             session.add(year)
             session.commit()
+            util.year.invalidate_cache()
 
             if 'active_orgs' in data:
                 for user_id in data['active_orgs']:
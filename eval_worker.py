@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""
+Worker pool draining the queue of programming module evaluations
+(table eval_jobs, see util/eval_queue.py).
+
+Must be run from the backend root directory next to gunicorn, e.g.:
+    ./ksi-py3-venv/bin/python3 eval_worker.py --processes 3
+
+Queue is used only when config key 'eval_queue' is set to '1'.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+
+from db import engine
+import util
+
+
+def _worker_main(index: int) -> None:
+    # Spojeni zdedena z rodice nesmime sdilet
+    engine.dispose()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    util.eval_queue.work()
+
+
+def _spawn(index: int) -> multiprocessing.Process:
+    p = multiprocessing.Process(target=_worker_main, args=(index,),
+                                name='eval-worker-%d' % index, daemon=True)
+    p.start()
+    return p
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-p', '--processes', type=int,
+                        default=util.programming.MAX_CONCURRENT_EXEC,
+                        help='number of parallel evaluations (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='[%(asctime)s] [%(process)d] %(message)s',
+                        level=logging.INFO)
+    log = logging.getLogger('gunicorn.error')
+
+    requeued = util.eval_queue.requeue_stale()
+    if requeued:
+        log.warning('Returned %d interrupted evaluations to the queue' %
+                    requeued)
+    engine.dispose()
+
+    workers = [_spawn(i) for i in range(args.processes)]
+    log.info('Started %d evaluation workers' % len(workers))
+
+    def _terminate(signum, frame):
+        for p in workers:
+            p.terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+
+    while True:
+        time.sleep(1)
+        for i, p in enumerate(workers):
+            if not p.is_alive():
+                log.error('Evaluation worker %s died with code %s, '
+                          'restarting' % (p.name, p.exitcode))
+                workers[i] = _spawn(i)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
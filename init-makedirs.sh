@@ -8,6 +8,7 @@ echo -n "Making data directories..."
 mkdir -p data/code_executions
 mkdir -p data/content/achievements data/content/articles
 mkdir -p data/images
+mkdir -p data/mail-spool
 mkdir -p data/modules
 mkdir -p data/seminar
 mkdir -p data/submissions
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""
+Delivers e-mails stored in the outbox (spool directory, see
+util/mail_outbox.py). Exactly one sender should run for a spool directory.
+
+Must be run from the backend root directory next to gunicorn, e.g.:
+    ./ksi-py3-venv/bin/python3 mail_sender.py
+
+For local testing run utils/debug-smtp.py and set MAIL_SMTP_HOST = 'localhost'
+and MAIL_SMTP_PORT = 8025 in config.py (or pass --host/--port).
+"""
+
+import argparse
+import logging
+import signal
+import sys
+
+import util
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=util.mail_outbox.SMTP_HOST,
+                        help='SMTP server (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=util.mail_outbox.SMTP_PORT,
+                        help='SMTP port (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='[%(asctime)s] [%(process)d] %(message)s',
+                        level=logging.INFO)
+    log = logging.getLogger('gunicorn.error')
+
+    requeued = util.mail_outbox.requeue_stale()
+    if requeued:
+        log.warning('Returned %d interrupted e-mails to the outbox' % requeued)
+
+    sender = util.mail_outbox.Sender(args.host, args.port)
+
+    def _terminate(signum, frame):
+        sender.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+
+    log.info('Sending e-mails from %s via %s:%d' %
+             (util.mail_outbox.SPOOL_PATH, args.host, args.port))
+    util.mail_outbox.work(sender)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
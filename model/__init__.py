@@ -21,9 +21,13 @@ from model.mail_easteregg import MailEasterEgg
 from model.feedback_recipients import FeedbackRecipient
 from model.programming import CodeExecution
 from model.evaluation import Evaluation
+from model.eval_job import EvalJob
+from model.mail_job import MailJob
+from model.post_event import PostEvent
 from model.submitted import SubmittedFile, SubmittedCode
 from model.active_orgs import ActiveOrg
 from model.feedback import Feedback
 from model.user_notify import UserNotify
 from model.diploma import Diploma
+from model.user_year_score import UserYearScore
 
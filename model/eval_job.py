@@ -0,0 +1,40 @@
+import datetime
+
+from sqlalchemy import (Column, Integer, String, Text, DateTime, ForeignKey,
+                        Enum, text)
+from sqlalchemy.types import TIMESTAMP
+
+from . import Base
+from .user import User
+from .module import Module
+from .evaluation import Evaluation
+
+
+class EvalJob(Base):
+    """
+    Jedno opraveni programovaciho modulu cekajici ve fronte.
+    Frontu zpracovava samostatny proces eval_worker.py.
+    """
+
+    __tablename__ = 'eval_jobs'
+    __table_args__ = {
+        'mysql_engine': 'InnoDB',
+        'mysql_charset': 'utf8mb4',
+    }
+
+    id = Column(Integer, primary_key=True)
+    evaluation = Column(Integer,
+                        ForeignKey(Evaluation.id, ondelete='CASCADE'),
+                        nullable=False)
+    user = Column(Integer, ForeignKey(User.id, ondelete='CASCADE'),
+                  nullable=False)
+    module = Column(Integer, ForeignKey(Module.id, ondelete='CASCADE'),
+                    nullable=False)
+    status = Column(Enum('queued', 'running', 'done', 'error'),
+                    nullable=False, default='queued', index=True)
+    result = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True)
+    created = Column(TIMESTAMP, default=datetime.datetime.utcnow,
+                     server_default=text('CURRENT_TIMESTAMP'))
+    started = Column(DateTime, nullable=True)
+    finished = Column(DateTime, nullable=True)
@@ -0,0 +1,43 @@
+import datetime
+
+from sqlalchemy import (Column, Integer, Text, DateTime, ForeignKey, Enum,
+                        text)
+from sqlalchemy.types import TIMESTAMP
+
+from . import Base
+from .user import User
+from .task import Task
+
+
+class MailJob(Base):
+    """
+    Odesilani informacnich e-mailu o opraveni ulohy na pozadi.
+    Zpracovava util/mail_job.py, prubeh je videt na /admin/mailJobs/{id}.
+    """
+
+    __tablename__ = 'mail_jobs'
+    __table_args__ = {
+        'mysql_engine': 'InnoDB',
+        'mysql_charset': 'utf8mb4',
+    }
+
+    id = Column(Integer, primary_key=True)
+    task = Column(Integer, ForeignKey(Task.id, ondelete='CASCADE'),
+                  nullable=False, index=True)
+    author = Column(Integer, ForeignKey(User.id, ondelete='SET NULL'),
+                    nullable=True)
+    status = Column(Enum('queued', 'running', 'done', 'error'),
+                    nullable=False, default='queued', index=True)
+    # Uloha, dokud odesilani neskonci (pak NULL); unikatni klic brani
+    # soubeznemu spusteni dvou odesilani k jedne uloze
+    active_task = Column(Integer, nullable=True, unique=True)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    errors = Column(Text, nullable=True)
+    # JSON seznam id zpracovanych prijemcu (odeslano i chyba)
+    processed = Column(Text, nullable=True)
+    created = Column(TIMESTAMP, default=datetime.datetime.utcnow,
+                     server_default=text('CURRENT_TIMESTAMP'))
+    updated = Column(DateTime, nullable=True)
+    finished = Column(DateTime, nullable=True)
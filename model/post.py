@@ -1,7 +1,7 @@
 import datetime
 
 from sqlalchemy import (Column, Integer, String, DateTime, Text, ForeignKey,
-                        text)
+                        Index, text)
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.orm import relationship
 
@@ -12,10 +12,13 @@ from .user import User
 
 class Post(Base):
     __tablename__ = 'posts'
-    __table_args__ = {
-        'mysql_engine': 'InnoDB',
-        'mysql_charset': 'utf8mb4'
-    }
+    __table_args__ = (
+        # Neprectene prispevky = rozsah published_at v ramci vlakna
+        Index('ix_posts_thread_published_at', 'thread', 'published_at'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4'
+        })
 
     id = Column(Integer, primary_key=True)
     thread = Column(Integer, ForeignKey(Thread.id, ondelete='CASCADE'),
@@ -0,0 +1,34 @@
+import datetime
+
+from sqlalchemy import (Column, Integer, Text, DateTime, ForeignKey, Enum,
+                        text)
+from sqlalchemy.types import TIMESTAMP
+
+from . import Base
+from .post import Post
+
+
+class PostEvent(Base):
+    """
+    Udalost prispevku cekajici na rozeslani notifikaci. Zaznamenava se ve
+    stejne transakci jako prispevek, zpracovava util/post_events.py.
+    """
+
+    __tablename__ = 'post_events'
+    __table_args__ = {
+        'mysql_engine': 'InnoDB',
+        'mysql_charset': 'utf8mb4',
+    }
+
+    id = Column(Integer, primary_key=True)
+    post = Column(Integer, ForeignKey(Post.id, ondelete='CASCADE'),
+                  nullable=False)
+    type = Column(Enum('post_created'), nullable=False,
+                  default='post_created')
+    status = Column(Enum('queued', 'running', 'done', 'error'),
+                    nullable=False, default='queued', index=True)
+    error = Column(Text, nullable=True)
+    created = Column(TIMESTAMP, default=datetime.datetime.utcnow,
+                     server_default=text('CURRENT_TIMESTAMP'))
+    started = Column(DateTime, nullable=True)
+    finished = Column(DateTime, nullable=True)
@@ -21,6 +21,10 @@ class Thread(Base):
     public = Column(Boolean, nullable=False, default=True,
                     server_default=text('TRUE'))
     year = Column(Integer, ForeignKey(Year.id), nullable=False)
+    # Denormalizovano z tabulky posts, udrzuje util.thread.update_counters
+    posts_count = Column(Integer, nullable=False, default=0,
+                         server_default=text('0'))
+    last_post_at = Column(TIMESTAMP, nullable=True)
 
     posts = relationship('Post', backref="Thread",
                          primaryjoin="Post.thread==Thread.id")
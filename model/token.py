@@ -16,6 +16,7 @@ class Token(Base):
 
     access_token = Column(String(150), primary_key=True)
     user = Column(Integer, ForeignKey(User.id))
-    expire = Column(DateTime, default=datetime.timedelta(hours=1))
-    refresh_token = Column(String(150))
+    expire = Column(DateTime, default=datetime.timedelta(hours=1),
+                    index=True)
+    refresh_token = Column(String(150), index=True)
     granted = Column(DateTime, default=datetime.datetime.utcnow)
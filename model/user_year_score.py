@@ -0,0 +1,32 @@
+from sqlalchemy import (Column, Integer, Boolean, ForeignKey, DECIMAL, Index,
+                        text)
+
+from . import Base
+from .user import User
+from .year import Year
+
+
+class UserYearScore(Base):
+    """
+    Materializovana vysledkova listina: soucet bodu, pocet odevzdanych uloh
+    a podvadeni uzivatele v rocniku. Udrzovano v util/scoreboard.py, pri
+    nekonzistenci lze prepocitat skriptem scoreboard.py.
+    """
+
+    __tablename__ = 'user_year_score'
+    __table_args__ = (
+        Index('ix_user_year_score_year_score', 'year', 'total_score'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+        })
+
+    user = Column(Integer, ForeignKey(User.id, ondelete='CASCADE'),
+                  primary_key=True, nullable=False)
+    year = Column(Integer, ForeignKey(Year.id, ondelete='CASCADE'),
+                  primary_key=True, nullable=False)
+    total_score = Column(DECIMAL(precision=10, scale=1, asdecimal=False),
+                         nullable=False, default=0)
+    tasks_cnt = Column(Integer, nullable=False, default=0)
+    cheat = Column(Boolean, nullable=False, default=False,
+                   server_default=text('FALSE'))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+"""
+Rebuilds or checks the materialized scoreboard (table user_year_score,
+see util/scoreboard.py).
+
+Must be run from the backend root directory, e.g.:
+    ./ksi-py3-venv/bin/python3 scoreboard.py check
+    ./ksi-py3-venv/bin/python3 scoreboard.py rebuild --year 5
+"""
+
+import argparse
+import sys
+
+from db import session
+import model
+import util
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('action', choices=('rebuild', 'check'))
+    parser.add_argument('-y', '--year', type=int, action='append',
+                        help='year id, can be repeated (default: all years)')
+    args = parser.parse_args()
+
+    years = args.year if args.year else \
+        [year_id for (year_id,) in session.query(model.Year.id).all()]
+
+    inconsistent = 0
+    for year_id in years:
+        if args.action == 'rebuild':
+            changed = util.scoreboard.refresh(year_id)
+            print('Year %d: %d rows changed' % (year_id, changed))
+        else:
+            diffs = util.scoreboard.check(year_id)
+            inconsistent += len(diffs)
+            for user, stored, computed in diffs:
+                print('Year %d, user %d: stored %s, computed %s' %
+                      (year_id, user, stored, computed))
+            print('Year %d: %d inconsistent rows' % (year_id, len(diffs)))
+
+    session.close()
+    return 1 if inconsistent else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,22 +8,34 @@ from . import admin
 
 from . import module
 from . import task
+from . import task_status
 from . import prerequisite
 from . import quiz
 from . import sortable
 from . import programming
+from . import sandbox_pool
+from . import eval_queue
+from . import scoreboard
 from . import achievement
 from . import user
 from . import profile
 from . import thread
 from . import post
 from . import mail
+from . import mail_outbox
+from . import mail_job
+from . import post_events
 from . import config
 from . import text
 from . import correction
 from . import correctionInfo
 from . import wave
 from . import submissions
+from . import zipstream
+from . import mime
+from . import file_response
+from . import serializer
+from . import compression
 from . import year
 from . import content
 from . import git
@@ -31,6 +43,9 @@ from . import lock
 from . import feedback
 from . import user_notify
 from . import logger
+from . import cache
+from . import sql_profiler
+from . import grouping
 
 
 def decode_form_data(req):
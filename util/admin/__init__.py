@@ -1,4 +1,7 @@
+from . import pandocRender
+from . import deployManifest
 from . import taskDeploy
 from . import taskMerge
 from . import waveDiff
 from . import task
+from . import waveDeploy
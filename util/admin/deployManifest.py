@@ -0,0 +1,204 @@
+"""
+Incremental task deploy.
+
+After a successful deploy, a manifest of the task is stored in
+MANIFEST_PATH: the deployed commit, hashes of all source files and, for
+every part of the task (assignment, solution, modules), a key computed from
+the hashes of its sources and everything else its output depends on,
+together with a hash of the resulting database values. A part whose key and
+database values are the same as in the manifest is not processed again.
+
+The manifest is removed when a deploy starts, so after a failed deploy the
+next one processes everything.
+
+Data directories are synchronized instead of being deleted and copied:
+only new and changed files are copied (or hardlinked), and files removed
+from the repository are deleted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Callable, Dict, List, Optional, Tuple
+
+MANIFEST_PATH = 'data/deploy-manifests'
+HASH_CHUNK = 1 << 16
+
+# relativni cesta -> [velikost, mtime_ns, sha1]
+FileHashes = Dict[str, list]
+# adresar -> jmena souboru
+Changes = Dict[str, List[str]]
+
+
+def _sha1_file(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_tree(root: str, previous: FileHashes) -> FileHashes:
+    """
+    Hashes all files in 'root'. Files with the same size and mtime as in
+    'previous' are not read again (git does not touch unchanged files).
+    """
+    hashes = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            rel = os.path.relpath(path, root)
+            st = os.stat(path)
+            known = previous.get(rel)
+            if known is not None and known[:2] == [st.st_size,
+                                                  st.st_mtime_ns]:
+                hashes[rel] = known
+            else:
+                hashes[rel] = [st.st_size, st.st_mtime_ns, _sha1_file(path)]
+    return hashes
+
+
+def digest(*values) -> str:
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).
+                        encode('utf-8')).hexdigest()
+
+
+class DeployManifest(object):
+
+    def __init__(self, task_id: int, commit: Optional[str] = None) -> None:
+        self.task_id = task_id
+        self.commit = commit
+        self.files: FileHashes = {}
+        self.parts: Dict[str, dict] = {}
+        self.previous: Dict[str, dict] = {}
+
+    @staticmethod
+    def _path(task_id: int) -> str:
+        return os.path.join(MANIFEST_PATH, '%d.json' % task_id)
+
+    @classmethod
+    def start(cls, task_id: int, source_path: str,
+              commit: Optional[str] = None) -> 'DeployManifest':
+        """
+        Loads manifest of the previous deploy and removes it from disk.
+        Hashes of sources are reused when the commit has not changed.
+        """
+        manifest = cls(task_id, commit)
+        path = cls._path(task_id)
+        try:
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError):
+            stored = {}
+
+        manifest.previous = stored.get('parts', {})
+        previous_files = stored.get('files', {})
+        if commit is not None and stored.get('commit') == commit:
+            manifest.files = previous_files
+        else:
+            manifest.files = hash_tree(source_path, previous_files)
+        return manifest
+
+    def save(self) -> None:
+        os.makedirs(MANIFEST_PATH, exist_ok=True)
+        path = self._path(self.task_id)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'commit': self.commit, 'files': self.files,
+                       'parts': self.parts}, f)
+        os.replace(path + '.tmp', path)
+
+    def sources(self, prefix: str) -> str:
+        """Digest of source files in directory 'prefix' (or of one file)."""
+        return digest(sorted(
+            (rel, sha) for rel, (_, _, sha) in self.files.items()
+            if rel == prefix or rel.startswith(prefix + os.sep)
+        ))
+
+    def unchanged(self, name: str, key: str,
+                  outputs: str) -> Optional[dict]:
+        """
+        Returns the stored part if it was deployed with the same key and
+        the database still contains its outputs.
+        """
+        part = self.previous.get(name)
+        if part is not None and part['key'] == key and \
+                part['outputs'] == outputs:
+            return part
+        return None
+
+    def record(self, name: str, key: str, outputs: str, **extra) -> None:
+        self.parts[name] = dict(extra, key=key, outputs=outputs)
+
+
+def _link_or_copy(source: str, target: str, link: bool) -> None:
+    if os.path.isdir(target) and not os.path.islink(target):
+        shutil.rmtree(target)
+    tmp_path = target + '.deploy-tmp'
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        if not link:
+            raise OSError()
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def sync_tree(source: str, target: str, link: bool = False,
+              keep: Optional[Callable[[str], bool]] = None
+              ) -> Tuple[Changes, Changes]:
+    """
+    Makes 'target' a copy of 'source' (empty if 'source' does not exist),
+    copying only files whose size or mtime differ (copies keep mtime). With 'link' files are hardlinked,
+    the repository replaces changed files, it does not rewrite them.
+    :param keep: predicate of names of target-only files, which are neither
+        copied from 'source' nor deleted
+    :return: (changed, removed) files by target directory
+    """
+    changed: Changes = {}
+    removed: Changes = {}
+    os.makedirs(target, exist_ok=True)
+
+    for directory, _, files in os.walk(source):
+        target_dir = os.path.normpath(
+            os.path.join(target, os.path.relpath(directory, source)))
+        if not os.path.isdir(target_dir):
+            if os.path.lexists(target_dir):
+                os.remove(target_dir)
+            os.makedirs(target_dir)
+        for name in files:
+            if keep is not None and keep(name):
+                continue
+            source_file = os.path.join(directory, name)
+            target_file = os.path.join(target_dir, name)
+            st = os.stat(source_file)
+            try:
+                target_st = os.stat(target_file)
+            except FileNotFoundError:
+                target_st = None
+            if target_st is not None and (
+                    os.path.samestat(st, target_st) or
+                    (target_st.st_size == st.st_size and
+                     target_st.st_mtime_ns == st.st_mtime_ns)):
+                continue
+            _link_or_copy(source_file, target_file, link)
+            changed.setdefault(target_dir, []).append(name)
+
+    for directory, dirs, files in os.walk(target, topdown=False):
+        source_dir = os.path.normpath(
+            os.path.join(source, os.path.relpath(directory, target)))
+        if directory != target and not os.path.isdir(source_dir):
+            shutil.rmtree(directory)
+            continue
+        for name in files:
+            if keep is not None and keep(name):
+                continue
+            if os.path.isfile(os.path.join(source_dir, name)):
+                continue
+            os.remove(os.path.join(directory, name))
+            removed.setdefault(directory, []).append(name)
+
+    return changed, removed
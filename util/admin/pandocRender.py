@@ -0,0 +1,137 @@
+"""
+Rendering of task markdown by pandoc during deploy.
+
+Every pandoc invocation is a new process, so rendering a quiz with many
+questions and options one fragment at a time takes most of the deploy.
+render_many() joins fragments into one document separated by unique marker
+paragraphs, runs pandoc once and splits the output again. Fragments whose
+rendering could depend on the rest of the document (headings get unique
+ids, footnotes and link references are document-wide, raw block HTML and
+fences may swallow the marker) are rendered separately.
+
+Results are cached on disk (CACHE_PATH) by hash of the pandoc version, its
+arguments and the source, so unchanged fragments are not rendered again by
+later deploys. The cache directory can be deleted at any time.
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from typing import Dict, List, Optional
+
+import pypandoc
+
+CACHE_PATH = 'data/pandoc-cache'
+TO_FORMAT = 'html5'
+FROM_FORMAT = 'markdown+smart'
+EXTRA_ARGS = ['--mathjax', '--email-obfuscation=none']
+
+# Fragmenty, ktere nelze bezpecne vykreslit v jednom dokumentu s ostatnimi
+_UNSAFE = re.compile(
+    r'^\s{0,3}#|'                    # nadpisy (id musi byt unikatni)
+    r'^\s{0,3}(```|~~~)|'            # bloky kodu (neuzavreny pohlti oddelovac)
+    r'\[\^|'                         # poznamky pod carou
+    r'^\s{0,3}\[[^\]]+\]:|'          # definice odkazu
+    r'<!--|'
+    r'<(div|section|details|table|pre|ul|ol|blockquote|script|style)\b',
+    re.MULTILINE | re.IGNORECASE
+)
+
+_version: Optional[str] = None
+
+
+def _pandoc(source: str) -> str:
+    return pypandoc.convert(source, TO_FORMAT, format=FROM_FORMAT,
+                            extra_args=EXTRA_ARGS)
+
+
+def _key(source: str) -> str:
+    global _version
+    if _version is None:
+        _version = pypandoc.get_pandoc_version()
+    return hashlib.sha256('\0'.join(
+        [_version, TO_FORMAT, FROM_FORMAT] + EXTRA_ARGS + [source]
+    ).encode('utf-8')).hexdigest()
+
+
+def _cache_file(key: str) -> str:
+    return os.path.join(CACHE_PATH, key[:2], key + '.html')
+
+
+def _cache_get(key: str) -> Optional[str]:
+    try:
+        with open(_cache_file(key), 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _cache_put(key: str, html: str) -> None:
+    path = _cache_file(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+
+
+def batchable(source: str) -> bool:
+    """Can the fragment be rendered in one document with others?"""
+    return bool(source.strip()) and _UNSAFE.search(source) is None
+
+
+def _render_batch(sources: List[str]) -> List[str]:
+    if len(sources) == 1:
+        return [_pandoc(sources[0])]
+
+    marker = 'KSIFRAGMENT' + uuid.uuid4().hex
+    document = ''.join(
+        source + ('\n\n%s%d\n\n' % (marker, i) if i < len(sources) - 1 else '')
+        for i, source in enumerate(sources)
+    )
+    parts = re.split('<p>%s(\\d+)</p>\n' % marker, _pandoc(document))
+
+    # re.split vraci [html, cislo, html, cislo, ..., html]
+    numbers = parts[1::2]
+    if numbers != [str(i) for i in range(len(sources) - 1)]:
+        # Oddelovac byl pohlcen okolnim blokem, vykreslime po jednom
+        return [_pandoc(source) for source in sources]
+    return parts[0::2]
+
+
+def render_many(sources: List[str]) -> List[str]:
+    """
+    Renders markdown fragments to HTML (same output as rendering each of
+    them separately), using at most one pandoc run for all batchable
+    fragments missing in the cache.
+    """
+    keys = [_key(source) for source in sources]
+    rendered: Dict[str, str] = {}
+    for key in set(keys):
+        html = _cache_get(key)
+        if html is not None:
+            rendered[key] = html
+
+    missing: Dict[str, str] = {}
+    for key, source in zip(keys, sources):
+        if key not in rendered:
+            missing[key] = source
+
+    batch = [key for key, source in missing.items() if batchable(source)]
+    if batch:
+        for key, html in zip(batch,
+                             _render_batch([missing[k] for k in batch])):
+            rendered[key] = html
+    for key, source in missing.items():
+        if key not in rendered:
+            rendered[key] = _pandoc(source)
+
+    for key in missing:
+        _cache_put(key, rendered[key])
+    return [rendered[key] for key in keys]
+
+
+def render(source: str) -> str:
+    """Renders one markdown fragment to HTML."""
+    return render_many([source])[0]
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Optional
 
@@ -18,7 +19,6 @@ from typing import Dict, Union
 
 import dateutil.parser
 import git
-import pypandoc
 import pyparsing as pp
 from lockfile import LockFile
 from sqlalchemy import and_, func
@@ -35,6 +35,8 @@ LOGFILE = 'data/deploy.log'
 # Deploy je spousten v samostatnem vlakne.
 session: Optional[Session] = None
 eval_public = True
+# Doba trvani jednotlivych fazi deploye (sekundy)
+timings: Dict[str, float] = {}
 
 
 @dataclass
@@ -74,8 +76,8 @@ def deploy(task_id: int, year_id: int, deployLock: LockFile, scoped: Callable) -
         task = session.query(model.Task).get(task_id)
         year = session.query(model.Year).get(year_id)
 
-        global eval_public
-        eval_public = True
+        global timings
+        timings = {}
 
         # Create log file
         create_log(task, "deploying")
@@ -87,21 +89,22 @@ def deploy(task_id: int, year_id: int, deployLock: LockFile, scoped: Callable) -
         repo = git.Repo(util.git.GIT_SEMINAR_PATH)
         assert not repo.bare
 
-        # Fetch origin
-        # if not task.git_branch in repo.branches:
-        log("Fetching origin...")
-        for fetch_info in repo.remotes.origin.fetch():
-            if str(fetch_info.ref) == "origin/" + task.git_branch:
-                log("Updated " + str(fetch_info.ref) + " to " +
-                    str(fetch_info.commit))
+        with phase('fetch'):
+            # Fetch origin
+            # if not task.git_branch in repo.branches:
+            log("Fetching origin...")
+            for fetch_info in repo.remotes.origin.fetch():
+                if str(fetch_info.ref) == "origin/" + task.git_branch:
+                    log("Updated " + str(fetch_info.ref) + " to " +
+                        str(fetch_info.commit))
 
-        # Check out task branch
-        log("Checking out " + task.git_branch)
-        log(repo.git.checkout(task.git_branch))
+            # Check out task branch
+            log("Checking out " + task.git_branch)
+            log(repo.git.checkout(task.git_branch))
 
-        # Discard all local changes
-        log("Hard-reseting to origin/" + task.git_branch)
-        repo.git.reset("--hard", "origin/" + task.git_branch)
+            # Discard all local changes
+            log("Hard-reseting to origin/" + task.git_branch)
+            repo.git.reset("--hard", "origin/" + task.git_branch)
 
         # Check if task path exists
         if not os.path.isdir(util.git.GIT_SEMINAR_PATH + task.git_path):
@@ -110,47 +113,9 @@ def deploy(task_id: int, year_id: int, deployLock: LockFile, scoped: Callable) -
             session.commit()
             return
 
-        # Save max points before for modifying the point pad
-        max_points_before: float = max_points(task.id)
-        log(f"Current task max points: {max_points_before}")
-        log(f"Current year point pad: {year.point_pad}")
-
-        # Parse task
-        log("Parsing " + util.git.GIT_SEMINAR_PATH + task.git_path)
-        process_task(task, util.git.GIT_SEMINAR_PATH + task.git_path)
-
-        # Compare the max points and edit the point pad accordingly
-        max_points_now: float = max_points(task.id)
-        max_points_diff = max_points_before - max_points_now
-        log(f"New task max points: {max_points_now} (before {max_points_before}, diff {max_points_diff})")
-
-        if max_points_diff == 0.0:
-            log("Point diff is zero, no change is necessary")
-        elif year.point_pad == 0.0:
-            log("The year's point pad is already zero, not modifying it")
-        else:
-            new_point_pad = max(0.0, year.point_pad + max_points_diff)
-            log(f"Setting the year's point pad to {new_point_pad}")
-            year.point_pad = new_point_pad
-
-        # Update git entries in db
-        if task.time_deadline > datetime.datetime.utcnow():
-            # Tak is being deployed before deadline
-            task.evaluation_public = eval_public
-        else:
-            # Task is deployed after deadline
-            # |= is important for deploying after task is published
-            task.evaluation_public |= eval_public
-
-        task.git_commit = repo.head.commit.hexsha
-        task.deploy_status = 'done'
-
-        # Update thread name
-        thread = session.query(model.Thread).get(task.thread)
-        if thread:
-            thread.title = task.title
-
-        session.commit()
+        deploy_checked_out(task, year,
+                           util.git.GIT_SEMINAR_PATH + task.git_path,
+                           repo.head.commit.hexsha)
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         log("Exception: " + traceback.format_exc())
@@ -163,25 +128,114 @@ def deploy(task_id: int, year_id: int, deployLock: LockFile, scoped: Callable) -
     finally:
         if deployLock.is_locked():
             deployLock.release()
+        log("Timings: " + format_timings())
         log("Done")
         session.close()
         scoped.remove()
 
+
+def deploy_checked_out(task: model.Task, year: model.Year, path: str,
+                       commit: str, update_point_pad: bool = True) -> float:
+    """
+    Deploy ulohy z jiz pripraveneho adresare \path (checkout \commit).
+    Sdileno deployem jedne ulohy a deployem cele vlny (waveDeploy).
+    :param update_point_pad: False -> point pad rocniku neupravovat
+        (vlna ho upravi najednou za vsechny ulohy)
+    :return: o kolik se snizil maximalni pocet bodu ulohy
+    """
+    global eval_public
+    eval_public = True
+
+    # Save max points before for modifying the point pad
+    max_points_before: float = max_points(task.id)
+    log(f"Current task max points: {max_points_before}")
+    log(f"Current year point pad: {year.point_pad}")
+
+    # Parse task
+    log("Parsing " + path)
+    process_task(task, path, commit)
+
+    # Compare the max points and edit the point pad accordingly
+    max_points_now: float = max_points(task.id)
+    max_points_diff = max_points_before - max_points_now
+    log(f"New task max points: {max_points_now} (before {max_points_before}, diff {max_points_diff})")
+
+    if update_point_pad:
+        update_year_point_pad(year, max_points_diff)
+
+    # Update git entries in db
+    eval_public_before = task.evaluation_public
+    if task.time_deadline > datetime.datetime.utcnow():
+        # Tak is being deployed before deadline
+        task.evaluation_public = eval_public
+    else:
+        # Task is deployed after deadline
+        # |= is important for deploying after task is published
+        task.evaluation_public |= eval_public
+
+    task.git_commit = commit
+    task.deploy_status = 'done'
+
+    # Update thread name
+    thread = session.query(model.Thread).get(task.thread)
+    if thread:
+        thread.title = task.title
+
+    session.commit()
+
+    if task.evaluation_public != eval_public_before:
+        util.scoreboard.update_task(task.id, session)
+
+    return max_points_diff
+
+
+def update_year_point_pad(year: model.Year, max_points_diff: float) -> None:
+    if max_points_diff == 0.0:
+        log("Point diff is zero, no change is necessary")
+    elif year.point_pad == 0.0:
+        log("The year's point pad is already zero, not modifying it")
+    else:
+        new_point_pad = max(0.0, year.point_pad + max_points_diff)
+        log(f"Setting the year's point pad to {new_point_pad}")
+        year.point_pad = new_point_pad
+
+
+@contextmanager
+def phase(name: str):
+    """Pricte dobu behu bloku do timings[name]"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.monotonic() - start
+
+
+def format_timings() -> str:
+    return ', '.join(f"{name} {seconds:.2f} s"
+                     for name, seconds in timings.items())
+
 ###############################################################################
 # Parsovani dat z repozitare:
 
 
-def process_task(task: model.Task, path: str) -> None:
+def process_task(task: model.Task, path: str,
+                 commit: Optional[str] = None) -> None:
     """Zpracovani cele ulohy
     Data commitujeme do databaze postupne, abychom videli, kde doslo k
     pripadnemu selhani operace.
+    Casti ulohy, ktere se od posledniho uspesneho deploye nezmenily, se
+    znovu nezpracovavaji (viz util/admin/deployManifest.py).
     """
 
     try:
         DATAPATH = f"data/task-content/{task.id}"
 
-        process_meta(task, path + "/task.json")
-        session.commit()
+        manifest = util.admin.deployManifest.DeployManifest.start(
+            task.id, path, commit)
+
+        with phase('meta'):
+            process_meta(task, path + "/task.json")
+            session.commit()
 
         replacement_metadata = ReplacementMetadata.get_default()
 
@@ -196,24 +250,51 @@ def process_task(task: model.Task, path: str) -> None:
         task.mangled_soldir = mangled_dirname(
             f"data/task-content/{task.id}", "reseni_")
 
-        log("Processing assignment")
-        process_assignment(task, path + "/assignment.md", replacement_metadata)
-        session.commit()
-
-        log("Processing solution")
-        process_solution(task, path + "/solution.md", replacement_metadata)
-        session.commit()
-
-        log("Processing icons & data")
-        copy_icons(task, path + "/icons/")
-        copy_data(task, f"{path}/data",
-                  os.path.join(DATAPATH, task.mangled_datadir))
-        copy_data(task, f"{path}/data_solution",
-                  os.path.join(DATAPATH, task.mangled_soldir))
+        # Vystup zavisi krome zdrojovych souboru i na techto hodnotach
+        context = [util.config.backend_url(), task.mangled_datadir,
+                   task.mangled_soldir]
+
+        with phase('assignment'):
+            log("Processing assignment")
+            key = deploy_key(manifest.sources("assignment.md"), context,
+                             replacement_metadata)
+            part = manifest.unchanged("assignment", key, assignment_outputs(task))
+            if part is not None:
+                log("Assignment unchanged")
+                replacement_metadata.collapse_max_id = part['collapse_max_id']
+            else:
+                process_assignment(task, path + "/assignment.md", replacement_metadata)
+                session.commit()
+            manifest.record("assignment", key, assignment_outputs(task),
+                            collapse_max_id=replacement_metadata.collapse_max_id)
+
+            log("Processing solution")
+            key = deploy_key(manifest.sources("solution.md"), context,
+                             replacement_metadata)
+            part = manifest.unchanged("solution", key, solution_outputs(task))
+            if part is not None:
+                log("Solution unchanged")
+                replacement_metadata.collapse_max_id = part['collapse_max_id']
+            else:
+                process_solution(task, path + "/solution.md", replacement_metadata)
+                session.commit()
+            manifest.record("solution", key, solution_outputs(task),
+                            collapse_max_id=replacement_metadata.collapse_max_id)
+
+        with phase('copy'):
+            log("Processing icons & data")
+            copy_icons(task, path + "/icons/")
+            copy_data(task, f"{path}/data",
+                      os.path.join(DATAPATH, task.mangled_datadir))
+            copy_data(task, f"{path}/data_solution",
+                      os.path.join(DATAPATH, task.mangled_soldir))
+
+        with phase('modules'):
+            log("Processing modules")
+            process_modules(task, path, replacement_metadata, manifest, context)
+            session.commit()
 
-        log("Processing modules")
-        process_modules(task, path, replacement_metadata)
-        session.commit()
+        manifest.save()
     except BaseException:
         session.rollback()
         raise
@@ -221,6 +302,29 @@ def process_task(task: model.Task, path: str) -> None:
         log("Task processing done")
 
 
+def deploy_key(sources: str, context: List[str],
+               replacement_metadata: ReplacementMetadata) -> str:
+    """Klic casti ulohy: zdrojove soubory, kontext a cislovani collapse"""
+    return util.admin.deployManifest.digest(
+        sources, context, replacement_metadata.collapse_max_id)
+
+
+def assignment_outputs(task: model.Task) -> str:
+    return util.admin.deployManifest.digest(task.title, task.intro, task.body)
+
+
+def solution_outputs(task: model.Task) -> str:
+    return util.admin.deployManifest.digest(task.solution)
+
+
+def module_outputs(module: model.Module) -> str:
+    return util.admin.deployManifest.digest(
+        module.type, module.name, module.description, module.data,
+        module.max_points, module.autocorrect, module.bonus, module.action,
+        module.custom
+    )
+
+
 def process_meta(task: model.Task, filename: str) -> None:
     def local2UTC(LocalTime: datetime) -> datetime:
         EpochSecond = time.mktime(LocalTime.timetuple())
@@ -443,6 +547,7 @@ def copy_icons(task: model.Task, source_path: str) -> None:
     for f in files:
         if os.path.isfile(source_path + "/" + f):
             shutil.copy2(source_path + "/" + f, target_path + f)
+    util.mime.update_index(target_path, files)
 
 
 def mangled_dirname(base_directory: str, prefix: str) -> str:
@@ -469,15 +574,23 @@ def mangled_dirname(base_directory: str, prefix: str) -> str:
 
 
 def copy_data(task: model.Task, source_path: str, target_path: str) -> None:
-    """Copy all data from repository to backend path."""
-    if not os.path.isdir(target_path):
-        os.makedirs(target_path)
-    shutil.rmtree(target_path)
-    if os.path.isdir(source_path):
-        shutil.copytree(source_path, target_path)
-
-
-def process_modules(task, git_path, replacement_metadata: Optional[ReplacementMetadata] = None):
+    """
+    Synchronize data from repository to backend path, only changed files
+    are hardlinked (or copied).
+    """
+    changed, removed = util.admin.deployManifest.sync_tree(
+        source_path, target_path, link=True, keep=util.mime.is_index)
+    for directory, names in changed.items():
+        util.mime.update_index(directory, names)
+    for directory, names in removed.items():
+        util.mime.remove_from_index(directory, names)
+    log(f"{target_path}: {sum(map(len, changed.values()))} files changed, "
+        f"{sum(map(len, removed.values()))} removed")
+
+
+def process_modules(task, git_path, replacement_metadata: Optional[ReplacementMetadata] = None,
+                    manifest: Optional["util.admin.deployManifest.DeployManifest"] = None,
+                    context: Optional[List[str]] = None):
     # Aktualni moduly v databazi
     modules = session.query(model.Module).\
         filter(model.Module.task == task.id).\
@@ -499,7 +612,12 @@ def process_modules(task, git_path, replacement_metadata: Optional[ReplacementMe
             session.commit()
 
         log("Processing module" + str(i + 1))
-        process_module(module, git_path + "/module" + str(i + 1), task, replacement_metadata)
+        if manifest is None:
+            process_module(module, git_path + "/module" + str(i + 1), task, replacement_metadata)
+        else:
+            process_module_incremental(module, git_path, i + 1, task,
+                                       replacement_metadata, manifest,
+                                       context)
 
         try:
             session.commit()
@@ -527,6 +645,32 @@ def process_modules(task, git_path, replacement_metadata: Optional[ReplacementMe
         i += 1
 
 
+def process_module_incremental(module, git_path, number, task,
+                               replacement_metadata: ReplacementMetadata,
+                               manifest: "util.admin.deployManifest.DeployManifest",
+                               context: List[str]) -> None:
+    """Zpracovani modulu, pokud se od posledniho deploye zmenil"""
+    name = "module" + str(number)
+    key = deploy_key(manifest.sources(name), context + [module.id],
+                     replacement_metadata)
+    part = manifest.unchanged(name, key, module_outputs(module))
+
+    if part is not None and \
+            os.path.isdir(os.path.join("data", "modules", str(module.id))):
+        log("Module unchanged")
+        replacement_metadata.collapse_max_id = part['collapse_max_id']
+        if not module.autocorrect:
+            global eval_public
+            eval_public = False
+    else:
+        process_module(module, git_path + "/" + name, task, replacement_metadata)
+        # Vystupy se porovnavaji s hodnotami nactenymi z databaze
+        session.commit()
+
+    manifest.record(name, key, module_outputs(module),
+                    collapse_max_id=replacement_metadata.collapse_max_id)
+
+
 def process_module(module, module_path, task, replacement_metadata: Optional[ReplacementMetadata] = None):
     """Zpracovani modulu
     'module' je vzdy inicializovany
@@ -538,9 +682,7 @@ def process_module(module, module_path, task, replacement_metadata: Optional[Rep
     # Copy whole module directory into data/modules
     log("Copying module data")
     target_path = os.path.join("data", "modules", str(module.id))
-    if os.path.isdir(target_path):
-        shutil.rmtree(target_path)
-    shutil.copytree(module_path, target_path)
+    util.admin.deployManifest.sync_tree(module_path, target_path)
 
     module.custom = os.path.isfile(os.path.join(target_path, "module-gen"))
 
@@ -687,8 +829,8 @@ def process_module_programming(module: model.Module, lines: List[str],
 def process_module_quiz(module, lines, specific, task, replacement_metadata: Optional[ReplacementMetadata] = None):
     log("Processing quiz module")
 
-    # Hledame jednotlive otazky
-    quiz_data = []
+    # Hledame jednotlive otazky, pandocem se parsuji az vsechny najednou
+    questions = []
     line = 0
     text_end = 0
     while (line < len(lines)):
@@ -701,21 +843,16 @@ def process_module_quiz(module, lines, specific, task, replacement_metadata: Opt
             break
 
         # Parsovani otazky
-        question = {}
         head = re.match(r"^##(.*?) \((r|c)\)", lines[line])
-        question['question'] = re.match("<p>(.*)</p>",
-                                        parse_pandoc(head.group(1))).group(1)
-        if head.group(2) == 'r':
-            question['type'] = 'radio'
-        else:
-            question['type'] = 'checkbox'
+        qtype = 'radio' if head.group(2) == 'r' else 'checkbox'
 
         # Hledame pruvodni text otazky
         line += 1
         end = line
         while (end < len(lines)) and (not re.match(r"^~", lines[end])):
             end += 1
-        question['text'] = parse_simple_text(task, ''.join(lines[line:end]), replacement_metadata)
+        text = _simple_text_source(''.join(lines[line:end]),
+                                   replacement_metadata)
 
         # Parsujeme mozne odpovedi
         line = end
@@ -726,18 +863,32 @@ def process_module_quiz(module, lines, specific, task, replacement_metadata: Opt
                              lines[line] + " -")
             if not match:
                 break
-            options.append(parse_pandoc(match.group(1)).replace("<p>", "").
-                           replace("</p>", "").replace('\n', ''))
+            options.append(match.group(1))
             if match.group(2) == '*':
                 correct.append(len(options) - 1)
 
             line += 1
 
-        question['options'] = options
-        question['correct'] = correct
+        questions.append((head.group(1), qtype, text, options, correct))
 
-        # Pridame otazku
-        quiz_data.append(question)
+    parsed = iter(parse_pandoc_many([
+        source
+        for head, _, text, options, _ in questions
+        for source in [head, text] + options
+    ]))
+
+    quiz_data = []
+    for _, qtype, _, options, correct in questions:
+        quiz_data.append({
+            'question': re.match("<p>(.*)</p>", next(parsed)).group(1),
+            'type': qtype,
+            'text': _simple_text_html(task, next(parsed)),
+            'options': [
+                next(parsed).replace("<p>", "").replace("</p>", "").
+                replace('\n', '') for _ in options
+            ],
+            'correct': correct,
+        })
 
     module.data = json.dumps({'quiz': quiz_data}, indent=2, ensure_ascii=False)
     return lines[:text_end]
@@ -759,34 +910,38 @@ def process_module_sortable(module: model.Module,
     text_end = line
 
     # Parsovani fixed casti
+    fixed = []
     while line < len(lines):
         match = re.match(r"^~\s*(.*)", lines[line])
         if not match:
             break
-        parsed = parse_pandoc(match.group(1)).replace("<p>", "").\
-            replace("</p>", "").replace('\n', '')
-        sort_data['fixed'].append({
-            'content': parsed,
-            'offset': get_sortable_offset(parsed)
-        })
+        fixed.append(match.group(1))
         line += 1
 
     # Volny radek mezi fixed a movable casti
     line += 1
 
     # Movable cast
+    movable = []
     while line < len(lines):
         match = re.match(r"^~\s*(.*)", lines[line])
         if not match:
             break
-        parsed = parse_pandoc(match.group(1)).replace("<p>", "").\
-            replace("</p>", "").replace('\n', '')
-        sort_data['movable'].append({
-            'content': parsed,
-            'offset': get_sortable_offset(parsed)
-        })
+        movable.append(match.group(1))
         line += 1
 
+    parsed = [
+        html.replace("<p>", "").replace("</p>", "").replace('\n', '')
+        for html in parse_pandoc_many(fixed + movable)
+    ]
+    for key, items in (('fixed', parsed[:len(fixed)]),
+                       ('movable', parsed[len(fixed):])):
+        for content in items:
+            sort_data[key].append({
+                'content': content,
+                'offset': get_sortable_offset(content)
+            })
+
     # Parsovani spravnych poradi
     while line < len(lines):
         match = re.match(r"^\s*\((((a|b)\d+,)*(a|b)\d+)\)", lines[line])
@@ -827,8 +982,7 @@ def process_module_text(module, lines, specific, path, task, replacement_metadat
         if not match:
             break
 
-        questions.append(parse_simple_text(task, match.group(1), replacement_metadata).
-                         replace("<p>", "").replace("</p>", ""))
+        questions.append(match.group(1))
 
         inputs_cnt += 1
         if match.group(3):
@@ -839,7 +993,11 @@ def process_module_text(module, lines, specific, path, task, replacement_metadat
 
         line += 1
 
-    text_data['questions'] = questions
+    text_data['questions'] = [
+        question.replace("<p>", "").replace("</p>", "")
+        for question in parse_simple_texts(task, questions,
+                                           replacement_metadata)
+    ]
     text_data['inputs'] = inputs_cnt
     if len(diff) > 0:
         text_data['diff'] = diff
@@ -861,12 +1019,13 @@ def process_module_text(module, lines, specific, path, task, replacement_metadat
 def parse_pandoc(source: str) -> str:
     """Parsovani stringu \source pandocem"""
 
-    return pypandoc.convert(
-        source,
-        'html5',
-        format='markdown+smart',
-        extra_args=['--mathjax', '--email-obfuscation=none']
-    )
+    return util.admin.pandocRender.render(source)
+
+
+def parse_pandoc_many(sources: List[str]) -> List[str]:
+    """Parsovani vice stringu jednim spustenim pandocu (viz pandocRender)"""
+
+    return util.admin.pandocRender.render_many(sources)
 
 
 def replace_h(source: str) -> str:
@@ -984,24 +1143,38 @@ def add_table_class(source: str) -> str:
     return re.sub(r"<table>", "<table class='table table-striped'>", source)
 
 
-def parse_simple_text(task, text: str, replacement_metadata: Optional[ReplacementMetadata] = None):
+def _simple_text_source(text: str, replacement_metadata: Optional[ReplacementMetadata] = None) -> str:
+    return ksi_collapse(
+        ksi_pseudocode(
+            format_custom_tags(
+                text
+            )
+        ),
+        replacement_metadata
+    )
+
+
+def _simple_text_html(task, html: str) -> str:
     return add_table_class(
         change_links(
             task, replace_h(
-                parse_pandoc(
-                    ksi_collapse(
-                        ksi_pseudocode(
-                            format_custom_tags(
-                                text
-                            )
-                        ),
-                        replacement_metadata
-                    )
-                )
+                html
             )
         )
     )
 
+
+def parse_simple_text(task, text: str, replacement_metadata: Optional[ReplacementMetadata] = None):
+    return _simple_text_html(
+        task, parse_pandoc(_simple_text_source(text, replacement_metadata))
+    )
+
+
+def parse_simple_texts(task, texts: List[str], replacement_metadata: Optional[ReplacementMetadata] = None) -> List[str]:
+    """parse_simple_text pro vice textu najednou (jedno spusteni pandocu)"""
+    sources = [_simple_text_source(text, replacement_metadata) for text in texts]
+    return [_simple_text_html(task, html) for html in parse_pandoc_many(sources)]
+
 ###############################################################################
 
 
@@ -0,0 +1,265 @@
+"""
+Deploy of all tasks of a wave at once.
+
+Origin is fetched once, the commit of every needed branch is checked out
+into its own worktree (WORKTREE_PATH, reused by later deploys) and tasks are
+deployed from the worktrees in a pool of WORKERS processes. The working
+tree of data/seminar is not touched. taskDeploy keeps the state of a deploy
+in module globals, so tasks run in separate processes, not threads.
+
+State of the wave deploy, per-task results and timings of the phases
+(fetch, worktrees and meta/assignment/copy/modules of every task) are
+stored in STATUS_PATH/<wave>.json, deploy logs of tasks next to it.
+"""
+
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import git
+from lockfile import LockFile
+from sqlalchemy.orm import scoped_session
+
+import config
+import model
+import util
+from util.admin import taskDeploy
+
+# Deploy vlny vylucuje deploy jednotlivych uloh
+LOCKFILE = taskDeploy.LOCKFILE
+WORKTREE_PATH = 'data/deploy-worktrees'
+STATUS_PATH = 'data/wave-deploy'
+WORKERS = getattr(config, 'WAVE_DEPLOY_WORKERS', 4)
+
+
+def _status_file(wave_id: int) -> str:
+    return os.path.join(STATUS_PATH, '%d.json' % wave_id)
+
+
+def _task_log(wave_id: int, task_id: int) -> str:
+    return os.path.join(STATUS_PATH, '%d-%d.log' % (wave_id, task_id))
+
+
+def _wave_log(wave_id: int) -> str:
+    return os.path.join(STATUS_PATH, '%d.log' % wave_id)
+
+
+def load_status(wave_id: int) -> Optional[dict]:
+    try:
+        with open(_status_file(wave_id), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_status(wave_id: int, status: dict) -> None:
+    os.makedirs(STATUS_PATH, exist_ok=True)
+    path = _status_file(wave_id)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def task_log(wave_id: int, task_id: int) -> Optional[str]:
+    try:
+        with open(_task_log(wave_id, task_id), 'r') as f:
+            return ''.join(f.readlines()[1:])
+    except OSError:
+        return None
+
+
+def _worktree(repo: git.Repo, branch: str, commit: str) -> str:
+    """Checks out 'commit' into the worktree of 'branch'."""
+    path = os.path.abspath(os.path.join(
+        WORKTREE_PATH, re.sub(r'[^\w.-]', '_', branch)))
+    if os.path.isfile(os.path.join(path, '.git')):
+        worktree = git.Repo(path)
+        worktree.git.checkout('--detach', '--force', commit)
+        worktree.git.clean('-ffdx')
+    else:
+        # Adresar mohl byt smazan, git o nem jeste vi
+        repo.git.worktree('prune')
+        repo.git.worktree('add', '--detach', '--force', path, commit)
+    return path
+
+
+def _deploy_task(wave_id: int, task_id: int, year_id: int, path: str,
+                 commit: str) -> dict:
+    """Deploy jedne ulohy, bezi v samostatnem procesu."""
+    from db import _session
+
+    taskDeploy.LOGFILE = _task_log(wave_id, task_id)
+    taskDeploy.timings = {}
+    scoped = scoped_session(_session)
+    session = taskDeploy.session = scoped()
+    task = None
+    result = {'status': 'error', 'commit': commit}
+
+    try:
+        task = session.query(model.Task).get(task_id)
+        year = session.query(model.Year).get(year_id)
+        taskDeploy.create_log(task, 'deploying')
+        task.deploy_date = datetime.datetime.utcnow()
+        session.commit()
+
+        if not os.path.isdir(path):
+            taskDeploy.log("Repo dir does not exist")
+            result['error'] = 'Repo dir does not exist'
+            task.deploy_status = 'error'
+            session.commit()
+            return result
+
+        result['max_points_diff'] = taskDeploy.deploy_checked_out(
+            task, year, path, commit, update_point_pad=False)
+        result['status'] = 'done'
+    except Exception as e:
+        taskDeploy.log("Exception: " + traceback.format_exc())
+        result['error'] = str(e)
+        session.rollback()
+        try:
+            if task is not None:
+                task.deploy_status = 'error'
+                session.commit()
+        except BaseException:
+            session.rollback()
+    finally:
+        result['timings'] = taskDeploy.timings
+        taskDeploy.log("Timings: " + taskDeploy.format_timings())
+        taskDeploy.log("Done")
+        session.close()
+        scoped.remove()
+    return result
+
+
+def deploy(wave_id: int, year_id: int, task_ids: List[int],
+           scoped: Callable) -> None:
+    """
+    Tato funkce je spoustena v samostatnem vlakne (viz taskDeploy.deploy).
+    Ulohy \\task_ids uz maji nastaveno deploy_status = 'deploying'.
+    """
+    status = {
+        'wave': wave_id,
+        'status': 'deploying',
+        'started': datetime.datetime.utcnow().isoformat(),
+        'finished': None,
+        'timings': {},
+        'tasks': {str(task_id): {'status': 'queued'} for task_id in task_ids},
+        'error': None,
+    }
+    _write_status(wave_id, status)
+    with open(_wave_log(wave_id), 'w') as f:
+        f.write('wave %d\n' % wave_id)
+
+    session = scoped()
+    lock = LockFile(LOCKFILE)
+    try:
+        lock.acquire(60)
+        tasks = session.query(model.Task).\
+            filter(model.Task.id.in_(task_ids)).all()
+
+        start = time.monotonic()
+        repo = git.Repo(util.git.GIT_SEMINAR_PATH)
+        repo.remotes.origin.fetch()
+        status['timings']['fetch'] = time.monotonic() - start
+
+        # Kazda vetev se checkoutuje jen jednou, chybejici vetev shodi jen
+        # svoje ulohy
+        start = time.monotonic()
+        worktrees: Dict[str, tuple] = {}
+        branch_errors: Dict[str, str] = {}
+        for branch in sorted({task.git_branch for task in tasks}):
+            try:
+                commit = repo.commit('origin/' + branch).hexsha
+                worktrees[branch] = (_worktree(repo, branch, commit), commit)
+            except Exception as e:
+                branch_errors[branch] = 'Branch %s: %s' % (branch, e)
+                with open(_wave_log(wave_id), 'a') as f:
+                    f.write(traceback.format_exc())
+        status['timings']['worktrees'] = time.monotonic() - start
+
+        jobs = {}
+        for task in tasks:
+            if task.git_branch in branch_errors:
+                status['tasks'][str(task.id)] = {
+                    'status': 'error',
+                    'error': branch_errors[task.git_branch],
+                }
+                task.deploy_status = 'error'
+            else:
+                jobs[task.id] = (
+                    worktrees[task.git_branch][0] + '/' + task.git_path,
+                    worktrees[task.git_branch][1])
+        session.commit()
+        _write_status(wave_id, status)
+
+        # spawn: proces gunicornu je vicevlaknovy, fork neni bezpecny
+        start = time.monotonic()
+        max_points_diff = 0.0
+        with ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                pool.submit(_deploy_task, wave_id, task_id, year_id, path,
+                            commit): task_id
+                for task_id, (path, commit) in jobs.items()
+            }
+            for task_id in jobs:
+                status['tasks'][str(task_id)]['status'] = 'deploying'
+            _write_status(wave_id, status)
+
+            for future in as_completed(futures):
+                task_id = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': 'error', 'error': str(e)}
+                status['tasks'][str(task_id)] = result
+                max_points_diff += result.get('max_points_diff', 0.0)
+                _write_status(wave_id, status)
+        status['timings']['tasks'] = time.monotonic() - start
+
+        # Point pad se upravi jednou za celou vlnu; drzime zamek deploye,
+        # takze log jednotlive ulohy nikdo jiny nepouziva
+        year = session.query(model.Year).get(year_id)
+        logfile = taskDeploy.LOGFILE
+        taskDeploy.LOGFILE = _wave_log(wave_id)
+        try:
+            taskDeploy.log(f"Wave max points diff: {max_points_diff}")
+            taskDeploy.update_year_point_pad(year, max_points_diff)
+        finally:
+            taskDeploy.LOGFILE = logfile
+        session.commit()
+
+        failed = [task_id for task_id, result in status['tasks'].items()
+                  if result['status'] != 'done']
+        status['status'] = 'error' if failed else 'done'
+    except Exception:
+        status['status'] = 'error'
+        status['error'] = traceback.format_exc()
+        session.rollback()
+        # Ulohy, ktere se nezacaly deployovat, nezustanou ve stavu deploying
+        try:
+            for task in session.query(model.Task).\
+                    filter(model.Task.id.in_(task_ids),
+                           model.Task.deploy_status == 'deploying').all():
+                if status['tasks'][str(task.id)]['status'] in ('queued',
+                                                               'deploying'):
+                    task.deploy_status = 'error'
+            session.commit()
+        except BaseException:
+            session.rollback()
+        print(status['error'], file=sys.stderr)
+    finally:
+        if lock.i_am_locking():
+            lock.release()
+        status['finished'] = datetime.datetime.utcnow().isoformat()
+        _write_status(wave_id, status)
+        session.close()
+        scoped.remove()
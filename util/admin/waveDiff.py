@@ -1 +1,114 @@
+"""
+Comparison of deployed tasks of a wave with the state of their branches.
+
+Origin is fetched once (by the caller) and trees are compared by hash
+directly in the object database: the tree of 'origin/<branch>:<git_path>'
+against the tree of '<task.git_commit>:<git_path>'. Neither the working
+tree nor the local branches are touched. Branch commits are resolved once
+for all tasks on the branch, changed files are listed by one 'git diff-tree'
+per changed task.
+"""
+
+from typing import Dict, List, Optional, TypedDict
+
+import git
+
+import model
+
 LOCKFILE = '/var/lock/ksi-wave-diff'
+
+
+class ChangedFile(TypedDict):
+    status: str  # A | M | D | T (viz git diff-tree --name-status)
+    path: str
+
+
+class TaskDiff(TypedDict):
+    id: int
+    branch: Optional[str]
+    commit: Optional[str]
+    deployed_commit: Optional[str]
+    # 'diff' | 'same' | 'default' (uloha neni v gitu nebo nebyla deployovana)
+    status: str
+    # None, pokud nelze urcit (napr. deployovany commit v repu neni)
+    files: Optional[List[ChangedFile]]
+
+
+def _subtree(commit: git.Commit, path: str) -> Optional[git.Tree]:
+    try:
+        tree = commit.tree[path] if path else commit.tree
+    except KeyError:
+        return None
+    return tree if tree.type == 'tree' else None
+
+
+def _changed_files(repo: git.Repo, old: git.Tree,
+                   new: git.Tree) -> List[ChangedFile]:
+    out = repo.git.diff_tree('-r', '-z', '--name-status',
+                             old.hexsha, new.hexsha)
+    # -z: "M\0cesta\0A\0cesta\0..."
+    fields = out.split('\0')
+    return [{'status': status, 'path': path}
+            for status, path in zip(fields[0::2], fields[1::2]) if status]
+
+
+def diff_tasks(repo: git.Repo, tasks: List[model.Task]) -> Dict[int, TaskDiff]:
+    """
+    Compares deployed commits of 'tasks' with 'origin/<branch>'.
+    Origin must be already fetched.
+    """
+    heads: Dict[str, Optional[git.Commit]] = {}
+    result: Dict[int, TaskDiff] = {}
+
+    for task in sorted(tasks, key=lambda t: (t.git_branch or '', t.id)):
+        diff: TaskDiff = {
+            'id': task.id,
+            'branch': task.git_branch,
+            'commit': None,
+            'deployed_commit': task.git_commit,
+            'status': 'default',
+            'files': None,
+        }
+        result[task.id] = diff
+        if (not task.git_branch) or (not task.git_path) or \
+                (not task.git_commit):
+            continue
+
+        if task.git_branch not in heads:
+            try:
+                heads[task.git_branch] = repo.commit(
+                    'origin/' + task.git_branch)
+            except (git.BadName, git.BadObject, ValueError):
+                heads[task.git_branch] = None
+        head = heads[task.git_branch]
+        if head is None:
+            continue
+        diff['commit'] = head.hexsha
+
+        path = task.git_path.strip('/')
+        new = _subtree(head, path)
+        if new is None:
+            # Adresar ulohy ve vetvi neni
+            continue
+
+        try:
+            old = _subtree(repo.commit(task.git_commit), path)
+        except (git.BadName, git.BadObject, ValueError):
+            # Deployovany commit v repu neni, rozdil nelze spocitat
+            diff['status'] = 'diff'
+            continue
+
+        if old is not None and old.hexsha == new.hexsha:
+            diff['status'] = 'same'
+            diff['files'] = []
+        elif old is None:
+            diff['status'] = 'diff'
+            diff['files'] = [{'status': 'A', 'path': blob.path[len(path):].
+                              lstrip('/')}
+                             for blob in new.traverse()
+                             if blob.type == 'blob']
+        else:
+            diff['status'] = 'diff'
+            diff['files'] = _changed_files(repo, old, new)
+
+    return result
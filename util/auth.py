@@ -1,16 +1,45 @@
 import datetime
+import threading
+import time
+import traceback
+from collections import namedtuple
 
 from db import session
 import model
+from util import logger
+from util.cache import TTLCache
+
+# Tokeny jsou cachovane v kazdem workeru zvlast, Logout a zmeny uzivatele
+# invaliduji jen cache sveho workeru -> kratke TTL.
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 10000
+
+CachedToken = namedtuple('CachedToken', ['user_id', 'role', 'expire'])
+token_cache = TTLCache('token', TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+# refresh token nechavame v databazi jeste 14 dni po expiraci, aby se
+# uzivatel mohl znovu prihlasit automaticky (napriklad po uspani pocitace)
+TOKEN_KEEP_EXPIRED = datetime.timedelta(days=14)
+TOKEN_SWEEP_INTERVAL = 3600
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
 
 
 class UserInfo:
 
-    def __init__(self, user=None, token=None):
-        self.id = user.id if user else None
-        self.role = user.role if user else None
+    def __init__(self, user=None, token=None, user_id=None, role=None):
+        self.id = user.id if user else user_id
+        self.role = user.role if user else role
         self.token = token
-        self.user = user
+        self._user = user
+
+    @property
+    def user(self):
+        """model.User is loaded lazily, most requests need just id and role."""
+        if self._user is None and self.id is not None:
+            self._user = session.query(model.User).get(self.id)
+        return self._user
 
     def is_logged_in(self):
         return self.id is not None
@@ -28,20 +57,74 @@ class UserInfo:
         return self.role == 'tester'
 
 
-def update_tokens():
+def sweep_tokens():
+    """
+    Deletes tokens expired more than TOKEN_KEEP_EXPIRED ago by a single
+    DELETE (index on oauth2_tokens.expire).
+    :return: number of deleted tokens
+    """
     try:
-        # refresh token nechavame v databazi jeste den, aby se uzivatel mohl
-        # znovu prihlasit automaticky (napriklad po uspani pocitace)
-        tokens = session.query(model.Token).all()
-        tokens = [
-            token
-            for token in tokens
-            if (datetime.datetime.utcnow() >
-                token.expire+datetime.timedelta(days=14))
-        ]
-        for token in tokens:
-            session.delete(token)
+        cnt = session.query(model.Token).\
+            filter(model.Token.expire <
+                   datetime.datetime.utcnow() - TOKEN_KEEP_EXPIRED).\
+            delete(synchronize_session=False)
         session.commit()
+        return cnt
     except:
         session.rollback()
         raise
+
+
+def start_token_sweeper():
+    """
+    Starts the thread of this worker deleting expired tokens every
+    TOKEN_SWEEP_INTERVAL (first sweep runs immediately).
+    """
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_loop,
+                                        name='token-sweeper', daemon=True)
+            _sweeper.start()
+
+
+def _sweep_loop():
+    while True:
+        try:
+            sweep_tokens()
+        except Exception:
+            logger.get_log().error('Token sweep failed:\n%s' %
+                                   traceback.format_exc())
+        finally:
+            session.remove()
+        time.sleep(TOKEN_SWEEP_INTERVAL)
+
+
+def lookup_token(token_str):
+    """
+    Returns CachedToken for access token 'token_str' or None if there is no
+    such token. Token and its user are loaded by a single query and cached.
+    """
+    cached = token_cache.get(token_str)
+    if cached is not None:
+        return cached
+
+    row = session.query(model.Token.expire, model.User.id, model.User.role).\
+        join(model.User, model.User.id == model.Token.user).\
+        filter(model.Token.access_token == token_str).\
+        first()
+    if row is None:
+        return None
+
+    cached = CachedToken(user_id=row[1], role=row[2], expire=row[0])
+    token_cache.put(token_str, cached)
+    return cached
+
+
+def invalidate_token(token_str):
+    token_cache.invalidate(token_str)
+
+
+def invalidate_user(user_id):
+    """Drops all cached tokens of user (deletion, role change)."""
+    token_cache.invalidate_where(lambda _, t: t.user_id == user_id)
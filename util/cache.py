@@ -0,0 +1,89 @@
+"""
+Small in-process caches.
+
+Every gunicorn worker has its own instances, so invalidation done in one
+worker is not visible in other workers. Keep TTLs short for data that can
+be changed through the API.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Vsechny pojmenovane cache tohoto procesu (pro statistiky)
+_caches: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache(object):
+    """Bounded LRU cache whose entries expire after 'ttl' seconds."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns cached value or None when the key is missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any,
+            ttl: Optional[float] = None) -> None:
+        """
+        Stores value, evicting the least recently used entry when full.
+        :param ttl: overrides the default TTL of the cache for this entry
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """Removes all entries for which predicate(key, value) is true."""
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items()
+                        if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else None,
+        }
+
+
+def stats() -> Dict[str, dict]:
+    """Statistics of all caches of this process."""
+    return {name: cache.stats() for name, cache in _caches.items()}
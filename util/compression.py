@@ -0,0 +1,52 @@
+"""
+Compression of response bodies according to Accept-Encoding.
+
+Used by Compressor middleware (app.py). Bodies smaller than MIN_SIZE
+(config.py: COMPRESS_MIN_SIZE) are sent as they are, compression would not
+save a packet.
+"""
+
+import gzip
+import zlib
+from typing import Optional
+
+import config
+
+MIN_SIZE = getattr(config, 'COMPRESS_MIN_SIZE', 1024)
+LEVEL = getattr(config, 'COMPRESS_LEVEL', 6)
+
+# Podporovana kodovani v poradi preference
+ENCODINGS = ('gzip', 'deflate')
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Returns the preferred supported encoding accepted by the client."""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    best = None
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best is not None else None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=LEVEL)
+    if encoding == 'deflate':
+        return zlib.compress(data, LEVEL)
+    raise ValueError('Unsupported encoding %s' % encoding)
@@ -94,3 +94,13 @@ def discord_invite_link() -> Optional[str]:
     :return the invite link to the Discord server
     """
     return get("discord_invite_link")
+
+
+def eval_queue_enabled() -> bool:
+    """
+    Whether programming modules are evaluated through the queue drained by
+    eval_worker.py instead of synchronously inside the request
+
+    :return True if the evaluation queue is enabled
+    """
+    return get("eval_queue") == "1"
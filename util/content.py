@@ -1,6 +1,8 @@
 import os
 from typing import List, TypedDict
 
+import util
+
 
 class Content(TypedDict):
     id: str
@@ -19,7 +21,8 @@ def dir_to_json(path: str) -> Content:
         return {
             'id': path,
             'files': [f for f in os.listdir(path_full)
-                      if os.path.isfile(path_full+'/'+f)],
+                      if os.path.isfile(path_full+'/'+f) and
+                      not util.mime.is_index(f)],
             'dirs':  [f for f in os.listdir(path_full)
                       if os.path.isdir(path_full+'/'+f)]
         }
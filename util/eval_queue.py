@@ -0,0 +1,268 @@
+"""
+Persistent queue of programming module evaluations.
+
+Submissions are stored into the `eval_jobs` table by the API and drained by
+a separate process (see eval_worker.py), so gunicorn workers are not blocked
+for the whole merge + isolate run + check sequence.
+"""
+
+import copy
+import datetime
+import json
+import os
+import socket
+import time
+import traceback
+from typing import Optional
+
+from sqlalchemy import desc
+
+from db import session
+import model
+import util
+
+# Jak casto worker kontroluje frontu, kdyz je prazdna (sekundy)
+POLL_INTERVAL = 0.5
+# Jak dlouho worker ceka, nez zkusi znovu ulohu, pro kterou nebyl volny box
+BUSY_RETRY_INTERVAL = 1.0
+
+
+def enqueue(evaluation: model.Evaluation) -> model.EvalJob:
+    """
+    Adds evaluation of submitted code into the queue.
+    Evaluation and its SubmittedCode must already be committed.
+    :param evaluation: evaluation to be filled by the worker
+    :return: committed queue entry
+    """
+    job = model.EvalJob(
+        evaluation=evaluation.id,
+        user=evaluation.user,
+        module=evaluation.module,
+        status='queued',
+    )
+    session.add(job)
+    session.commit()
+    return job
+
+
+def queue_position(job: model.EvalJob) -> int:
+    """
+    Returns number of queued jobs that will be processed before 'job'.
+    """
+    if job.status != 'queued':
+        return 0
+
+    return session.query(model.EvalJob).\
+        filter(model.EvalJob.status == 'queued',
+               model.EvalJob.id < job.id).\
+        count()
+
+
+def to_json(job: model.EvalJob, is_org: bool = False) -> dict:
+    data = {
+        'id': job.id,
+        'evaluation': job.evaluation,
+        'module': job.module,
+        'status': job.status,
+        'queue_position': queue_position(job),
+        'created': job.created.isoformat() if job.created else None,
+        'finished': job.finished.isoformat() if job.finished else None,
+    }
+
+    if job.status in ('done', 'error') and job.result is not None:
+        result = json.loads(job.result)
+        if not is_org and 'report' in result:
+            del result['report']
+        data['result'] = result
+
+    return data
+
+
+def evaluate_code(module: model.Module, user: util.UserInfo,
+                  evaluation: model.Evaluation, code: str,
+                  raise_no_free_box: bool = False) -> dict:
+    """
+    Runs evaluation of participant`s code and stores its outcome into
+    'evaluation'. Shared by synchronous submit and by the queue worker.
+    :param raise_no_free_box: re-raise ENoFreeBox instead of reporting error,
+                              used by the worker to return job to the queue
+    :return: result as returned to the participant
+    """
+    reporter = util.programming.Reporter(max_size=50*1000)  # prevent database overflow
+
+    try:
+        result = util.programming.evaluate(
+            module.task, module, user.id, code, evaluation.id, reporter
+        )
+    except util.programming.ENoFreeBox:
+        if raise_no_free_box:
+            raise
+        result = {
+            'result': 'error',
+            'message': ('Přesáhnut maximální počet souběžně běžících '
+                        'opravení, zkuste to za chvíli.')
+        }
+    except Exception:
+        reporter += 'Zachycena chyba:\n'
+        reporter += traceback.format_exc()
+        result = {
+            'result': 'error',
+            'message': ('Nastala chyba při vykonávání kódu, zkus to prosím znovu později'
+                        ' a v případě přetrvávající chyby kontaktuj organizátora')
+        }
+
+    evaluation.points = result['score'] if 'score' in result else 0
+    evaluation.ok = (result['result'] == 'ok')
+    evaluation.full_report += (str(datetime.datetime.now()) + " : " +
+                               reporter.report_truncated + '\n')
+    session.commit()
+    util.scoreboard.update_module(evaluation.user, evaluation.module)
+
+    if 'actions' in result:
+        for action in result['actions']:
+            reporter += "Performing %s...\n" % (action)
+            util.module.perform_action(module, user, action)
+
+    if user.is_org():
+        result['report'] = reporter.report_truncated
+
+    return result
+
+
+def requeue_stale() -> int:
+    """
+    Returns jobs left in 'running' state by a killed worker back to the queue.
+    Must be called only when no worker is running.
+    :return: number of requeued jobs
+    """
+    try:
+        cnt = session.query(model.EvalJob).\
+            filter(model.EvalJob.status == 'running').\
+            update({model.EvalJob.status: 'queued',
+                    model.EvalJob.worker: None,
+                    model.EvalJob.started: None},
+                   synchronize_session=False)
+        session.commit()
+        return cnt
+    except BaseException:
+        session.rollback()
+        raise
+
+
+def claim_next(worker: str) -> Optional[model.EvalJob]:
+    """
+    Atomically marks the oldest queued job as running by 'worker'.
+    Conditional UPDATE is used instead of row locks, so concurrent workers
+    never pick the same job on any database backend.
+    """
+    while True:
+        job_id = session.query(model.EvalJob.id).\
+            filter(model.EvalJob.status == 'queued').\
+            order_by(model.EvalJob.id).\
+            limit(1).\
+            scalar()
+
+        if job_id is None:
+            session.commit()
+            return None
+
+        claimed = session.query(model.EvalJob).\
+            filter(model.EvalJob.id == job_id,
+                   model.EvalJob.status == 'queued').\
+            update({model.EvalJob.status: 'running',
+                    model.EvalJob.worker: worker,
+                    model.EvalJob.started: datetime.datetime.utcnow()},
+                   synchronize_session=False)
+        session.commit()
+
+        if claimed == 1:
+            return session.query(model.EvalJob).get(job_id)
+        # Jiny worker byl rychlejsi, zkusime dalsi ulohu
+
+
+def process_job(job: model.EvalJob) -> bool:
+    """
+    Evaluates single claimed job.
+    :return: False if the job was returned to the queue (no free box)
+    """
+    evaluation = session.query(model.Evaluation).get(job.evaluation)
+    module = session.query(model.Module).get(job.module)
+    user = util.UserInfo(session.query(model.User).get(job.user))
+    code = session.query(model.SubmittedCode).\
+        filter(model.SubmittedCode.evaluation == job.evaluation).\
+        order_by(desc(model.SubmittedCode.id)).\
+        first()
+
+    if evaluation is None or module is None or code is None:
+        job.status = 'error'
+        job.result = json.dumps({
+            'result': 'error',
+            'message': 'Odevzdání bylo mezitím odstraněno.',
+        })
+        job.finished = datetime.datetime.utcnow()
+        session.commit()
+        return True
+
+    # Check for custom assignment
+    custom = session.query(model.ModuleCustom).get((module.id, job.user))
+    if custom is not None:
+        module = copy.deepcopy(module)
+        module.data = custom.data
+
+    try:
+        result = evaluate_code(module, user, evaluation, code.code,
+                               raise_no_free_box=True)
+    except util.programming.ENoFreeBox:
+        session.rollback()
+        job.status = 'queued'
+        job.worker = None
+        job.started = None
+        session.commit()
+        return False
+
+    job.status = 'done'
+    job.result = json.dumps(result, ensure_ascii=False)
+    job.finished = datetime.datetime.utcnow()
+    session.commit()
+    return True
+
+
+def work(worker: Optional[str] = None) -> None:
+    """
+    Main loop of a single queue worker, never returns.
+    Uses the global session, so it has to run in its own process.
+    """
+    if worker is None:
+        worker = '%s:%d' % (socket.gethostname(), os.getpid())
+
+    while True:
+        job = None
+        try:
+            job = claim_next(worker)
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            if not process_job(job):
+                time.sleep(BUSY_RETRY_INTERVAL)
+        except Exception:
+            session.rollback()
+            util.logger.get_log().error(
+                'Evaluation worker %s failed:\n%s' %
+                (worker, traceback.format_exc())
+            )
+            if job is not None:
+                try:
+                    job.status = 'error'
+                    job.result = json.dumps({
+                        'result': 'error',
+                        'message': ('Nastala chyba při opravování, kontaktuj '
+                                    'organizátora.'),
+                    })
+                    job.finished = datetime.datetime.utcnow()
+                    session.commit()
+                except Exception:
+                    session.rollback()
+            time.sleep(POLL_INTERVAL)
+        finally:
+            session.close()
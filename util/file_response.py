@@ -0,0 +1,175 @@
+"""
+Sending of static files with HTTP validators.
+
+send_file() sets a strong ETag computed from (inode, size, mtime) and
+Last-Modified, answers conditional requests (If-None-Match,
+If-Modified-Since) with 304 Not Modified and serves single byte ranges
+(Range, If-Range) with 206 Partial Content.
+"""
+
+import datetime
+import email.utils
+import os
+from typing import Optional, Sequence, Tuple
+
+import falcon
+
+from util import mime
+
+# Cache-Control jednotlivych kontextu
+# Soubor se muze kdykoliv zmenit, prohlizec se vzdy zepta (levne diky 304)
+CACHE_REVALIDATE = ('no-cache', )
+# Soubory konkretniho uzivatele, nesmi se ukladat ve sdilenych cache
+CACHE_PRIVATE = ('private', 'no-cache')
+# Data uloh v adresarich zadani_*/reseni_* a ikony, meni se jen pri deployi.
+# Mangled adresare si drzi jmeno i pres redeploy, proto ne 'immutable'.
+CACHE_TASK_DATA = ('public', 'max-age=3600')
+# Profilove obrazky
+CACHE_PUBLIC_SHORT = ('public', 'max-age=300')
+
+
+class _RangeReader(object):
+    """File object limited to 'length' bytes from the current position."""
+
+    def __init__(self, f, length: int) -> None:
+        self._f = f
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def etag(st: os.stat_result) -> str:
+    return '"%x-%x-%x"' % (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _http_date(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _mtime(st: os.stat_result) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(int(st.st_mtime),
+                                           datetime.timezone.utc)
+
+
+def _etag_matches(header: str, tag: str) -> bool:
+    if header.strip() == '*':
+        return True
+    # Slaba porovnani (W/"...") pro If-None-Match staci
+    return tag in (t.strip().replace('W/', '', 1) for t in header.split(','))
+
+
+def not_modified(req, st: os.stat_result) -> bool:
+    """True if the client's cached copy of the file is still valid."""
+    inm = req.get_header('If-None-Match')
+    if inm is not None:
+        return _etag_matches(inm, etag(st))
+
+    ims = _http_date(req.get_header('If-Modified-Since'))
+    return ims is not None and _mtime(st) <= ims
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _range(req, st: os.stat_result) -> Optional[Tuple[int, int]]:
+    """
+    Returns requested byte range (first, last) or None for whole file.
+    Malformed Range headers are ignored.
+    """
+    header = req.get_header('Range')
+    if not header or not header.startswith('bytes=') or ',' in header:
+        # Vice rozsahu najednou nepodporujeme, posleme cely soubor
+        return None
+
+    if_range = req.get_header('If-Range')
+    if if_range is not None:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag(st):
+                return None
+        else:
+            since = _http_date(if_range)
+            if since is None or _mtime(st) > since:
+                return None
+
+    first, sep, last = header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+
+    size = st.st_size
+    try:
+        if first == '':
+            # Suffix: poslednich N bytu
+            suffix = int(last)
+            first, last = max(size - suffix, 0), size - 1
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+        else:
+            first = int(first)
+            last = int(last) if last != '' else size - 1
+    except ValueError:
+        return None
+
+    if first >= size or last < first:
+        raise RangeNotSatisfiable()
+    return first, min(last, size - 1)
+
+
+def send_file(req, resp, path: str,
+              cache_control: Sequence[str] = CACHE_REVALIDATE,
+              content_type: Optional[str] = None) -> None:
+    """
+    Sends file 'path' as the response.
+    :param cache_control: Cache-Control directives (see CACHE_* constants)
+    :param content_type: MIME type, taken from util.mime if not given
+    """
+    st = os.stat(path)
+
+    resp.cache_control = list(cache_control)
+    resp.set_header('ETag', etag(st))
+    resp.set_header('Last-Modified',
+                    email.utils.format_datetime(_mtime(st), usegmt=True))
+    resp.set_header('Accept-Ranges', 'bytes')
+
+    if not_modified(req, st):
+        resp.status = falcon.HTTP_304
+        return
+
+    try:
+        byte_range = _range(req, st)
+    except RangeNotSatisfiable:
+        resp.status = falcon.HTTP_416
+        resp.set_header('Content-Range', 'bytes */%d' % st.st_size)
+        return
+
+    resp.content_type = (content_type if content_type is not None
+                         else mime.from_file(path, st))
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        resp.stream_len = st.st_size
+        resp.stream = f
+        return
+
+    first, last = byte_range
+    f.seek(first)
+    resp.status = falcon.HTTP_206
+    resp.set_header('Content-Range',
+                    'bytes %d-%d/%d' % (first, last, st.st_size))
+    resp.stream_len = last - first + 1
+    resp.stream = _RangeReader(f, last - first + 1)
@@ -0,0 +1,31 @@
+"""
+Helpers for splitting results of one big SQL query per entity.
+
+Endpoints like the results list or corrections load everything in a few
+queries and then assign rows to individual users/tasks. Scanning the whole
+result for every entity is quadratic, group the rows once instead.
+"""
+
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, TypeVar
+
+T = TypeVar('T')
+
+
+def _identity(item: T) -> T:
+    return item
+
+
+def group_by_key(items: Iterable[T], key: Callable[[T], Hashable],
+                 value: Callable[[T], Any] = _identity) -> Dict[Hashable, List]:
+    """
+    Groups 'items' in a single pass, order of items in groups is preserved.
+    :param key: returns key of the group for an item
+    :param value: returns what should be stored in the group (item itself
+                  by default)
+    :return: {key: [values]}, missing keys should be read by .get(key, [])
+    """
+    groups = defaultdict(list)
+    for item in items:
+        groups[key(item)].append(value(item))
+    return dict(groups)
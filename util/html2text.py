@@ -0,0 +1,231 @@
+"""
+Conversion of e-mail HTML to the plaintext (markdown-like) alternative.
+
+E-mail bodies are built from a small set of tags (paragraphs, links, lists,
+emphasis) and converting them by spawning pandoc for every message is slow.
+This converter handles the common markup in-process; markup it does not
+understand (tables, forms, ...) raises Unsupported and the caller falls back
+to pandoc (see util.mail.html_to_plaintext).
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple, Union
+
+
+class Unsupported(Exception):
+    """The markup cannot be converted reliably, use pandoc instead."""
+
+
+Node = Union[str, '_Element']
+
+BLOCK_TAGS = {'html', 'body', 'div', 'p', 'section', 'article', 'header',
+              'footer', 'center', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+              'ul', 'ol', 'li', 'blockquote', 'pre'}
+INLINE_TAGS = {'a', 'b', 'strong', 'i', 'em', 'u', 'code', 'tt', 'span',
+               'font', 'small', 'big', 'sub', 'sup', 'br', 'img', 'abbr',
+               'cite', 'mark', 'label', 'kbd', 'samp', 'var', 'ins'}
+# Obsah techto tagu se do textu nedostane
+IGNORED_TAGS = {'head', 'title', 'style', 'script', 'meta', 'link'}
+VOID_TAGS = {'br', 'hr', 'img', 'meta', 'link', 'wbr', 'input'}
+# Otevreni tagu implicitne uzavre stejny neuzavreny tag (<p>a<p>b)
+SELF_CLOSING_SIBLINGS = {'p', 'li'}
+
+_whitespace = re.compile(r'\s+')
+
+
+class _Element(object):
+    __slots__ = ('tag', 'attrs', 'children')
+
+    def __init__(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.children: List[Node] = []
+
+
+class _TreeBuilder(HTMLParser):
+    """Builds a lenient element tree, unknown tags raise Unsupported."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.root = _Element('root', [])
+        self.stack = [self.root]
+        self.ignored = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in IGNORED_TAGS:
+            if tag not in VOID_TAGS:
+                self.ignored += 1
+            return
+        if tag not in BLOCK_TAGS and tag not in INLINE_TAGS:
+            raise Unsupported(tag)
+        if self.ignored:
+            return
+
+        if tag in SELF_CLOSING_SIBLINGS:
+            self._close(tag, stop_at={'ul', 'ol', 'blockquote'})
+        element = _Element(tag, attrs)
+        self.stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and not self.ignored:
+            self._close(tag)
+
+    def handle_endtag(self, tag):
+        if tag in IGNORED_TAGS:
+            self.ignored = max(self.ignored - 1, 0)
+            return
+        if not self.ignored:
+            self._close(tag)
+
+    def handle_data(self, data):
+        if not self.ignored:
+            self.stack[-1].children.append(data)
+
+    def _close(self, tag: str, stop_at=frozenset()) -> None:
+        # Neparovy koncovy tag se ignoruje
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+            if self.stack[i].tag in stop_at:
+                return
+
+
+def _is_block(node: Node) -> bool:
+    return isinstance(node, _Element) and node.tag in BLOCK_TAGS
+
+
+def _inline(nodes: List[Node]) -> str:
+    result = []
+    for node in nodes:
+        if isinstance(node, str):
+            result.append(_whitespace.sub(' ', node))
+            continue
+        if node.tag in BLOCK_TAGS:
+            raise Unsupported('%s inside inline element' % node.tag)
+
+        if node.tag == 'br':
+            result.append('\n')
+        elif node.tag == 'img':
+            result.append('![%s](%s)' % (node.attrs.get('alt') or '',
+                                         node.attrs.get('src') or ''))
+        elif node.tag == 'a':
+            result.append(_link(node))
+        else:
+            result.append(_wrap(node.tag, _inline(node.children)))
+    return ''.join(result)
+
+
+def _wrap(tag: str, text: str) -> str:
+    mark = {'b': '**', 'strong': '**', 'i': '*', 'em': '*', 'code': '`',
+            'tt': '`'}.get(tag)
+    if mark is None or not text.strip():
+        return text
+    # Znacky musi primykat k textu, mezery zustanou vne
+    stripped = text.strip()
+    start = text[:len(text) - len(text.lstrip())]
+    end = text[len(text.rstrip()):]
+    return start + mark + stripped + mark + end
+
+
+def _link(node: _Element) -> str:
+    text = _inline(node.children)
+    href = node.attrs.get('href')
+    if not href:
+        return text
+    label = text.strip()
+    if not label or label == href or 'mailto:' + label == href:
+        return '<%s>' % (label or href)
+    return '[%s](%s)' % (label, href)
+
+
+def _paragraph(text: str) -> Optional[str]:
+    lines = [line.strip() for line in text.split('\n')]
+    while lines and not lines[0]:
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines) if lines else None
+
+
+def _indent(text: str, first: str, rest: str) -> str:
+    lines = text.split('\n')
+    return '\n'.join([first + lines[0]] +
+                     [(rest + line) if line else '' for line in lines[1:]])
+
+
+def _blocks(nodes: List[Node]) -> List[str]:
+    blocks: List[str] = []
+    pending: List[Node] = []
+
+    def flush():
+        if pending:
+            paragraph = _paragraph(_inline(pending))
+            if paragraph:
+                blocks.append(paragraph)
+            pending.clear()
+
+    for node in nodes:
+        if not _is_block(node):
+            pending.append(node)
+            continue
+        flush()
+        blocks.extend(_block(node))
+    flush()
+    return blocks
+
+
+def _block(node: _Element) -> List[str]:
+    tag = node.tag
+    if tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+        text = _paragraph(_inline(node.children))
+        return ['#' * int(tag[1]) + ' ' + text.replace('\n', ' ')] \
+            if text else []
+    if tag == 'hr':
+        return ['-' * 72]
+    if tag in ('ul', 'ol'):
+        items = []
+        for i, child in enumerate(
+                [c for c in node.children if _is_block(c) and c.tag == 'li'],
+                start=1):
+            marker = '-   ' if tag == 'ul' else ('%d.  ' % i)
+            text = '\n'.join(_blocks(child.children))
+            items.append(_indent(text, marker, ' ' * len(marker)))
+        if any(isinstance(c, _Element) and c.tag != 'li'
+               for c in node.children):
+            raise Unsupported('%s with non-li children' % tag)
+        return ['\n'.join(items)] if items else []
+    if tag == 'li':
+        # Polozka mimo seznam
+        return _blocks(node.children)
+    if tag == 'blockquote':
+        text = '\n\n'.join(_blocks(node.children))
+        return [_indent(text, '> ', '> ').replace('\n\n', '\n>\n')] \
+            if text else []
+    if tag == 'pre':
+        text = ''.join(_text(node)).strip('\n')
+        return [_indent(text, '    ', '    ')] if text else []
+    return _blocks(node.children)
+
+
+def _text(node: Node) -> List[str]:
+    if isinstance(node, str):
+        return [node]
+    if node.tag == 'br':
+        return ['\n']
+    return [part for child in node.children for part in _text(child)]
+
+
+def convert(html: str) -> str:
+    """
+    Converts HTML to plaintext with markdown formatting.
+    :raises Unsupported: markup not handled by this converter
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return '\n\n'.join(_blocks(builder.root.children)) + '\n'
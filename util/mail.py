@@ -2,14 +2,14 @@ import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email import charset as Charset
+from email.utils import formataddr, parseaddr
 import copy
-import threading
+import hashlib
 import random
+import time
 from typing import Optional, List, Dict, Union
 
 import model
-import smtplib
-import queue
 from enum import Enum
 from collections import namedtuple
 import tempfile
@@ -17,13 +17,16 @@ import pypandoc
 
 from db import session
 from util import config, logger
+from util.cache import TTLCache
+from util.html2text import Unsupported, convert as _html2text
 import util
 
-# Emaily jsou odesilane v paralelnim vlakne.
+# Emaily se ukladaji do fronty (util/mail_outbox.py), odesila je mail_sender.py.
+
+# Telo emailu v quoted-printable; musi byt nastaveno driv, nez se vytvori
+# jakykoliv Charset('utf-8') (BulkMessage), ten si kodovani pamatuje
+Charset.add_charset('utf-8', Charset.QP, Charset.QP, 'utf-8')
 
-queueLock = threading.Lock()    # Zamek fronty emailQueue
-emailQueue = queue.Queue()      # Fronta emailu k odeslani
-emailThread = None              # Vlakno pro odesilani emailu
 
 class EMailType(Enum):
     EVAL = 0
@@ -38,40 +41,29 @@ UNSUBSCRIBE_LINK = {
     EMailType.EVENTS: 'events',
 }
 
-class emailData():
-    """Jeden zaznam fronty emailu"""
-
-    def __init__(self, frm, to, msg):
-        self.frm = frm
-        self.to = to
-        self.msg = msg
+# Plaintextove verze emailu podle hashe HTML (notifikace o jednom prispevku
+# se posilaji vice prijemcum)
+PLAINTEXT_CACHE_SIZE = 256
+PLAINTEXT_CACHE_TTL = 3600
+_plaintexts = TTLCache('mail_plaintext', PLAINTEXT_CACHE_SIZE,
+                       PLAINTEXT_CACHE_TTL)
 
 
-class sendThread(threading.Thread):
-    """Vlakno odesilajici postupne emaily.
-    Vlakno bere emaily z fronty emailQueue, jakmile je fronta prazdna, vlakno
-    konci.
+def html_to_plaintext(html: str) -> str:
     """
-
-    def run(self):
-        queueLock.acquire()
+    Plaintext alternative of the HTML body. Converted in-process, pandoc is
+    used only for markup unknown to util.html2text.
+    """
+    key = hashlib.sha1(html.encode('utf-8')).hexdigest()
+    plaintext = _plaintexts.get(key)
+    if plaintext is None:
         try:
-            while not emailQueue.empty():
-                data = emailQueue.get()
-                queueLock.release()
-
-                try:
-                    s = smtplib.SMTP('relay.fi.muni.cz')
-                    s.sendmail(data.frm, data.to, data.msg)
-                except Exception as e:
-                    print(str(e))
-
-                queueLock.acquire()
-        finally:
-            if s:
-                s.quit()
-            if queueLock.locked():
-                queueLock.release()
+            plaintext = _html2text(html)
+        except Unsupported as e:
+            logger.get_log().info('Converting e-mail by pandoc (%s)' % e)
+            plaintext = pypandoc.convert(html, 'markdown', format='html')
+        _plaintexts.put(key, plaintext)
+    return plaintext
 
 
 def easteregg():
@@ -80,21 +72,19 @@ def easteregg():
     return "<hr><p>PS: " + egg.body + "</p>"
 
 
-def _send(to: Union[str, List[str]], subject, text, params, bcc, cc, plaintext=None):
-    """Odeslani emailu."""
-    sender = config.mail_sender()
-
-    Charset.add_charset('utf-8', Charset.QP, Charset.QP, 'utf-8')
+def _compose(to: Optional[Union[str, List[str]]], subject, text, params, cc,
+             plaintext=None, sender=None, return_path=None) -> MIMEMultipart:
+    """Sestaveni emailu, pokud je to None, hlavicka To se nevyplni."""
     text = "<html>" + text + "</html>"
 
     msg = MIMEMultipart('alternative')
     msg['Subject'] = subject
     msg['From'] = sender
     if 'Sender' not in params:
-        msg['Sender'] = config.get('return_path')
+        msg['Sender'] = return_path
     if 'Return-Path' not in params:
-        msg['Return-Path'] = config.get('return_path')
-    if 'To' not in params:
+        msg['Return-Path'] = return_path
+    if 'To' not in params and to is not None:
         msg['To'] = (','.join(to)) if isinstance(to, list) else to
     if len(cc) > 0:
         msg['Cc'] = (','.join(cc)) if isinstance(cc, (list)) else cc
@@ -105,28 +95,35 @@ def _send(to: Union[str, List[str]], subject, text, params, bcc, cc, plaintext=N
     if plaintext is not None:
         msg.attach(MIMEText(plaintext, 'plain', 'utf-8'))
     msg.attach(MIMEText(text, 'html', 'utf-8'))
+    return msg
+
+
+def _as_bytes(msg: MIMEMultipart) -> bytes:
+    return msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+
+def _redirect_to_file(to, data: bytes) -> None:
+    handle, tmp_file_path = tempfile.mkstemp(prefix='ksi_mail_', suffix='.eml', text=False)
+    logger.get_log().warning(f"Redirecting mail to '{to}' into '{tmp_file_path}', because sender is not set in config")
+    os.write(handle, data)
+    os.close(handle)
+
+
+def _send(to: Union[str, List[str]], subject, text, params, bcc, cc, plaintext=None):
+    """Odeslani emailu."""
+    sender = config.mail_sender()
+    msg = _compose(to, subject, text, params, cc, plaintext, sender,
+                   config.get('return_path'))
 
     send_to = set((to if isinstance(to, (list)) else [to]) +
                   (cc if isinstance(cc, (list)) else [cc]) +
                   (bcc if isinstance(bcc, (list)) else [bcc]))
 
     if sender is None:
-        handle, tmp_file_path = tempfile.mkstemp(prefix='ksi_mail_', suffix='.eml', text=False)
-        logger.get_log().warning(f"Redirecting mail to '{to}' into '{tmp_file_path}', because sender is not set in config")
-        os.write(handle, msg.as_bytes())
-        os.close(handle)
+        _redirect_to_file(to, msg.as_bytes())
         return
 
-    global emailThread
-    # Vlozime email do fronty
-    queueLock.acquire()
-    emailQueue.put(emailData(msg['Sender'], send_to, msg.as_string()))
-    if emailThread and emailThread.is_alive():
-        queueLock.release()
-    else:
-        queueLock.release()
-        emailThread = sendThread()
-        emailThread.start()
+    util.mail_outbox.put(msg['Sender'], list(send_to), _as_bytes(msg))
 
 
 def send(
@@ -146,39 +143,110 @@ def send(
     if cc is None:
         cc = []
 
+    # Prevod pred pridanim paticky, aby se dal pouzit pro vsechny prijemce
+    if plaintext is None:
+        plaintext = html_to_plaintext(text)
+    elif plaintext == '':
+        plaintext = None
+
     if unsubscribe is not None:
         text += unsubscribe.text()
-        if plaintext is not None and plaintext != '':
+        if plaintext is not None:
             plaintext += unsubscribe.plaintext()
         if hasattr(unsubscribe, 'link'):
             params['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
             params['List-Unsubscribe'] = '<' + unsubscribe.link() + '>'
 
-    if plaintext is None:
-        plaintext = pypandoc.convert(text, 'markdown', format='html')
-    elif plaintext == '':
-        plaintext = None
-
     _send(to, subject, text, params, bcc, cc, plaintext)
 
 
 EMailRecipient = namedtuple('EMailRecipient', ['to', 'unsunscribe'])
 
 
-def send_multiple(recipients, subject, text, params={}, bcc=[]):
-    """Odeslani hromadnych emailu"""
+class BulkMessage:
+    """
+    Hromadny email zakodovany jen jednou. Od sebe se zpravy jednotlivych
+    prijemcu lisi jen hlavickami To a List-Unsubscribe a paticku s odkazem
+    na odhlaseni, ktera se do zakodovane sablony dosazuje na misto
+    zastupneho radku (radek zustane v quoted-printable nezmeneny).
+    """
 
-    plaintext = pypandoc.convert(text, 'markdown', format='html')
+    HTML_FOOTER = 'X-KSI-UNSUBSCRIBE-HTML-FOOTER'
+    PLAIN_FOOTER = 'X-KSI-UNSUBSCRIBE-PLAIN-FOOTER'
+
+    def __init__(self, subject, text, plaintext, params):
+        self.sender = config.mail_sender()
+        self.return_path = config.get('return_path')
+        self.envelope_from = params.get('Sender', self.return_path)
+        self._charset = Charset.Charset('utf-8')
+
+        params = {key: val for key, val in params.items() if key != 'To'}
+        msg = _compose(
+            None, subject, text + '\n' + self.HTML_FOOTER + '\n', params, [],
+            plaintext + '\n' + self.PLAIN_FOOTER + '\n'
+            if plaintext else None,
+            self.sender, self.return_path
+        )
+        self._template = _as_bytes(msg)
+        self._html_line = ('\r\n' + self.HTML_FOOTER + '\r\n').encode('ascii')
+        self._plain_line = ('\r\n' + self.PLAIN_FOOTER + '\r\n').encode('ascii')
+        assert self._html_line in self._template
+
+    def _encode(self, footer: str) -> bytes:
+        encoded = self._charset.body_encode(footer).replace('\n', '\r\n')
+        return ('\r\n' + encoded + '\r\n').encode('ascii')
+
+    def render(self, to: str, unsubscribe) -> bytes:
+        # Jmeno prijemce muze obsahovat diakritiku, adresa zustava citelna
+        headers = 'To: %s\r\n' % formataddr(parseaddr(to), charset='utf-8')
+        if hasattr(unsubscribe, 'link'):
+            headers += ('List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n'
+                        'List-Unsubscribe: <%s>\r\n' % unsubscribe.link())
+
+        data = self._template.replace(self._html_line,
+                                      self._encode(unsubscribe.text()))
+        data = data.replace(self._plain_line,
+                            self._encode(unsubscribe.plaintext()))
+        # Po formataddr je hlavicka ASCII, UTF-8 zustane jen v adrese
+        # (SMTPUTF8)
+        return headers.encode('utf-8') + data
+
+    def send(self, to: str, unsubscribe) -> None:
+        data = self.render(to, unsubscribe)
+        if self.sender is None:
+            _redirect_to_file(to, data)
+            return
+        util.mail_outbox.put(self.envelope_from, [to], data)
+
+
+def send_multiple(recipients, subject, text, params={}, bcc=[]) -> dict:
+    """
+    Odeslani hromadnych emailu
+    :return: statistika odesilani (pocet prijemcu, prijemcu za sekundu)
+    """
+    started = time.monotonic()
+    plaintext = html_to_plaintext(text)
 
     bcc_params = copy.deepcopy(params)
     bcc_params['To'] = 'ksi-resitele@fi.muni.cz'
-    bcc.append(config.ksi_conf())
+    bcc = bcc + [config.ksi_conf()]
     for b in bcc:
         bcc_params['Cc'] = b
         send([], subject, text, FakeUnsubscribe(), bcc_params, b, plaintext=plaintext)
 
+    bulk = BulkMessage(subject, text, plaintext, params)
     for to, unsubscribe in recipients:
-        send(to, subject, text, unsubscribe, params, plaintext=plaintext)
+        bulk.send(to, unsubscribe)
+
+    duration = time.monotonic() - started
+    stats = {
+        'recipients': len(recipients),
+        'seconds': duration,
+        'per_second': len(recipients) / duration if duration else None,
+    }
+    logger.get_log().info('Bulk e-mail "%s": %d recipients in %.2f s' %
+                          (subject, len(recipients), duration))
+    return stats
 
 
 def send_feedback(text, addr_from):
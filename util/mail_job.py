@@ -0,0 +1,216 @@
+"""
+Background jobs sending e-mails to many recipients.
+
+The request only creates a mail_jobs row and starts a thread of the gunicorn
+worker, so sending does not hit the request timeout. Recipients are split
+into batches of BATCH_SIZE processed by at most WORKERS threads; progress
+(sent/failed and ids of processed recipients) is stored into the row after
+every batch. Each thread uses its own database session (db.session is
+thread-local).
+
+Only one job of a task can be unfinished: the job holds the task in the
+unique column active_task, so of concurrent requests only one INSERT
+succeeds. A job whose row has not been updated for STALE_AFTER (e.g. the
+worker was restarted) is no longer considered active, the request that
+takes it over by a conditional UPDATE resumes it with the recipients not
+processed yet (only batches running at the restart are sent again).
+"""
+
+import datetime
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+import config
+from db import session
+import model
+from util import logger
+
+BATCH_SIZE = getattr(config, 'MAIL_JOB_BATCH_SIZE', 50)
+WORKERS = getattr(config, 'MAIL_JOB_WORKERS', 4)
+STALE_AFTER = datetime.timedelta(minutes=10)
+# Kolik chybovych hlasek se u ulohy uklada
+MAX_ERRORS = 100
+
+# Vraci seznam chyb (jedna polozka za kazdeho neuspesneho prijemce)
+SendBatch = Callable[[Sequence], List[str]]
+Finish = Callable[[model.MailJob], None]
+
+_progress_lock = threading.Lock()
+
+
+def active(task_id: int) -> Optional[model.MailJob]:
+    """Returns unfinished job sending e-mails about the task, if any."""
+    stale = datetime.datetime.utcnow() - STALE_AFTER
+    return session.query(model.MailJob).\
+        filter(model.MailJob.active_task == task_id,
+               model.MailJob.updated > stale).\
+        first()
+
+
+def _claim(task_id: int,
+           author: Optional[int]) -> Tuple[model.MailJob, bool]:
+    """
+    Atomically creates a job of the task or takes over its stale job,
+    unless another job of the task is active.
+    :return: (new or stale job, True) or (active job, False)
+    """
+    while True:
+        now = datetime.datetime.utcnow()
+        # Odesilani, ktere se dlouho neozvalo, prevezme jen jeden request
+        stale_id = session.query(model.MailJob.id).\
+            filter(model.MailJob.active_task == task_id).\
+            scalar()
+        if stale_id is not None:
+            claimed = session.query(model.MailJob).\
+                filter(model.MailJob.id == stale_id,
+                       model.MailJob.active_task == task_id,
+                       model.MailJob.updated <= now - STALE_AFTER).\
+                update({model.MailJob.status: 'queued',
+                        model.MailJob.updated: now},
+                       synchronize_session=False)
+            session.commit()
+            if claimed == 1:
+                return session.query(model.MailJob).get(stale_id), True
+
+            running = active(task_id)
+            if running is not None:
+                return running, False
+            # Odesilani mezitim skoncilo, zkusime znovu
+            continue
+
+        job = model.MailJob(
+            task=task_id,
+            author=author,
+            status='queued',
+            active_task=task_id,
+            updated=now,
+        )
+        session.add(job)
+        try:
+            session.commit()
+            return job, True
+        except IntegrityError:
+            session.rollback()
+
+        running = active(task_id)
+        if running is not None:
+            return running, False
+        # Aktivni odesilani mezitim skoncilo (nebo zastaralo), zkusime znovu
+
+
+def start(task_id: int, author: Optional[int], items: Sequence,
+          send_batch: SendBatch,
+          finish: Optional[Finish] = None) -> Tuple[model.MailJob, bool]:
+    """
+    Creates a job (or resumes the stale one) and starts sending in
+    a background thread, unless another job of the task is active.
+    'items' must have attribute 'id' and must not be bound to the session
+    of the request, 'send_batch' and 'finish' are called in other threads.
+    :return: (committed job, True if it was started by this call)
+    """
+    job, created = _claim(task_id, author)
+    if not created:
+        return job, False
+
+    processed = set(json.loads(job.processed)) if job.processed else set()
+    items = [item for item in items if item.id not in processed]
+    job.total = len(processed) + len(items)
+    session.commit()
+
+    thread = threading.Thread(
+        target=_run,
+        args=(job.id, list(items), send_batch, finish),
+        daemon=True,
+    )
+    thread.start()
+    return job, True
+
+
+def _set_status(job_id: int, status: str) -> None:
+    job = session.query(model.MailJob).get(job_id)
+    job.status = status
+    job.updated = datetime.datetime.utcnow()
+    if status in ('done', 'error'):
+        job.finished = job.updated
+        job.active_task = None
+    session.commit()
+
+
+def _progress(job_id: int, sent: int, failed: int, errors: List[str],
+              processed: Sequence[int] = ()) -> None:
+    # Davky jedne ulohy bezi ve stejnem procesu, zamek staci
+    with _progress_lock:
+        job = session.query(model.MailJob).get(job_id)
+        job.sent += sent
+        job.failed += failed
+        if processed:
+            stored = json.loads(job.processed) if job.processed else []
+            job.processed = json.dumps(stored + list(processed))
+        if errors:
+            stored = json.loads(job.errors) if job.errors else []
+            job.errors = json.dumps((stored + errors)[:MAX_ERRORS])
+        job.updated = datetime.datetime.utcnow()
+        session.commit()
+
+
+def _run_batch(job_id: int, batch: Sequence, send_batch: SendBatch) -> None:
+    try:
+        try:
+            errors = send_batch(batch)
+        except Exception as e:
+            session.rollback()
+            logger.get_log().error('Mail job %d: batch failed:\n%s' %
+                                   (job_id, traceback.format_exc()))
+            errors = [str(e)] * len(batch)
+        _progress(job_id, len(batch) - len(errors), len(errors),
+                  sorted(set(errors)), [item.id for item in batch])
+    finally:
+        session.remove()
+
+
+def _run(job_id: int, items: List, send_batch: SendBatch,
+         finish: Optional[Finish]) -> None:
+    try:
+        _set_status(job_id, 'running')
+        batches = [items[i:i+BATCH_SIZE]
+                   for i in range(0, len(items), BATCH_SIZE)]
+
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            for future in [pool.submit(_run_batch, job_id, batch, send_batch)
+                           for batch in batches]:
+                future.result()
+
+        if finish is not None:
+            try:
+                finish(session.query(model.MailJob).get(job_id))
+            except Exception as e:
+                session.rollback()
+                _progress(job_id, 0, 0, [str(e)])
+        _set_status(job_id, 'done')
+    except Exception:
+        logger.get_log().error('Mail job %d failed:\n%s' %
+                               (job_id, traceback.format_exc()))
+        session.rollback()
+        _set_status(job_id, 'error')
+    finally:
+        session.remove()
+
+
+def to_json(job: model.MailJob) -> dict:
+    return {
+        'id': job.id,
+        'task': job.task,
+        'status': job.status,
+        'total': job.total,
+        'sent': job.sent,
+        'failed': job.failed,
+        'remaining': max(job.total - job.sent - job.failed, 0),
+        'errors': json.loads(job.errors) if job.errors else [],
+        'created': job.created.isoformat() if job.created else None,
+        'finished': job.finished.isoformat() if job.finished else None,
+    }
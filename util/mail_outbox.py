@@ -0,0 +1,291 @@
+"""
+Durable outbox of e-mails.
+
+util.mail stores every composed message into a spool directory, a single
+mail_sender.py process delivers them. Layout of the spool (Maildir-like,
+every step is an atomic rename):
+ * tmp/     message being written,
+ * new/     queued messages, file name starts with the time of the next
+            delivery attempt, so due messages are selected without reading
+            them,
+ * cur/     messages being delivered by the sender,
+ * failed/  messages which could not be delivered (permanent error or too
+            many attempts).
+Each file contains a JSON envelope on the first line followed by the message.
+
+The sender reuses one SMTP connection for a batch of messages, transient
+errors are retried with backoff. Its metrics are stored in STATS_FILE.
+"""
+
+import datetime
+import json
+import os
+import smtplib
+import time
+import traceback
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import config
+from util import logger
+
+SPOOL_PATH = getattr(config, 'MAIL_SPOOL_PATH', 'data/mail-spool')
+SMTP_HOST = getattr(config, 'MAIL_SMTP_HOST', 'relay.fi.muni.cz')
+SMTP_PORT = getattr(config, 'MAIL_SMTP_PORT', 25)
+
+# Maximalni pocet zprav odeslanych jednim SMTP spojenim
+MESSAGES_PER_CONNECTION = 100
+# Prodlevy pred dalsimi pokusy o doruceni (sekundy)
+RETRY_DELAYS = [60, 5*60, 15*60, 60*60, 3*60*60]
+POLL_INTERVAL = 1.0
+STATS_FILE = 'stats.json'
+
+Envelope = Dict[str, object]
+
+
+def _dir(name: str) -> str:
+    return os.path.join(SPOOL_PATH, name)
+
+
+def _makedirs() -> None:
+    for name in ('tmp', 'new', 'cur', 'failed'):
+        os.makedirs(_dir(name), exist_ok=True)
+
+
+def _file_name(not_before: float) -> str:
+    # Zlomek sekundy zachovava poradi zprav vlozenych v jedne sekunde
+    return '%012d-%09d-%s.eml' % (int(not_before), time.time_ns() % 10**9,
+                                  uuid.uuid4().hex)
+
+
+def _write(path: str, envelope: Envelope, msg: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(json.dumps(envelope).encode('utf-8') + b'\n')
+        f.write(msg)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read(path: str) -> Tuple[Envelope, bytes]:
+    with open(path, 'rb') as f:
+        envelope = json.loads(f.readline().decode('utf-8'))
+        return envelope, f.read()
+
+
+def put(frm: str, to: List[str], msg: bytes) -> str:
+    """
+    Stores message into the outbox.
+    :return: name of the spooled file
+    """
+    _makedirs()
+    name = _file_name(time.time())
+    tmp_path = os.path.join(_dir('tmp'), name)
+    _write(tmp_path, {'from': frm, 'to': list(to), 'attempts': 0,
+                      'created': time.time()}, msg)
+    os.rename(tmp_path, os.path.join(_dir('new'), name))
+    return name
+
+
+def depth() -> Dict[str, int]:
+    """Number of messages in individual states."""
+    return {
+        state: (len(os.listdir(_dir(name))) if os.path.isdir(_dir(name))
+                else 0)
+        for state, name in (('queued', 'new'), ('sending', 'cur'),
+                            ('failed', 'failed'))
+    }
+
+
+def stats() -> Optional[dict]:
+    """Metrics of the sender process (None if it has never run)."""
+    try:
+        with open(os.path.join(SPOOL_PATH, STATS_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def requeue_stale() -> int:
+    """
+    Returns messages left in cur/ by a killed sender back to the queue.
+    Must be called only when no sender is running.
+    """
+    _makedirs()
+    names = os.listdir(_dir('cur'))
+    for name in names:
+        os.rename(os.path.join(_dir('cur'), name),
+                  os.path.join(_dir('new'), name))
+    return len(names)
+
+
+def claim(limit: int) -> List[str]:
+    """Moves up to 'limit' due messages to cur/, oldest first."""
+    now = '%012d' % int(time.time())
+    claimed = []
+    for name in sorted(os.listdir(_dir('new'))):
+        if len(claimed) >= limit or name[:12] > now:
+            break
+        try:
+            os.rename(os.path.join(_dir('new'), name),
+                      os.path.join(_dir('cur'), name))
+        except FileNotFoundError:
+            continue
+        claimed.append(name)
+    return claimed
+
+
+def _retry(name: str, envelope: Envelope, msg: bytes, error: str) -> bool:
+    """
+    Schedules next attempt of delivery.
+    :return: False if the message was moved to failed/ instead
+    """
+    attempts = int(envelope['attempts']) + 1
+    envelope.update({'attempts': attempts, 'error': error})
+    path = os.path.join(_dir('cur'), name)
+
+    if attempts > len(RETRY_DELAYS):
+        _fail(name, envelope, msg, error)
+        return False
+
+    new_name = _file_name(time.time() + RETRY_DELAYS[attempts - 1])
+    _write(os.path.join(_dir('tmp'), new_name), envelope, msg)
+    os.rename(os.path.join(_dir('tmp'), new_name),
+              os.path.join(_dir('new'), new_name))
+    os.remove(path)
+    return True
+
+
+def _fail(name: str, envelope: Envelope, msg: bytes, error: str) -> None:
+    envelope['error'] = error
+    _write(os.path.join(_dir('failed'), name), envelope, msg)
+    os.remove(os.path.join(_dir('cur'), name))
+    logger.get_log().error('Mail to %s failed permanently: %s' %
+                           (envelope['to'], error))
+
+
+class Sender(object):
+    """Delivers claimed messages, keeps the SMTP connection between them."""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT) -> None:
+        self.host = host
+        self.port = port
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.sent_by_connection = 0
+        self.metrics = {
+            'pid': os.getpid(),
+            'started': datetime.datetime.utcnow().isoformat(),
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+            'connections': 0,
+            'last_batch': None,
+        }
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.smtp is not None and \
+                self.sent_by_connection >= MESSAGES_PER_CONNECTION:
+            self.close()
+        if self.smtp is None:
+            self.smtp = smtplib.SMTP(self.host, self.port, timeout=60)
+            self.sent_by_connection = 0
+            self.metrics['connections'] += 1
+        return self.smtp
+
+    def close(self) -> None:
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+    def _deliver(self, name: str) -> None:
+        envelope, msg = _read(os.path.join(_dir('cur'), name))
+        try:
+            refused = self._connect().sendmail(envelope['from'],
+                                               envelope['to'], msg)
+            self.sent_by_connection += 1
+        except smtplib.SMTPRecipientsRefused as e:
+            codes = [code for code, _ in e.recipients.values()]
+            if all(code >= 500 for code in codes):
+                self.metrics['failed'] += 1
+                _fail(name, envelope, msg, str(e.recipients))
+                return
+            self._retry(name, envelope, msg, str(e.recipients))
+            return
+        except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            if e.smtp_code >= 500:
+                self.metrics['failed'] += 1
+                _fail(name, envelope, msg, '%d %s' % (e.smtp_code, e.smtp_error))
+                return
+            self._retry(name, envelope, msg, str(e))
+            return
+        except (smtplib.SMTPException, OSError) as e:
+            # Spojeni je v neznamem stavu, priste se pripojime znovu
+            if self.smtp is not None:
+                self.smtp.close()
+                self.smtp = None
+            self._retry(name, envelope, msg, str(e))
+            return
+
+        if refused:
+            logger.get_log().warning('Mail recipients refused: %s' % refused)
+        os.remove(os.path.join(_dir('cur'), name))
+        self.metrics['sent'] += 1
+
+    def _retry(self, name: str, envelope: Envelope, msg: bytes,
+               error: str) -> None:
+        if _retry(name, envelope, msg, error):
+            self.metrics['retried'] += 1
+        else:
+            self.metrics['failed'] += 1
+
+    def send_batch(self, names: List[str]) -> None:
+        started = time.monotonic()
+        for name in names:
+            try:
+                self._deliver(name)
+            except Exception:
+                # Poskozena zprava nesmi zastavit odesilani ostatnich
+                logger.get_log().error('Cannot deliver mail %s:\n%s' %
+                                       (name, traceback.format_exc()))
+                self.metrics['failed'] += 1
+                if os.path.isfile(os.path.join(_dir('cur'), name)):
+                    os.rename(os.path.join(_dir('cur'), name),
+                              os.path.join(_dir('failed'), name))
+        duration = time.monotonic() - started
+
+        self.metrics['last_batch'] = {
+            'finished': datetime.datetime.utcnow().isoformat(),
+            'messages': len(names),
+            'seconds': duration,
+            'messages_per_second': len(names) / duration if duration else None,
+        }
+        self.write_stats()
+
+    def write_stats(self) -> None:
+        data = dict(self.metrics, queue=depth(),
+                    updated=datetime.datetime.utcnow().isoformat())
+        tmp_path = os.path.join(SPOOL_PATH, STATS_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, os.path.join(SPOOL_PATH, STATS_FILE))
+
+
+def work(sender: Optional[Sender] = None) -> None:
+    """Main loop of the sender process, never returns."""
+    _makedirs()
+    if sender is None:
+        sender = Sender()
+    sender.write_stats()
+
+    while True:
+        names = claim(MESSAGES_PER_CONNECTION)
+        if names:
+            sender.send_batch(names)
+            continue
+
+        # Fronta je prazdna, spojeni nedrzime
+        sender.close()
+        time.sleep(POLL_INTERVAL)
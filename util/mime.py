@@ -0,0 +1,126 @@
+"""
+MIME types of served files.
+
+Sniffing with libmagic is expensive, so it is done once, when a file is
+stored. Submitted files have their type in model.SubmittedFile.mime, task
+content and the content tree have a sidecar index (INDEX_NAME) in every
+directory, written by deploy (util.admin.taskDeploy.copy_data) and by
+Content.on_post. Files missing from the index are sniffed by a single
+libmagic handle of the process, results are cached by path and mtime.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import magic
+
+from util.cache import TTLCache
+
+INDEX_NAME = '.mime.json'
+# Vysledky libmagic, klic obsahuje mtime, takze zmena souboru se projevi hned
+SNIFF_CACHE_TTL = 3600
+
+_magic = None
+_magic_lock = threading.Lock()
+_sniffed = TTLCache('mime', 4096, SNIFF_CACHE_TTL)
+_indexes = TTLCache('mime_index', 1024, SNIFF_CACHE_TTL)
+
+
+def sniff(path: str) -> str:
+    """Detects MIME type of the file by libmagic (no caching)."""
+    global _magic
+    # libmagic handle neni thread-safe
+    with _magic_lock:
+        if _magic is None:
+            _magic = magic.Magic(mime=True)
+        return _magic.from_file(path)
+
+
+def _stamp(st: os.stat_result) -> list:
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_index(directory: str) -> Dict[str, list]:
+    index_path = os.path.join(directory, INDEX_NAME)
+    try:
+        mtime = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return {}
+
+    cached = _indexes.get((index_path, mtime))
+    if cached is not None:
+        return cached
+
+    try:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    _indexes.put((index_path, mtime), index)
+    return index
+
+
+def _write_index(directory: str, index: Dict[str, list]) -> None:
+    index_path = os.path.join(directory, INDEX_NAME)
+    if not index:
+        if os.path.isfile(index_path):
+            os.remove(index_path)
+        return
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def update_index(directory: str, names: Iterable[str]) -> None:
+    """Sniffs files 'names' in 'directory' and stores them into its index."""
+    index = dict(_read_index(directory))
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            index[name] = [sniff(path)] + _stamp(os.stat(path))
+    _write_index(directory, index)
+
+
+def remove_from_index(directory: str, names: Iterable[str]) -> None:
+    index = dict(_read_index(directory))
+    for name in names:
+        index.pop(name, None)
+    _write_index(directory, index)
+
+
+def write_indexes(root: str) -> None:
+    """Writes indexes of all directories in tree 'root' from scratch."""
+    for directory, _, files in os.walk(root):
+        _write_index(directory, {
+            name: [sniff(os.path.join(directory, name))] +
+            _stamp(os.stat(os.path.join(directory, name)))
+            for name in files if not name.startswith(INDEX_NAME)
+        })
+
+
+def from_file(path: str, st: Optional[os.stat_result] = None) -> str:
+    """
+    MIME type of the file from index of its directory, or by libmagic.
+    :param st: result of os.stat(path), if already known
+    """
+    if st is None:
+        st = os.stat(path)
+
+    entry = _read_index(os.path.dirname(path)).get(os.path.basename(path))
+    if entry is not None and entry[1:] == _stamp(st):
+        return entry[0]
+
+    key = (path, st.st_size, st.st_mtime_ns)
+    mime = _sniffed.get(key)
+    if mime is None:
+        mime = sniff(path)
+        _sniffed.put(key, mime)
+    return mime
+
+
+def is_index(name: str) -> bool:
+    return name.startswith(INDEX_NAME)
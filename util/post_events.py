@@ -0,0 +1,306 @@
+"""
+Notifications about new forum posts sent outside of the request.
+
+POST /posts only stores a 'post_created' event (table post_events) in the
+same transaction as the post and wakes the dispatcher thread of the gunicorn
+worker. The dispatcher loads everything needed for the notifications of the
+post in one joined query and sends the e-mails (task authors and wave
+garant, correctors, the conference and the author of the parent post).
+
+Events are claimed by a conditional UPDATE, so dispatchers of several
+workers never send the same notification twice. Events left 'running' for
+STALE_AFTER (worker restarted while sending) are claimed again, events not
+picked up after a restart are sent within POLL_INTERVAL of the next wakeup.
+"""
+
+import datetime
+import threading
+import traceback
+from typing import List, Optional
+
+from sqlalchemy import and_, func, or_, distinct
+from sqlalchemy.orm import aliased
+
+from db import session
+import model
+import util
+from util import config
+
+# Jak casto dispatcher kontroluje frontu bez probuzeni (sekundy)
+POLL_INTERVAL = 30
+STALE_AFTER = datetime.timedelta(minutes=10)
+TMP_ADMIN_URL = "https://naskoc_admin.iamroot.eu/"  # TODO remove after deploying new admin
+
+_wakeup = threading.Event()
+_dispatcher: Optional[threading.Thread] = None
+_dispatcher_lock = threading.Lock()
+
+
+def record_created(post: model.Post) -> None:
+    """
+    Adds 'post_created' event of flushed 'post' into the session,
+    the caller commits it together with the post and then calls wake().
+    """
+    session.add(model.PostEvent(post=post.id, type='post_created',
+                                status='queued'))
+
+
+def wake() -> None:
+    """Starts the dispatcher of this process if needed and wakes it up."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(target=_dispatch_loop,
+                                           name='post-events', daemon=True)
+            _dispatcher.start()
+    _wakeup.set()
+
+
+def _claim_next() -> Optional[model.PostEvent]:
+    """Atomically marks the oldest waiting event as running."""
+    stale = datetime.datetime.utcnow() - STALE_AFTER
+    waiting = or_(model.PostEvent.status == 'queued',
+                  and_(model.PostEvent.status == 'running',
+                       model.PostEvent.started < stale))
+    while True:
+        event_id = session.query(model.PostEvent.id).\
+            filter(waiting).\
+            order_by(model.PostEvent.id).\
+            limit(1).\
+            scalar()
+
+        if event_id is None:
+            session.commit()
+            return None
+
+        claimed = session.query(model.PostEvent).\
+            filter(model.PostEvent.id == event_id, waiting).\
+            update({model.PostEvent.status: 'running',
+                    model.PostEvent.started: datetime.datetime.utcnow()},
+                   synchronize_session=False)
+        session.commit()
+
+        if claimed == 1:
+            return session.query(model.PostEvent).get(event_id)
+        # Jiny worker byl rychlejsi, zkusime dalsi udalost
+
+
+def _dispatch_loop() -> None:
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            event = _claim_next()
+            while event is not None:
+                _process(event)
+                event = _claim_next()
+        except Exception:
+            session.rollback()
+            util.logger.get_log().error('Post events dispatcher failed:\n%s'
+                                        % traceback.format_exc())
+        finally:
+            session.remove()
+
+
+def _process(event: model.PostEvent) -> None:
+    errors: List[str] = []
+    try:
+        _send_post_created(event.post, errors)
+    except Exception:
+        session.rollback()
+        errors.append(traceback.format_exc())
+
+    event.status = 'error' if errors else 'done'
+    event.error = '\n'.join(errors) if errors else None
+    event.finished = datetime.datetime.utcnow()
+    session.commit()
+
+
+def _send(errors: List[str], *args, **kwargs) -> None:
+    try:
+        util.mail.send(*args, **kwargs)
+    except BaseException:
+        errors.append(traceback.format_exc())
+        util.logger.get_log().error('Post notification failed:\n%s' %
+                                    errors[-1])
+
+
+def _send_post_created(post_id: int, errors: List[str]) -> None:
+    Author = aliased(model.User)
+    TaskAuthor = aliased(model.User)
+    TaskCoAuthor = aliased(model.User)
+    Garant = aliased(model.User)
+    Parent = aliased(model.Post)
+    ParentAuthor = aliased(model.User)
+
+    prog_modules = session.query(model.Module.id).\
+        filter(model.Module.task == model.Task.id,
+               model.Module.type == model.ModuleType.PROGRAMMING)
+    prog_modules_cnt = prog_modules.\
+        with_entities(func.count(model.Module.id)).as_scalar()
+    prog_module_first = prog_modules.\
+        with_entities(func.min(model.Module.id)).as_scalar()
+
+    row = session.query(
+        model.Post, Author, model.Thread, model.Task,
+        TaskAuthor.email, TaskCoAuthor.email, Garant.email,
+        model.SolutionComment, Parent, ParentAuthor, model.UserNotify,
+        prog_modules_cnt, prog_module_first
+    ).\
+        join(Author, Author.id == model.Post.author).\
+        join(model.Thread, model.Thread.id == model.Post.thread).\
+        outerjoin(model.Task, model.Task.thread == model.Thread.id).\
+        outerjoin(TaskAuthor, TaskAuthor.id == model.Task.author).\
+        outerjoin(TaskCoAuthor, TaskCoAuthor.id == model.Task.co_author).\
+        outerjoin(model.Wave, model.Wave.id == model.Task.wave).\
+        outerjoin(Garant, Garant.id == model.Wave.garant).\
+        outerjoin(model.SolutionComment,
+                  and_(model.SolutionComment.thread == model.Thread.id,
+                       model.SolutionComment.user == model.Post.author)).\
+        outerjoin(Parent, Parent.id == model.Post.parent).\
+        outerjoin(ParentAuthor, ParentAuthor.id == Parent.author).\
+        outerjoin(model.UserNotify, model.UserNotify.user == Parent.author).\
+        filter(model.Post.id == post_id).\
+        first()
+
+    if row is None:
+        # Prispevek byl mezitim smazan
+        return
+
+    (post, author, thread, task_thread, task_author_email,
+     task_co_author_email, wave_garant_email, solution_thread, parent,
+     parent_user, parent_notify, prog_modules_cnt, prog_module_first) = row
+
+    # Tady si pamatujeme, komu jsme email jiz odeslali
+    sent_emails = set()
+
+    # ------------------------------------------
+    # Odesilani emailu orgum
+    if author.role == 'participant' or author.role == 'participant_hidden':
+
+        if task_thread:
+            # Vlakno k uloze -> posilame email autoru ulohy,
+            # spoluautoru ulohy a garantovi vlny.
+            recipients = [task_author_email]
+            sent_emails.add(task_author_email)
+            sent_emails.add(wave_garant_email)
+            if task_thread.co_author:
+                sent_emails.add(task_co_author_email)
+                recipients.append(task_co_author_email)
+
+            body = (
+                '<p>Ahoj,<br/>k tvé úloze <a href="' +
+                config.ksi_web() + '/ulohy/' + str(task_thread.id) +
+                '">' + task_thread.title + '</a> na <a href="' +
+                config.ksi_web() + '/">' + config.ksi_web() +
+                '</a> byl přidán nový komentář:</p><p><i>' +
+                author.first_name + ' ' + author.last_name +
+                ':</i></p>' + post.body + '<p><a href="' +
+                config.ksi_web() + '/ulohy/' + str(task_thread.id) +
+                '#diskuze">Přejít do diskuze.</a> ' + '<a href="' +
+                TMP_ADMIN_URL + '/admin/opravovani?participant_=' +
+                str(author.id) + '&task_=' + str(task_thread.id) +
+                '">Přejít na opravení.</a>'
+            )
+
+            if prog_modules_cnt > 0:
+                body += (' <a href="' + TMP_ADMIN_URL +
+                         '/admin/execs?user=' + str(author.id))
+                if prog_modules_cnt == 1:
+                    body += '&module=' + str(prog_module_first)
+
+                body += '">Přejít na spuštění.</a></p>'
+
+            body += '</p>'
+            body += config.mail_sign()
+
+            _send(
+                errors,
+                recipients,
+                '[Naskoc na FI] Nový příspěvek k úloze ' + task_thread.title,
+                body,
+                cc=wave_garant_email
+            )
+
+        elif solution_thread:
+            # Vlakno k oprave -> posilame email autoru opravy
+            correctors = [
+                r for r, in
+                session.query(distinct(model.User.email)).
+                join(model.Evaluation,
+                     model.Evaluation.evaluator == model.User.id).
+                join(model.Module,
+                     model.Evaluation.module == model.Module.id).
+                filter(model.Module.task == solution_thread.task).all()
+            ]
+
+            for corr_email in correctors:
+                sent_emails.add(corr_email)
+
+            if correctors:
+                task = session.query(model.Task).get(solution_thread.task)
+                _send(
+                    errors,
+                    correctors,
+                    '[Naskoc na FI] Nový komentář k tvé korektuře úlohy ' +
+                    task.title,
+                    '<p>Ahoj,<br/>k tvé <a href="' +
+                    TMP_ADMIN_URL + '/admin/opravovani?task_=' +
+                    str(task.id) + '&participant_=' + str(author.id) +
+                    '">korektuře</a> úlohy <a href="' + config.ksi_web() +
+                    '/ulohy/' + str(task.id) + '">' + task.title +
+                    '</a> na <a href="' + config.ksi_web() + '/">' +
+                    config.ksi_web() +
+                    '</a> byl přidán nový komentář:<p><p><i>' +
+                    author.first_name + ' ' +
+                    author.last_name + ':</i></p><p>' +
+                    post.body + config.mail_sign())
+        else:
+            # Obecna diskuze -> email na ksi@fi.muni.cz
+            sent_emails.add(config.ksi_conf())
+            _send(
+                errors,
+                config.ksi_conf(),
+                '[Naskoc na FI] Nový příspěvek v obecné diskuzi',
+                '<p>Ahoj,<br/>do obecné diskuze na <a href="' +
+                config.ksi_web() + '/">' + config.ksi_web() +
+                '</a> byl přidán nový příspěvek:</p><p><i>' +
+                author.first_name + ' ' +
+                author.last_name + ':</i></p>' + post.body +
+                '<p><a href=' + config.ksi_web() + '/forum/' +
+                str(thread.id) + '>Přejít do diskuze.</a></p>' +
+                config.mail_sign()
+            )
+
+    # ------------------------------------------
+    # Odesilani emailu v reakci na muj prispevek:
+
+    if parent:
+        parent_notify = util.user_notify.normalize(parent_notify,
+                                                   parent.author)
+        if (parent_user.email not in sent_emails and
+                parent_notify.notify_response):
+            sent_emails.add(parent_user.email)
+
+            body = (
+                '<p>Ahoj,<br>do diskuze <a href="%s">%s</a> byl '
+                'přidán nový příspěvek.</p>' %
+                (util.config.ksi_web() + "/forum/" +
+                 str(thread.id), thread.title)
+            )
+            body += util.post.to_html(parent, parent_user)
+            body += ("<div style='margin-left: 50px;'>%s</div>" %
+                     (util.post.to_html(post, author)))
+            body += util.config.mail_sign()
+
+            _send(
+                errors,
+                parent_user.email,
+                ('[Naskoc na FI] Nový příspěvek v diskuzi %s' %
+                 (thread.title)),
+                body,
+                unsubscribe=util.mail.Unsubscribe(
+                    email_type=util.mail.EMailType.RESPONSE,
+                    user_id=parent_user.id,
+                ),
+            )
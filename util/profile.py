@@ -25,10 +25,7 @@ def to_json(user, profile, notify, year_obj, basic=False, sensitive: bool = Fals
         task_scores = {task: (points, wave, prereq) for task, points, wave,
                        prereq in util.task.any_submitted(user.id, year_obj.id)}
 
-        adeadline = util.task.after_deadline()
-        fsubmitted = util.task.fully_submitted(user.id, year_obj.id)
-        corrected = util.task.corrected(user.id)
-        autocorrected_full = util.task.autocorrected_full(user.id)
+        engine = util.task_status.TaskStatusEngine(user, year_obj.id)
         task_max_points_dict = util.task.max_points_dict()
 
         # task_achievements je seznam [(Task,Achievement)] pro vsechny
@@ -48,13 +45,15 @@ def to_json(user, profile, notify, year_obj, basic=False, sensitive: bool = Fals
             'profile': dict(
                 list(_basic_profile_to_json(user).items()) +
                 list(_full_profile_to_json(user, profile, notify, task_scores,
-                                           year_obj, sensitive=sensitive).items())
+                                           year_obj, sensitive=sensitive,
+                                           fsubmitted=engine.fully_submitted()
+                                           ).items())
             ),
             'tasks': [
                 util.task.to_json(
-                    task, prereq, user, adeadline, fsubmitted, wave,
-                    task.id in corrected, task.id in autocorrected_full,
-                    task_max_points=task_max_points_dict[task.id])
+                    task, engine.prerequisite(task.id), user, wave=wave,
+                    task_max_points=task_max_points_dict[task.id],
+                    tstatus=engine.status(task.id))
                 for task, (points, wave, prereq) in list(task_scores.items())
             ],
             'taskScores': [
@@ -85,7 +84,8 @@ def _basic_profile_to_json(user: model.User) -> dict:
     }
 
 
-def _full_profile_to_json(user, profile, notify, task_scores, year_obj, sensitive: bool = False):
+def _full_profile_to_json(user, profile, notify, task_scores, year_obj, sensitive: bool = False,
+                          fsubmitted=None):
     """
 
     :param user:
@@ -94,8 +94,12 @@ def _full_profile_to_json(user, profile, notify, task_scores, year_obj, sensitiv
     :param task_scores:
     :param year_obj:
     :param sensitive: it True, include sensitive information like user's address
+    :param fsubmitted: fully submitted tasks of the user in year_obj, if already known
     :return:
     """
+    if fsubmitted is None:
+        fsubmitted = util.task.fully_submitted(user.id, year_obj.id)
+
     points, cheat = util.user.sum_points(user.id, year_obj.id)
     summary = max(util.task.sum_points(
         year_obj.id, bonus=False),
@@ -121,7 +125,7 @@ def _full_profile_to_json(user, profile, notify, task_scores, year_obj, sensitiv
         'seasons': [key for (key,) in util.user.active_years(user.id)],
         'percent': successful,
         'results': [task.id for task in list(task_scores.keys())],
-        'tasks_num': len(util.task.fully_submitted(user.id, year_obj.id)),
+        'tasks_num': len(fsubmitted),
 
         'notify_eval': notify.notify_eval if notify else True,
         'notify_response': notify.notify_response if notify else True,
@@ -1,9 +1,5 @@
 import datetime
 import math
-import random
-import time
-from pathlib import Path
-from typing import Optional
 
 from humanfriendly import parse_timespan, parse_size
 import json
@@ -15,6 +11,7 @@ from sqlalchemy import desc
 
 from db import session
 import model
+import util
 
 """
 Specifikace \data v databazi modulu pro "programming":
@@ -175,12 +172,9 @@ def evaluate(task, module, user_id, code, eval_id, reporter: Reporter):
     try:
         box_id = init_exec_environment()
     except ENoFreeBox:
+        # Volajici rozhoduje, zda opraveni odmitne, nebo vrati do fronty
         reporter += "Reached limit of concurrent tasks!\n"
-        return {
-            'result': 'error',
-            'message': 'Přesáhnut maximální počet zároveň spuštěných opravení,'
-                       ' zkuste to později.'
-        }
+        raise
 
     check_res = {}
     try:
@@ -230,80 +224,14 @@ def evaluate(task, module, user_id, code, eval_id, reporter: Reporter):
     return res
 
 
-def find_free_box_id() -> Optional[str]:
-    """
-    limits = prog_info["limits"] if "limits" in prog_info else {}
-    Returns is of the first available sandbox directory. Searched for
-    non-existing directories in /tmp/box.
-    """
-    dir_boxes = Path(EXEC_PATH)
-
-    if len(list(
-            filter(lambda x: x.name.startswith(f"{BOX_ID_PREFIX}"), dir_boxes.iterdir())
-    )) >= MAX_CONCURRENT_EXEC:
-        return None
-
-    while True:
-        box_name = f"{BOX_ID_PREFIX}{int(((time.time() * 1000 % 10**5) * random.randint(0, 1000))%1000):03d}"
-        if not dir_boxes.joinpath(box_name).exists():
-            return box_name
-        time.sleep(0.001)
-
-
 def init_exec_environment():
-    """Initialize sandbox."""
-
-    # Create directory for sandbox
-    if not os.path.exists(EXEC_PATH):
-        os.makedirs(EXEC_PATH)
-
-    box_id = find_free_box_id()
-
-    if box_id is None:
-        raise ENoFreeBox("Reached limit of concurrent tasks!")
-
-    # Run isolate --init
-    p = subprocess.Popen(
-        ["isolate", "-b", box_id, "--init"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    stdout, stderr = p.communicate(timeout=60)
-    if p.returncode != 0:
-        raise EIsolateError(
-            f"Isolate --init for box '{box_id}' returned code ({p.returncode})\n"
-            f"---- STDOUT ----\n"
-            f"{stdout}\n"
-            f"---- STDERR ----\n"
-            f"{stderr}"
-        )
-
-    return box_id
+    """Lock a pre-initialized sandbox from the pool."""
+    return util.sandbox_pool.acquire()
 
 
 def cleanup_exec_environment(box_id):
-    """Clean-up sandbox data."""
-
-    sandbox_root = os.path.join(EXEC_PATH, box_id)
-    if os.path.isdir(sandbox_root):
-        p = subprocess.Popen(
-            ["isolate", "-b", box_id, "--cleanup"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        p.wait()
-        if p.returncode != 0:
-            stdout, stderr = p.communicate()
-            print('Error cleaning directory %s:\n%s\n%s' % (
-                    box_id, stdout.decode('utf-8'), stderr.decode('utf-8')
-                )
-            )
-
-        try:
-            if os.path.isdir(sandbox_root):
-                shutil.rmtree(sandbox_root)
-        except:
-            pass
+    """Wipe sandbox data and return the sandbox to the pool."""
+    util.sandbox_pool.release(box_id)
 
 
 def code_execution_dir(user_id: int, module_id: int) -> str:
@@ -0,0 +1,205 @@
+"""
+Pool of pre-initialized isolate sandboxes.
+
+Boxes have fixed ids and are initialized (isolate --init) only once. Every
+box has its own lock file; holding an exclusive flock() on it means the box
+is in use. The kernel releases the lock when the holding process dies, so
+the free list is shared by all gunicorn workers and eval_worker.py processes
+without any daemon. Released boxes are wiped in place, the expensive
+isolate --cleanup + --init is done only when the wipe fails.
+"""
+
+import fcntl
+import os
+import random
+import shutil
+import subprocess
+from typing import Dict, List, Set
+
+import util
+
+LOCK_PATH = '/tmp/box-pool/'
+INIT_MARKER = '%s.init'    # obsah adresare boxu hned po isolate --init
+DIRTY_MARKER = '%s.dirty'  # box byl pouzit a jeste nebyl vycisten
+
+# Otevrene zamky boxu drzene timto procesem
+_held: Dict[str, int] = {}
+
+
+def box_ids() -> List[str]:
+    """Ids of all boxes of the pool, one per allowed concurrent run."""
+    prefix = util.programming.BOX_ID_PREFIX
+    return ['%d%03d' % (prefix, i)
+            for i in range(util.programming.MAX_CONCURRENT_EXEC)]
+
+
+def _box_root(box_id: str) -> str:
+    return os.path.join(util.programming.EXEC_PATH, box_id)
+
+
+def _marker(marker: str, box_id: str) -> str:
+    return os.path.join(LOCK_PATH, marker % box_id)
+
+
+def _try_lock(box_id: str) -> bool:
+    fd = os.open(os.path.join(LOCK_PATH, box_id + '.lock'),
+                 os.O_RDWR | os.O_CREAT, 0o660)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+
+    _held[box_id] = fd
+    return True
+
+
+def _unlock(box_id: str) -> None:
+    fd = _held.pop(box_id)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _isolate(box_id: str, action: str) -> None:
+    p = subprocess.Popen(
+        ["isolate", "-b", box_id, action],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = p.communicate(timeout=60)
+    if p.returncode != 0:
+        raise util.programming.EIsolateError(
+            f"Isolate {action} for box '{box_id}' returned code ({p.returncode})\n"
+            f"---- STDOUT ----\n"
+            f"{stdout}\n"
+            f"---- STDERR ----\n"
+            f"{stderr}"
+        )
+
+
+def _is_initialized(box_id: str) -> bool:
+    return (os.path.isfile(_marker(INIT_MARKER, box_id)) and
+            os.path.isdir(os.path.join(_box_root(box_id), 'box')))
+
+
+def _init(box_id: str) -> None:
+    if os.path.isdir(_box_root(box_id)):
+        _reset(box_id)
+
+    _isolate(box_id, "--init")
+    with open(_marker(INIT_MARKER, box_id), 'w') as f:
+        f.write('\n'.join(os.listdir(_box_root(box_id))))
+
+
+def _initial_entries(box_id: str) -> Set[str]:
+    with open(_marker(INIT_MARKER, box_id), 'r') as f:
+        return set(f.read().split('\n'))
+
+
+def _remove(entry: os.DirEntry) -> None:
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path)
+    else:
+        os.unlink(entry.path)
+
+
+def _wipe(box_id: str) -> None:
+    """Removes everything created in the box since isolate --init."""
+    keep = _initial_entries(box_id)
+    for entry in os.scandir(_box_root(box_id)):
+        if entry.name == 'box':
+            for inner in os.scandir(entry.path):
+                _remove(inner)
+        elif entry.name not in keep:
+            _remove(entry)
+
+
+def _reset(box_id: str) -> None:
+    """Full cleanup, the box will be initialized again on next use."""
+    try:
+        if os.path.isfile(_marker(INIT_MARKER, box_id)):
+            os.remove(_marker(INIT_MARKER, box_id))
+        _isolate(box_id, "--cleanup")
+    except util.programming.EIsolateError as e:
+        util.logger.get_log().error(str(e))
+    shutil.rmtree(_box_root(box_id), ignore_errors=True)
+
+
+def _make_clean(box_id: str) -> None:
+    """Ensures locked box is initialized and empty."""
+    if not _is_initialized(box_id):
+        _init(box_id)
+    elif os.path.isfile(_marker(DIRTY_MARKER, box_id)):
+        try:
+            _wipe(box_id)
+        except OSError:
+            _init(box_id)
+
+    if os.path.isfile(_marker(DIRTY_MARKER, box_id)):
+        os.remove(_marker(DIRTY_MARKER, box_id))
+
+
+def prepare() -> None:
+    """
+    Initializes all free boxes of the pool ahead of time and removes boxes
+    that do not belong to the pool. Boxes used by other processes are
+    skipped.
+    """
+    os.makedirs(util.programming.EXEC_PATH, exist_ok=True)
+    os.makedirs(LOCK_PATH, exist_ok=True)
+
+    pool = set(box_ids())
+    for entry in os.scandir(util.programming.EXEC_PATH):
+        if entry.name not in pool:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    for box_id in pool:
+        if not _try_lock(box_id):
+            continue
+        try:
+            _make_clean(box_id)
+        except util.programming.EIsolateError as e:
+            util.logger.get_log().error(str(e))
+        finally:
+            _unlock(box_id)
+
+
+def acquire() -> str:
+    """
+    Locks a free box of the pool and returns its id.
+    Raises ENoFreeBox when all boxes are in use.
+    """
+    os.makedirs(LOCK_PATH, exist_ok=True)
+
+    ids = box_ids()
+    start = random.randrange(len(ids))
+    for box_id in ids[start:] + ids[:start]:
+        if not _try_lock(box_id):
+            continue
+
+        try:
+            _make_clean(box_id)
+            with open(_marker(DIRTY_MARKER, box_id), 'w'):
+                pass
+        except BaseException:
+            _unlock(box_id)
+            raise
+        return box_id
+
+    raise util.programming.ENoFreeBox("Reached limit of concurrent tasks!")
+
+
+def release(box_id: str) -> None:
+    """Wipes the box and returns it to the pool."""
+    if box_id not in _held:
+        return
+
+    try:
+        _wipe(box_id)
+        os.remove(_marker(DIRTY_MARKER, box_id))
+    except OSError:
+        _reset(box_id)
+    finally:
+        _unlock(box_id)
@@ -0,0 +1,207 @@
+"""
+Maintenance of the materialized scoreboard (model.UserYearScore).
+
+Rows are recomputed for affected users whenever their evaluations change,
+so the results list (/users) is a single indexed read. The whole table can
+be rebuilt or checked by scoreboard.py.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, distinct
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import Session
+
+from db import session
+import model
+from util import logger
+
+# (total_score, tasks_cnt, cheat)
+Score = Tuple[float, int, bool]
+
+
+def compute(year_id: int, user_ids: Optional[Iterable[int]] = None,
+            sess: Optional[Session] = None) -> Dict[int, Score]:
+    """
+    Computes scoreboard rows from evaluations, same semantics as the original
+    results list: score is a sum of best evaluations of modules of tasks with
+    public evaluation, task count includes all submitted tasks.
+    :param user_ids: compute only for these users (all users if None)
+    :param sess: session to use (deploy runs in its own thread)
+    """
+    s = sess if sess is not None else session
+
+    per_module = s.query(
+        model.Evaluation.user.label('user'),
+        func.max(model.Evaluation.points).label('points'),
+        func.max(model.Evaluation.cheat).label('cheat'),
+    ).\
+        join(model.Module, model.Evaluation.module == model.Module.id).\
+        join(model.Task, model.Task.id == model.Module.task).\
+        filter(model.Task.evaluation_public).\
+        join(model.Wave, model.Wave.id == model.Task.wave).\
+        filter(model.Wave.year == year_id)
+
+    tasks = s.query(
+        model.Evaluation.user,
+        func.count(distinct(model.Task.id)),
+    ).\
+        join(model.Module, model.Evaluation.module == model.Module.id).\
+        join(model.Task, model.Task.id == model.Module.task).\
+        join(model.Wave, model.Wave.id == model.Task.wave).\
+        filter(model.Wave.year == year_id)
+
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        per_module = per_module.filter(model.Evaluation.user.in_(user_ids))
+        tasks = tasks.filter(model.Evaluation.user.in_(user_ids))
+
+    per_module = per_module.\
+        group_by(model.Evaluation.user, model.Evaluation.module).\
+        subquery()
+
+    scores = s.query(
+        per_module.c.user,
+        func.sum(per_module.c.points),
+        func.max(per_module.c.cheat),
+    ).\
+        group_by(per_module.c.user).\
+        all()
+
+    result = {
+        user: (0.0, tasks_cnt, False)
+        for user, tasks_cnt in tasks.group_by(model.Evaluation.user).all()
+    }
+    for user, points, cheat in scores:
+        tasks_cnt = result[user][1] if user in result else 0
+        result[user] = (points if points is not None else 0.0, tasks_cnt,
+                        bool(cheat))
+
+    return result
+
+
+def refresh(year_id: int, user_ids: Optional[Iterable[int]] = None,
+            sess: Optional[Session] = None) -> int:
+    """
+    Recomputes and stores scoreboard rows of 'user_ids' (or all users)
+    in year 'year_id'. Commits the session.
+    :return: number of changed rows
+    """
+    s = sess if sess is not None else session
+    if user_ids is not None:
+        user_ids = list(user_ids)
+
+    computed = compute(year_id, user_ids, s)
+
+    rows = s.query(model.UserYearScore).\
+        filter(model.UserYearScore.year == year_id)
+    if user_ids is not None:
+        rows = rows.filter(model.UserYearScore.user.in_(user_ids))
+    rows = {row.user: row for row in rows.all()}
+
+    changed = 0
+    for user, (total_score, tasks_cnt, cheat) in computed.items():
+        row = rows.pop(user, None)
+        if row is None:
+            row = model.UserYearScore(user=user, year=year_id)
+            s.add(row)
+        elif (row.total_score, row.tasks_cnt, row.cheat) == \
+                (total_score, tasks_cnt, cheat):
+            continue
+
+        row.total_score = total_score
+        row.tasks_cnt = tasks_cnt
+        row.cheat = cheat
+        changed += 1
+
+    # Uzivatele, kterym mezitim zmizela vsechna hodnoceni
+    for row in rows.values():
+        s.delete(row)
+        changed += 1
+
+    s.commit()
+    return changed
+
+
+def check(year_id: int) -> List[Tuple[int, Optional[Score], Optional[Score]]]:
+    """
+    Compares stored rows with freshly computed ones.
+    :return: [(user_id, stored, computed)] for all inconsistent users
+    """
+    computed = compute(year_id)
+    stored = {
+        row.user: (row.total_score, row.tasks_cnt, row.cheat)
+        for row in session.query(model.UserYearScore).
+        filter(model.UserYearScore.year == year_id).all()
+    }
+
+    return [
+        (user, stored.get(user), computed.get(user))
+        for user in sorted(set(computed) | set(stored))
+        if stored.get(user) != computed.get(user)
+    ]
+
+
+def _safe_refresh(year_id: int, user_ids: List[int],
+                  sess: Optional[Session]) -> None:
+    """
+    Scoreboard is derived data, failure to update it must not fail the
+    request that changed evaluations. Concurrent insert of the same row is
+    retried once.
+    """
+    s = sess if sess is not None else session
+    for attempt in range(2):
+        try:
+            refresh(year_id, user_ids, s)
+            return
+        except IntegrityError:
+            s.rollback()
+        except SQLAlchemyError:
+            s.rollback()
+            break
+
+    logger.get_log().warning(
+        'Scoreboard update of users %s in year %s failed, run scoreboard.py '
+        'rebuild' % (user_ids, year_id)
+    )
+
+
+def update_module(user_id: int, module_id: int,
+                  sess: Optional[Session] = None) -> None:
+    """Call after evaluation of 'user_id' in 'module_id' changed."""
+    s = sess if sess is not None else session
+    year_id = s.query(model.Wave.year).\
+        join(model.Task, model.Task.wave == model.Wave.id).\
+        join(model.Module, model.Module.task == model.Task.id).\
+        filter(model.Module.id == module_id).\
+        scalar()
+
+    if year_id is not None:
+        _safe_refresh(year_id, [user_id], s)
+
+
+def update_users(year_id: int, user_ids: Iterable[int],
+                 sess: Optional[Session] = None) -> None:
+    """Call after evaluations of 'user_ids' in the year were removed."""
+    s = sess if sess is not None else session
+    users = sorted(user_ids)
+    if users:
+        _safe_refresh(year_id, users, s)
+
+
+def update_task(task_id: int, sess: Optional[Session] = None) -> None:
+    """Call after a change affecting all evaluations of the task (publish)."""
+    s = sess if sess is not None else session
+    year_id = s.query(model.Wave.year).\
+        join(model.Task, model.Task.wave == model.Wave.id).\
+        filter(model.Task.id == task_id).\
+        scalar()
+
+    users = [
+        user for (user,) in s.query(distinct(model.Evaluation.user)).
+        join(model.Module, model.Module.id == model.Evaluation.module).
+        filter(model.Module.task == task_id).all()
+    ]
+
+    if year_id is not None and users:
+        _safe_refresh(year_id, users, s)
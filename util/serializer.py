@@ -0,0 +1,62 @@
+"""
+Serialization of API responses to JSON.
+
+Responses are compact by default, '?pretty=1' returns the previous indented
+and sorted output. When orjson is installed, it is used for compact output;
+set JSON_BACKEND = 'json' in config.py to force the standard library.
+"""
+
+import decimal
+import json
+from typing import Any, Callable, Dict
+
+import config
+from util import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError('Object of type %s is not JSON serializable' %
+                    type(obj).__name__)
+
+
+def _dumps_json(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                      default=_default).encode('utf-8')
+
+
+def _dumps_orjson(data: Any) -> bytes:
+    return orjson.dumps(data, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_pretty(data: Any) -> bytes:
+    return json.dumps(data, sort_keys=True, indent=4, ensure_ascii=False,
+                      default=_default).encode('utf-8')
+
+
+BACKENDS: Dict[str, Callable[[Any], bytes]] = {'json': _dumps_json}
+if orjson is not None:
+    BACKENDS['orjson'] = _dumps_orjson
+
+BACKEND = getattr(config, 'JSON_BACKEND',
+                  'orjson' if orjson is not None else 'json')
+if BACKEND not in BACKENDS:
+    # Napr. JSON_BACKEND = 'orjson' bez nainstalovaneho orjson; server musi
+    # nastartovat i tak
+    logger.get_log().warning(
+        "JSON_BACKEND '%s' is not available (is the package installed?), "
+        "using 'json'" % BACKEND)
+    BACKEND = 'json'
+_dumps = BACKENDS[BACKEND]
+
+
+def dumps(data: Any, pretty: bool = False) -> bytes:
+    """Serializes response payload to UTF-8 encoded JSON."""
+    return dumps_pretty(data) if pretty else _dumps(data)
@@ -0,0 +1,148 @@
+"""
+Per-request profiling of SQL queries based on SQLAlchemy engine events.
+
+SQLProfiler middleware (app.py) counts queries and time spent in the
+database for every request, reports them in X-DB-Queries and Server-Timing
+headers, logs requests exceeding thresholds together with their most
+expensive statements and aggregates per-route statistics, which are
+available at /admin/sql-stats. Statistics are per gunicorn worker.
+
+Thresholds can be set in config.py:
+    SQL_PROFILE_MAX_QUERIES = 50   # log requests with more queries
+    SQL_PROFILE_MAX_TIME = 0.5     # log requests with longer db time (s)
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+from util import logger
+
+MAX_QUERIES = getattr(config, 'SQL_PROFILE_MAX_QUERIES', 50)
+MAX_TIME = getattr(config, 'SQL_PROFILE_MAX_TIME', 0.5)
+# Pocet nejdrazsich dotazu vypsanych do logu u pomaleho pozadavku
+TOP_STATEMENTS = 5
+STATEMENT_MAX_LEN = 300
+
+_local = threading.local()
+_routes: Dict[str, dict] = {}
+_routes_lock = threading.Lock()
+
+
+class RequestStats(object):
+    """Queries executed while handling a single request."""
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.started = time.monotonic()
+        # {statement: [count, time]}
+        self.statements: Dict[str, List] = {}
+
+    def add(self, statement: str, duration: float) -> None:
+        self.queries += 1
+        self.db_time += duration
+        item = self.statements.setdefault(statement, [0, 0.0])
+        item[0] += 1
+        item[1] += duration
+
+    def top(self, n: int = TOP_STATEMENTS) -> List[Tuple[str, int, float]]:
+        """Statements ordered by total time, repeated ones indicate N+1."""
+        return sorted(
+            ((st, cnt, t) for st, (cnt, t) in self.statements.items()),
+            key=lambda item: item[2],
+            reverse=True
+        )[:n]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # Zacatek se uklada na kontext dotazu, po selhanem dotazu (bez
+    # after_cursor_execute) tak na spojeni nic nezustane
+    if context is not None:
+        context._profiler_start = time.monotonic()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = getattr(context, '_profiler_start', None)
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and started is not None:
+        stats.add(statement, time.monotonic() - started)
+
+
+def install(engine: Engine) -> None:
+    """Registers engine listeners, call once per process."""
+    if not event.contains(engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def start() -> RequestStats:
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def stop() -> Optional[RequestStats]:
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+def record(route: str, stats: RequestStats, total_time: float) -> None:
+    with _routes_lock:
+        item = _routes.setdefault(route, {
+            'requests': 0,
+            'queries': 0,
+            'db_time': 0.0,
+            'total_time': 0.0,
+            'max_queries': 0,
+            'max_db_time': 0.0,
+            'slow_requests': 0,
+        })
+        item['requests'] += 1
+        item['queries'] += stats.queries
+        item['db_time'] += stats.db_time
+        item['total_time'] += total_time
+        item['max_queries'] = max(item['max_queries'], stats.queries)
+        item['max_db_time'] = max(item['max_db_time'], stats.db_time)
+        if is_slow(stats):
+            item['slow_requests'] += 1
+
+
+def is_slow(stats: RequestStats) -> bool:
+    return stats.queries > MAX_QUERIES or stats.db_time > MAX_TIME
+
+
+def log_slow(method: str, uri: str, stats: RequestStats) -> None:
+    lines = ['Slow request %s %s: %d queries, %.1f ms in database' %
+             (method, uri, stats.queries, stats.db_time * 1000)]
+    for statement, cnt, t in stats.top():
+        lines.append('  %dx %.1f ms: %s' % (
+            cnt, t * 1000,
+            ' '.join(statement.split())[:STATEMENT_MAX_LEN]
+        ))
+    logger.get_log().warning('\n'.join(lines))
+
+
+def route_stats() -> List[dict]:
+    """Per-route statistics ordered by total time spent in database."""
+    with _routes_lock:
+        routes = [dict(item, route=route) for route, item in _routes.items()]
+
+    for item in routes:
+        item['avg_queries'] = item['queries'] / item['requests']
+        item['avg_db_time'] = item['db_time'] / item['requests']
+        item['avg_total_time'] = item['total_time'] / item['requests']
+
+    return sorted(routes, key=lambda item: item['db_time'], reverse=True)
+
+
+def reset() -> None:
+    with _routes_lock:
+        _routes.clear()
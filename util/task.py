@@ -1,5 +1,5 @@
 import datetime
-from typing import Dict, List, Tuple, Optional, Any, TypedDict, Set
+from typing import Dict, List, Tuple, Optional, Any, TypedDict, Set, Iterable
 
 from sqlalchemy import func, distinct, or_, and_, desc
 from sqlalchemy.dialects import mysql
@@ -17,9 +17,11 @@ class TaskStatus:
     DONE = 'done'
 
 
-def fully_submitted(user_id: Optional[int], year_id: Optional[int] = None)\
+def fully_submitted(user_id: Optional[int], year_id: Optional[int] = None,
+                    task_ids: Optional[Iterable[int]] = None)\
         -> Dict[int, int]:
     """Vraci dvojici { task_id : module_cnt } pro vsechny plne odevzdane ulohy
+    (rocniku \\year_id, z uloh \\task_ids, pokud jsou zadany)
     Plne odevzdany modul <=> (evaluation.ok) || (module.bonus)
     Moduly s maximem 0 bodu jsou bonusove a jsou vzdy fully_submitted
     (i pokud nebyly odevzdany).
@@ -32,6 +34,8 @@ def fully_submitted(user_id: Optional[int], year_id: Optional[int] = None)\
     if year_id is not None:
         q = q.join(model.Wave, model.Task.wave == model.Wave.id).filter(
             model.Wave.year == year_id)
+    if task_ids is not None:
+        q = q.filter(model.Task.id.in_(set(task_ids)))
     q = q.outerjoin(model.Module).group_by(model.Task.id)
 
     # {task.id : task.max_modules_count}
@@ -369,11 +373,17 @@ def to_json(task: model.Task, prereq_obj,
             wave: Optional[model.Wave] = None,
             corr: Optional[bool] = None,
             acfull: Optional[bool] = None,
-            task_max_points: Optional[float] = None) -> TaskDict:
+            task_max_points: Optional[float] = None,
+            tstatus: Optional[str] = None) -> TaskDict:
+    """
+    :param tstatus: state of the task when already known (e.g. computed by
+                    util.task_status.TaskStatusEngine)
+    """
 
     if task_max_points is None:
         task_max_points = max_points(task.id)
-    tstatus = status(task, user, adeadline, fsubmitted, wave, corr, acfull)
+    if tstatus is None:
+        tstatus = status(task, user, adeadline, fsubmitted, wave, corr, acfull)
     pict_base = (task.picture_base if task.picture_base is not None
                  else "/taskContent/" + str(task.id) + "/icon/")
 
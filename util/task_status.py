@@ -0,0 +1,233 @@
+"""
+Batch computation of task states (locked/base/correcting/done).
+
+util.task.status() evaluates prerequisities of a single task by walking lazy
+Prerequisite.children relationships, which costs several SELECTs per task.
+TaskStatusEngine loads prerequisite trees of the year's tasks level by level,
+compiles every tree into a disjunction of bitmasks over task ids and computes
+states of all tasks of the year at once. Prerequisities on tasks of other
+years are resolved by their deadline and fully submitted state too, so the
+semantics are the same as in util.task.status().
+"""
+
+import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from db import session
+import model
+from model import PrerequisiteType
+from util.task import TaskStatus, fully_submitted, corrected,\
+    autocorrected_full
+
+
+class PrerequisiteNode(NamedTuple):
+    """Detached prerequisite node, usable by util.prerequisite.to_json()."""
+    id: int
+    type: str
+    task: Optional[int]
+    children: List['PrerequisiteNode']
+
+
+class _TaskRow(NamedTuple):
+    prerequisite: Optional[int]
+    wave_public: bool
+    after_deadline: bool
+
+
+def load_forest(sess: Optional[Session] = None,
+                roots: Optional[Iterable[int]] = None
+                ) -> Dict[int, PrerequisiteNode]:
+    """
+    Loads prerequisite nodes, all of them by a single query or only trees
+    with given 'roots' by one query per tree level.
+    :return: {prerequisite_id: PrerequisiteNode} with children filled in
+    """
+    s = sess if sess is not None else session
+    query = s.query(model.Prerequisite.id, model.Prerequisite.type,
+                    model.Prerequisite.parent, model.Prerequisite.task)
+    if roots is None:
+        rows = query.order_by(model.Prerequisite.id).all()
+    else:
+        rows = []
+        level = query.filter(model.Prerequisite.id.in_(set(roots))).all() \
+            if roots else []
+        while level:
+            rows.extend(level)
+            level = query.\
+                filter(model.Prerequisite.parent.in_(
+                    [id for (id, _, _, _) in level])).\
+                all()
+        rows.sort(key=lambda row: row[0])
+
+    nodes = {
+        id: PrerequisiteNode(id, type, task, [])
+        for (id, type, _, task) in rows
+    }
+    for (id, _, parent, _) in rows:
+        if parent is not None and parent in nodes:
+            nodes[parent].children.append(nodes[id])
+
+    return nodes
+
+
+class TaskStatusEngine(object):
+    """
+    States of all tasks in year 'year_id' for 'user'.
+
+    Each prerequisite tree is compiled to a list of clauses, clause is
+    a bitmask of tasks which all must be active (solved or after deadline),
+    tree is satisfied when any of its clauses is. Empty list of clauses is
+    never satisfied, clause 0 is always satisfied.
+    """
+
+    def __init__(self, user, year_id: int,
+                 sess: Optional[Session] = None) -> None:
+        s = sess if sess is not None else session
+        self.user = user
+        self.year_id = year_id
+
+        now = datetime.datetime.utcnow()
+        self._tasks: Dict[int, _TaskRow] = {
+            id: _TaskRow(prereq, bool(public),
+                         deadline is not None and deadline < now)
+            for (id, prereq, public, deadline) in
+            s.query(model.Task.id, model.Task.prerequisite,
+                    model.Wave.public, model.Task.time_deadline).
+            join(model.Wave, model.Task.wave == model.Wave.id).
+            filter(model.Wave.year == year_id).
+            all()
+        }
+
+        self._nodes = load_forest(
+            s, {row.prerequisite for row in self._tasks.values()
+                if row.prerequisite is not None})
+
+        # Prerekvizity mohou odkazovat na ulohy jinych rocniku
+        self._foreign = {node.task for node in self._nodes.values()
+                         if node.task is not None and
+                         node.task not in self._tasks}
+        self._foreign_active = {
+            id for (id,) in
+            s.query(model.Task.id).
+            filter(model.Task.id.in_(self._foreign),
+                   model.Task.time_deadline < now).
+            all()
+        } if self._foreign else set()
+        self._bits: Dict[int, int] = {}
+        self._clauses: Dict[int, List[int]] = {}
+        self._states: Optional[Dict[int, str]] = None
+
+        if user is not None and user.id is not None:
+            self._fsubmitted = fully_submitted(user.id, year_id)
+            if self._foreign:
+                self._foreign_active |= set(fully_submitted(
+                    user.id, task_ids=self._foreign).keys())
+            self._corrected = set(corrected(user.id))
+            self._acfull = set(autocorrected_full(user.id))
+        else:
+            self._fsubmitted = {}
+            self._foreign_active = set()
+            self._corrected = set()
+            self._acfull = set()
+
+    def _bit(self, task_id: Optional[int]) -> int:
+        if task_id not in self._bits:
+            self._bits[task_id] = 1 << len(self._bits)
+        return self._bits[task_id]
+
+    def _compile(self, node: PrerequisiteNode) -> List[int]:
+        if node.type == PrerequisiteType.ATOMIC:
+            # Atom bez ulohy je vzdy splnen (PrerequisitiesEvaluator ho
+            # parsuje na None, ktere se vyhodnoti jako True)
+            return [self._bit(node.task)] if node.task is not None else [0]
+
+        if node.type == PrerequisiteType.AND:
+            clauses = [0]
+            for child in node.children:
+                clauses = [a | b for a in clauses
+                           for b in self._compile(child)]
+            return clauses
+
+        if node.type == PrerequisiteType.OR:
+            clauses = []
+            for child in node.children:
+                clauses.extend(self._compile(child))
+            return clauses
+
+        # Neznamy typ se v PrerequisitiesEvaluator take vyhodnoti jako True
+        return [0]
+
+    def _clauses_of(self, prereq_id: int) -> List[int]:
+        if prereq_id not in self._clauses:
+            node = self._nodes.get(prereq_id)
+            self._clauses[prereq_id] = \
+                self._compile(node) if node is not None else [0]
+        return self._clauses[prereq_id]
+
+    def _mask(self, task_ids: Iterable[int]) -> int:
+        mask = 0
+        for task_id in task_ids:
+            mask |= self._bits.get(task_id, 0)
+        return mask
+
+    def _compute(self) -> Dict[int, str]:
+        user = self.user
+        privileged = user is not None and \
+            user.role in ('org', 'admin', 'tester')
+
+        if user is None or user.id is None:
+            return {
+                id: (TaskStatus.BASE
+                     if (row.prerequisite is None or row.after_deadline) and
+                     row.wave_public
+                     else TaskStatus.LOCKED)
+                for id, row in self._tasks.items()
+            }
+
+        for row in self._tasks.values():
+            if row.prerequisite is not None:
+                self._clauses_of(row.prerequisite)
+
+        adeadline = {id for id, row in self._tasks.items()
+                     if row.after_deadline}
+        active = adeadline | set(self._fsubmitted.keys())
+        active_mask = self._mask(active | self._foreign_active)
+
+        states = {}
+        for id, row in self._tasks.items():
+            if not row.wave_public and not privileged:
+                states[id] = TaskStatus.LOCKED
+            elif id in self._corrected and id in self._acfull:
+                states[id] = TaskStatus.DONE
+            elif id in self._fsubmitted:
+                states[id] = TaskStatus.CORRECTING
+            elif id in active or privileged or row.prerequisite is None:
+                states[id] = TaskStatus.BASE
+            else:
+                states[id] = (
+                    TaskStatus.BASE
+                    if any((clause & ~active_mask) == 0 for clause in
+                           self._clauses[row.prerequisite])
+                    else TaskStatus.LOCKED
+                )
+
+        return states
+
+    def statuses(self) -> Dict[int, str]:
+        """{task_id: state} for all tasks of the year."""
+        if self._states is None:
+            self._states = self._compute()
+        return self._states
+
+    def status(self, task_id: int) -> str:
+        return self.statuses()[task_id]
+
+    def prerequisite(self, task_id: int) -> Optional[PrerequisiteNode]:
+        """Prerequisite tree of the task without further SQL queries."""
+        prereq = self._tasks[task_id].prerequisite
+        return self._nodes.get(prereq) if prereq is not None else None
+
+    def fully_submitted(self) -> Dict[int, int]:
+        return self._fsubmitted
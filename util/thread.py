@@ -1,11 +1,13 @@
+from sqlalchemy import and_, or_, func
+
 from db import session
 import model
+import util
 
 
 def to_json(thread, user_id=None, unread_cnt=None, posts_cnt=None):
     if posts_cnt is None:
-        posts_cnt = session.query(model.Post).\
-            filter(model.Post.thread == thread.id).count()
+        posts_cnt = thread.posts_count
     if unread_cnt is None:
         if user_id is None:
             unread_cnt = posts_cnt
@@ -36,6 +38,62 @@ def details_to_json(thread, root_posts=None):
     }
 
 
+def posts_tree(thread, user_id, after=None, limit=None):
+    """
+    Prispevky vlakna serazene podle id, reakce se prirazuji podle indexu
+    rodic -> deti sestaveneho v jednom pruchodu.
+    Strankovani: korenove prispevky s id > after, nejvyse limit z nich
+    i s celymi podstromy reakci.
+    :return: (id korenovych prispevku, JSON prispevku, id posledniho
+              korenoveho prispevku, pokud nasleduji dalsi, jinak None)
+    """
+    paginate = after is not None or limit is not None
+    if paginate:
+        # Nejdriv jen struktura vlakna, texty se nactou pro jednu stranku
+        structure = session.query(model.Post.id, model.Post.parent).\
+            filter(model.Post.thread == thread.id).\
+            order_by(model.Post.id).\
+            all()
+    else:
+        posts = session.query(model.Post).\
+            filter(model.Post.thread == thread.id).\
+            order_by(model.Post.id).\
+            all()
+        structure = posts
+
+    children = util.grouping.group_by_key(
+        structure, key=lambda post: post.parent, value=lambda post: post.id)
+    roots = children.get(None, [])
+
+    next_after = None
+    if paginate:
+        roots = [root for root in roots if after is None or root > after]
+        if limit is not None and len(roots) > limit:
+            roots = roots[:limit]
+            next_after = roots[-1]
+
+        # Podstromy vybranych korenu
+        ids = []
+        stack = list(reversed(roots))
+        while stack:
+            post_id = stack.pop()
+            ids.append(post_id)
+            stack.extend(reversed(children.get(post_id, [])))
+        posts = session.query(model.Post).\
+            filter(model.Post.id.in_(ids)).\
+            order_by(model.Post.id).\
+            all() if ids else []
+
+    visit = get_visit(user_id, thread.id) if user_id else None
+    by_id = {post.id: post for post in posts}
+    return roots, [
+        util.post.to_json(
+            post, user_id, visit, last_visit_filled=True,
+            reactions=[by_id[child] for child in children.get(post.id, [])])
+        for post in posts
+    ], next_after
+
+
 def get_visit(user_id, thread_id):
     return session.query(model.ThreadVisit).get((thread_id, user_id))
 
@@ -57,10 +115,62 @@ def count_unread(user_id, thread_id):
     if not visit:
         return 0
 
-    return session.query(model.Post).\
-        filter(model.Post.thread == thread_id,
-               model.Post.published_at > visit.last_visit).\
-        count()
+    thread = session.query(model.Thread).get(thread_id)
+    return unread_counts([(thread, visit.last_visit)]).get(thread_id, 0)
+
+
+def unread_counts(visited):
+    """
+    Pocty prispevku novejsich nez posledni navsteva.
+    :param visited: [(model.Thread, last_visit)]
+    :return: {thread_id: pocet}; vlakna bez novych prispevku chybi
+    """
+    # Vlakna, kde posledni prispevek neni novejsi nez navsteva, se
+    # vubec nedotazuji
+    ranges = [and_(model.Post.thread == thread.id,
+                   model.Post.published_at > last_visit)
+              for thread, last_visit in visited
+              if thread.last_post_at is not None and
+              thread.last_post_at > last_visit]
+    if not ranges:
+        return {}
+
+    # Kazda podminka je rozsah indexu ix_posts_thread_published_at
+    return dict(
+        session.query(model.Post.thread, func.count(model.Post.id)).
+        filter(or_(*ranges)).
+        group_by(model.Post.thread).
+        all()
+    )
+
+
+def update_counters(thread_id):
+    """
+    Prepocita posts_count a last_post_at vlakna, volat po pridani nebo
+    smazani prispevku (v te same transakci).
+    """
+    session.query(model.Thread).\
+        filter(model.Thread.id == thread_id).\
+        update(_counters(), synchronize_session=False)
+
+
+def refresh_counters():
+    """Prepocita pocitadla vsech vlaken (po vytvoreni sloupcu)."""
+    session.query(model.Thread).\
+        update(_counters(), synchronize_session=False)
+    session.commit()
+
+
+def _counters():
+    posts = session.query(model.Post).\
+        filter(model.Post.thread == model.Thread.id)
+    return {
+        model.Thread.posts_count:
+            posts.with_entities(func.count(model.Post.id)).as_scalar(),
+        model.Thread.last_post_at:
+            posts.with_entities(func.max(model.Post.published_at)).
+            as_scalar(),
+    }
 
 
 def is_eval_thread(user_id, thread_id):
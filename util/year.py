@@ -1,10 +1,20 @@
-from typing import Optional, Tuple, TypedDict
+from typing import Optional, Tuple, TypedDict, Union
+
+from sqlalchemy import desc
 
 from db import session
 import model
 from util import config
+from util.cache import TTLCache
 import util
 
+# Rocnik je potreba pro kazdy pozadavek (middleware Year_fill), cachujeme
+# ho v kazdem workeru. Zmeny rocniku cache invaliduji jen ve svem workeru.
+YEAR_CACHE_TTL = 30
+YEAR_CURRENT = 'current'
+
+_cache = TTLCache('year', 64, YEAR_CACHE_TTL)
+
 
 class Year(TypedDict):
     id: int
@@ -34,3 +44,53 @@ def to_json(year: model.Year,
 
 def year_end(year: model.Year) -> int:
     return int(year.year.replace(" ", "").split("/")[0]) + 1
+
+
+def _snapshot(year: model.Year) -> model.Year:
+    """
+    Transient copy of the year not bound to any session, so it can be shared
+    by requests after the session that loaded it was closed.
+    """
+    return model.Year(id=year.id, year=year.year, sealed=year.sealed,
+                      point_pad=year.point_pad)
+
+
+def current() -> Optional[model.Year]:
+    """Returns the current (latest) year."""
+    year = _cache.get(YEAR_CURRENT)
+    if year is not None:
+        return year
+
+    year_db = session.query(model.Year).order_by(desc(model.Year.id)).first()
+    if year_db is None:
+        return None
+
+    year = _snapshot(year_db)
+    _cache.put(YEAR_CURRENT, year)
+    _cache.put(year.id, year)
+    return year
+
+
+def get(year_id: Union[int, str]) -> Optional[model.Year]:
+    """Returns year by id (e.g. from the YEAR header), None if not found."""
+    try:
+        year_id = int(year_id)
+    except (TypeError, ValueError):
+        return None
+
+    year = _cache.get(year_id)
+    if year is not None:
+        return year
+
+    year_db = session.query(model.Year).get(year_id)
+    if year_db is None:
+        return None
+
+    year = _snapshot(year_db)
+    _cache.put(year_id, year)
+    return year
+
+
+def invalidate_cache() -> None:
+    """Must be called whenever any year is created, changed or deleted."""
+    _cache.clear()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Compares assigning rows of the results list to users by scanning the whole
+result for every user (original Users.on_get) with util.grouping.group_by_key.
+Uses synthetic rows, no database is needed.
+
+Usage: python3 utils/bench-grouping.py [users ...]
+"""
+
+import importlib.util
+import random
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location(
+    'grouping', Path(__file__).resolve().parent.parent / 'util' / 'grouping.py')
+grouping = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(grouping)
+
+Row = namedtuple('Row', ['user_id', 'a_id'])
+ACHS_PER_USER = 3
+
+
+def rows(users):
+    result = [Row(random.randrange(users), a)
+              for a in range(users * ACHS_PER_USER)]
+    random.shuffle(result)
+    return result
+
+
+def scan(user_ids, achievements):
+    return [[item.a_id for item in achievements if item.user_id == user_id]
+            for user_id in user_ids]
+
+
+def grouped(user_ids, achievements):
+    by_user = grouping.group_by_key(achievements, lambda a: a.user_id,
+                                    lambda a: a.a_id)
+    return [by_user.get(user_id, []) for user_id in user_ids]
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [250, 500, 1000, 2000, 4000]
+    print('%8s %12s %12s %10s' % ('users', 'scan [s]', 'grouped [s]',
+                                  'speedup'))
+    for users in sizes:
+        user_ids = list(range(users))
+        achievements = rows(users)
+        t_scan, r_scan = measure(scan, user_ids, achievements)
+        t_group, r_group = measure(grouped, user_ids, achievements)
+        assert r_scan == r_group
+        print('%8d %12.4f %12.4f %9.0fx' % (users, t_scan, t_group,
+                                            t_scan / t_group))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Compares conversion of e-mail HTML to the plaintext alternative by spawning
+pandoc for every message (original util.mail.send) with util.html2text,
+without and with the content-hash cache used by util.mail.html_to_plaintext.
+Messages are synthetic post notifications, some of them repeated (one post
+notifies several recipients). Needs pandoc and pypandoc installed.
+
+Usage: python3 utils/bench-html2text.py [messages]
+"""
+
+import hashlib
+import importlib.util
+import random
+import sys
+import time
+from pathlib import Path
+
+import pypandoc
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(
+        name, Path(__file__).resolve().parent.parent / 'util' / (name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+html2text = _load('html2text')
+cache = _load('cache')
+
+# Pocet prijemcu notifikace o jednom prispevku
+RECIPIENTS_PER_POST = 4
+BODIES = [
+    '<p>Myslím, že v zadání je chyba, výstup pro <code>n = 0</code> má být '
+    '<b>prázdný</b>.</p>',
+    '<p>Ahoj,</p><ul><li>první bod</li><li>druhý bod s '
+    '<a href="https://ksi.fi.muni.cz/ulohy/12">odkazem</a></li></ul>',
+    '<p>Řešení:</p><pre>for i in range(10):\n    print(i)</pre><p>Díky!</p>',
+]
+
+
+def message(post_id):
+    return (
+        '<p>Ahoj,<br/>k úloze <a href="https://ksi.fi.muni.cz/ulohy/%d">Úloha '
+        '%d</a> byl přidán nový příspěvek:</p><p><i>Jan Novák:</i></p>%s'
+        '<p><a href="https://ksi.fi.muni.cz/forum/%d">Přejít do diskuze.</a>'
+        '</p><p>Organizátoři KSI</p>' % (post_id % 40, post_id % 40,
+                                         random.choice(BODIES), post_id)
+    )
+
+
+def pandoc(html):
+    return pypandoc.convert_text(html, 'markdown', format='html')
+
+
+def cached(html, _cache=cache.TTLCache('bench', 256, 3600)):
+    key = hashlib.sha1(html.encode('utf-8')).hexdigest()
+    result = _cache.get(key)
+    if result is None:
+        result = html2text.convert(html)
+        _cache.put(key, result)
+    return result
+
+
+def measure(fn, messages):
+    start = time.perf_counter()
+    for html in messages:
+        fn(html)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages = [message(i // RECIPIENTS_PER_POST) for i in range(count)]
+
+    print('%d messages (%d recipients per post)' % (count,
+                                                    RECIPIENTS_PER_POST))
+    print('  %-26s %14s' % ('converter', 'messages/s'))
+    for name, fn in (('pandoc per message', pandoc),
+                     ('html2text', html2text.convert),
+                     ('html2text + cache', cached)):
+        print('  %-26s %14.1f' % (name, measure(fn, messages)))
+
+
+if __name__ == '__main__':
+    main()
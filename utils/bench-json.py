@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+Compares serialization of a results list (/users) payload: the original
+indented and sorted json.dumps, compact output of util.serializer backends
+and compression by util.compression. Uses a synthetic scoreboard, no
+database is needed. Must be run from the backend root (needs config.py).
+
+Usage: python3 utils/bench-json.py [users ...]
+"""
+
+import importlib.util
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# util/serializer.py imports config.py from the backend root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(
+        name, Path(__file__).resolve().parent.parent / 'util' / (name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+serializer = _load('serializer')
+compression = _load('compression')
+
+ROUNDS = 20
+FIRST_NAMES = ['Jan', 'Petra', 'Tomáš', 'Kateřina', 'Ondřej', 'Lucie']
+LAST_NAMES = ['Novák', 'Svobodová', 'Dvořák', 'Černá', 'Procházka']
+SCHOOLS = ['Gymnázium Brno, třída Kapitána Jaroše', 'SPŠ Jihlava',
+           'Gymnázium Olomouc-Hejčín', 'Gymnázium Christiana Dopplera']
+
+
+def payload(users):
+    return {
+        'users': [{
+            'id': i,
+            'first_name': random.choice(FIRST_NAMES),
+            'last_name': random.choice(LAST_NAMES),
+            'nick_name': 'user%d' % i,
+            'profile_picture': '/images/profile/%d' % i,
+            'gender': random.choice(['male', 'female']),
+            'role': 'participant',
+            'score': round(random.uniform(0, 150), 1),
+            'tasks_num': random.randrange(30),
+            'achievements': random.sample(range(60), random.randrange(6)),
+            'enabled': True,
+            'addr_country': 'cz',
+            'school_name': random.choice(SCHOOLS),
+            'seasons': [1, 2, 3][:random.randrange(1, 4)],
+            'successful': random.random() < 0.1,
+            'cheat': False,
+        } for i in range(users)]
+    }
+
+
+def original(data):
+    return json.dumps(data, sort_keys=True, indent=4,
+                      ensure_ascii=False).encode('utf-8')
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [500, 2000]
+    variants = [('indent=4 (original)', original)] + \
+        [('compact ' + name, fn)
+         for name, fn in serializer.BACKENDS.items()]
+
+    for users in sizes:
+        data = payload(users)
+        print('%d users' % users)
+        print('  %-22s %10s %10s %10s %10s' % ('serializer', 'time [ms]',
+                                               'size [kB]', 'gzip [ms]',
+                                               'gzip [kB]'))
+        for name, fn in variants:
+            t, body = measure(fn, data)
+            t_gz, gz = measure(compression.compress, body, 'gzip')
+            print('  %-22s %10.2f %10.1f %10.2f %10.1f' % (
+                name, t, len(body) / 1024, t_gz, len(gz) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+Minimal SMTP server for local testing of mail_sender.py. Accepts every
+message and stores it as <n>.eml (with X-Envelope-* headers) into the output
+directory, nothing is delivered. Use --fail to answer every n-th message with
+a temporary error to exercise retries.
+
+Usage: python3 utils/debug-smtp.py [--port 8025] [--out /tmp/ksi-mail]
+"""
+
+import argparse
+import itertools
+import os
+import socketserver
+import threading
+
+_counter = itertools.count(1)
+_lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            if line.startswith(b'..'):
+                line = line[1:]
+            lines.append(line)
+
+    def handle(self):
+        self._reply('220 localhost debug SMTP')
+        mail_from, rcpt_to = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('HELO', 'EHLO'):
+                self._reply('250 localhost')
+            elif verb == 'MAIL':
+                mail_from, rcpt_to = command[10:], []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                rcpt_to.append(command[8:])
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                data = self._read_data()
+                with _lock:
+                    n = next(_counter)
+                if self.server.fail and n % self.server.fail == 0:
+                    self._reply('451 Debug temporary failure')
+                    continue
+                path = os.path.join(self.server.out, '%06d.eml' % n)
+                with open(path, 'wb') as f:
+                    f.write(('X-Envelope-From: %s\r\nX-Envelope-To: %s\r\n' %
+                             (mail_from, ', '.join(rcpt_to))).encode('utf-8'))
+                    f.write(data)
+                print('%s: %s -> %s' % (path, mail_from, ', '.join(rcpt_to)),
+                      flush=True)
+                self._reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                mail_from, rcpt_to = None, []
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--out', default='/tmp/ksi-mail',
+                        help='directory for received messages')
+    parser.add_argument('--fail', type=int, default=0,
+                        help='temporarily reject every n-th message')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    server = SMTPServer((args.host, args.port), SMTPHandler)
+    server.out = args.out
+    server.fail = args.fail
+    print('Listening on %s:%d, saving into %s' % (args.host, args.port,
+                                                  args.out), flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()